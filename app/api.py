@@ -3,31 +3,73 @@ FastAPI路由和接口
 """
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Body, Cookie, Depends
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
-from jinja2 import Template
 import os
 from typing import Optional, Dict, List, Any
 import json
 import asyncio
+import time
 from datetime import datetime
 from pydantic import BaseModel
 import pandas as pd
-import io
 from app.database import Database
 from app.config import Config
 from app.statistics import Statistics
 from app.data_updater import DataUpdater
 from app.data_fetcher import DataFetcher
+from app.fetch_cache import get_fetch_cache
+from app.executor import DEFAULT_EXECUTOR_OPTIONS, HeavyTaskExecutor, LatencyRecorder
+from app.exporter import DEFAULT_EXPORT_OPTIONS, Exporter
+from app.result_cache import create_result_cache
 from app.auth import AuthManager
+from app.assets import IndexPage, StaticAssets
 
 app = FastAPI(title="StockInsight - 股票洞察分析系统")
 
 # 初始化
-db = Database()
 config = Config()
-statistics = Statistics(db)
+db = Database(options=config.get('database', {}))
+statistics = Statistics(db, options=config.get('statistics', {}),
+                        result_cache=create_result_cache(config.get('result_cache', {})))
 updater = DataUpdater(db, config)
-auth = AuthManager(db)
+auth = AuthManager(db, session_cache_seconds=config.get('auth.session_cache_seconds', 60))
+
+# 统计查询、导出等耗时请求在有界执行器中运行（不阻塞事件循环），所有接口记录响应时间
+executor_options = dict(DEFAULT_EXECUTOR_OPTIONS, **(config.get('executor', {}) or {}))
+heavy_tasks = HeavyTaskExecutor(executor_options['max_concurrency'], executor_options['max_queue'])
+request_latency = LatencyRecorder()
+
+# 导出文件边生成边发送（同时进行的导出数有上限）
+export_options = dict(DEFAULT_EXPORT_OPTIONS, **(config.get('export', {}) or {}))
+exporter = Exporter(export_options['chunk_size'], export_options['max_streams'])
+
+
+def mark_interrupted_update_jobs():
+    """
+    心跳已超时的 running 更新任务是被中断的进程留下的，标记为可继续
+    （其他服务进程中仍在运行的任务会持续记录心跳，不受影响）
+    """
+    interrupted_jobs = db.interrupt_running_update_jobs()
+    if interrupted_jobs:
+        print(f"发现 {interrupted_jobs} 个被中断的数据更新任务，可在数据管理页面继续")
+
+
+@app.on_event("startup")
+def mark_interrupted_update_jobs_on_startup():
+    mark_interrupted_update_jobs()
+
+
+@app.on_event("startup")
+def export_initial_kline_snapshot():
+    """启用快照但尚未导出过（首次启用或快照目录被清空）时导出第一个版本，否则要等到下次数据更新"""
+    kline_store = statistics.kline_store
+    if kline_store is None or kline_store.snapshot is None or kline_store.snapshot.current() is not None:
+        return
+    try:
+        started = time.time()
+        generation = kline_store.export_snapshot()
+        print(f"已导出初始月K线快照: {generation}，耗时 {time.time() - started:.1f}s")
+    except Exception as e:
+        print(f"导出初始月K线快照失败: {e}")
 
 # 定期清理过期会话
 import threading
@@ -36,28 +78,94 @@ def cleanup_sessions_periodically():
         import time
         time.sleep(3600)  # 每小时清理一次
         db.cleanup_expired_sessions()
+        try:
+            mark_interrupted_update_jobs()
+        except Exception as e:
+            print(f"标记中断的更新任务失败: {e}")
+        try:
+            db.checkpoint('PASSIVE')  # 不阻塞读写，WAL中剩余内容由下次检查点处理
+        except Exception as e:
+            print(f"WAL检查点失败: {e}")
 
 cleanup_thread = threading.Thread(target=cleanup_sessions_periodically, daemon=True)
 cleanup_thread.start()
 
+
+@app.on_event("shutdown")
+def shutdown_statistics_pool():
+    """服务停止时关闭统计进程池"""
+    statistics.close()
+
 # 进度状态（用于实时返回更新进度）
+# telemetry: 抓取阶段的结构化进度（已完成/失败数、吞吐量、预计剩余时间），version: 每次变化加一，用于推送
 update_progress = {
     'current': 0,
     'total': 100,
     'message': '',
-    'is_running': False
+    'is_running': False,
+    'telemetry': None,
+    'version': 0
 }
 
-# 静态文件
-if os.path.exists("static"):
-    app.mount("/static", StaticFiles(directory="static"), name="static")
+# 进度推送（SSE）检查进度变化的间隔和心跳间隔（秒）
+PROGRESS_STREAM_INTERVAL = 0.5
+PROGRESS_STREAM_KEEPALIVE = 15
+
+# 首页模板和静态文件（启动时读取，web.auto_reload 为 true 时文件修改后自动重新读取，开发时使用）
+web_auto_reload = bool(config.get('web.auto_reload', False))
+static_assets = StaticAssets("static", auto_reload=web_auto_reload)
+index_page = IndexPage("templates", "index.html", static_assets, auto_reload=web_auto_reload)
+
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def static_file(path: str, request: Request):
+    """静态文件（预压缩，带 ETag 和缓存头）"""
+    return static_assets.response(request, path)
 
 
-def progress_callback(current: int, total: int, message: str = ""):
+def progress_callback(current: int, total: int, message: str = "", telemetry: Optional[Dict] = None):
     """进度回调函数"""
     update_progress['current'] = current
     update_progress['total'] = total
     update_progress['message'] = message
+    if telemetry is not None:
+        update_progress['telemetry'] = telemetry
+    update_progress['version'] += 1
+
+
+def refresh_kline_snapshot():
+    """数据更新后重新导出月K线快照（未启用快照时不做任何事），其他服务进程下次查询时切换到新版本"""
+    if statistics.kline_store is None or statistics.kline_store.snapshot is None:
+        return
+    progress_callback(update_progress['current'], update_progress['total'], "正在生成统计数据快照...")
+    try:
+        started = time.time()
+        generation = statistics.kline_store.export_snapshot()
+        print(f"月K线快照已更新: {generation}，耗时 {time.time() - started:.1f}s")
+    except Exception as e:
+        print(f"生成月K线快照失败: {e}")
+
+
+def progress_snapshot() -> Dict:
+    """当前进度（接口返回和推送的内容）"""
+    return {
+        "current": update_progress['current'],
+        "total": update_progress['total'],
+        "message": update_progress['message'],
+        "is_running": update_progress['is_running'],
+        "telemetry": update_progress['telemetry']
+    }
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """记录各接口的响应时间（按路由路径统计，查看统计查询进行时轻量接口是否仍及时响应）"""
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get('route')
+    if route is not None and request.url.path.startswith('/api/'):
+        request_latency.record(f"{request.method} {route.path}", time.perf_counter() - started)
+    return response
 
 
 # ========== 认证相关API ==========
@@ -284,13 +392,7 @@ async def update_system_config(data: Dict = Body(...), session_id: Optional[str]
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """首页"""
-    template_path = os.path.join("templates", "index.html")
-    if os.path.exists(template_path):
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template = Template(f.read())
-        return HTMLResponse(content=template.render())
-    else:
-        return HTMLResponse(content="<h1>模板文件未找到</h1>", status_code=404)
+    return index_page.response(request)
 
 
 @app.get("/api/stocks")
@@ -334,7 +436,8 @@ async def get_stock_info(code: str):
 
 
 @app.post("/api/stock/statistics")
-async def get_stock_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
+@heavy_tasks.route('stock_statistics')
+def get_stock_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
     """单只股票月份统计"""
     auth.require_permission(session_id, 'stock_analysis_single')
     try:
@@ -385,7 +488,8 @@ async def get_stock_statistics(data: Dict = Body(...), session_id: Optional[str]
 
 
 @app.post("/api/stock/multi-month-statistics")
-async def get_stock_multi_month_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
+@heavy_tasks.route('multi_month_statistics')
+def get_stock_multi_month_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
     """单只股票多月份统计"""
     auth.require_permission(session_id, 'stock_analysis_multi')
     try:
@@ -449,7 +553,8 @@ async def get_stock_multi_month_statistics(data: Dict = Body(...), session_id: O
 
 
 @app.post("/api/month/filter")
-async def get_month_filter_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
+@heavy_tasks.route('month_filter')
+def get_month_filter_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
     """月份筛选统计（前20支）"""
     auth.require_permission(session_id, 'month_filter')
     try:
@@ -482,7 +587,8 @@ async def get_month_filter_statistics(data: Dict = Body(...), session_id: Option
 
 
 @app.post("/api/industry/statistics")
-async def get_industry_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
+@heavy_tasks.route('industry_statistics')
+def get_industry_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
     """行业统计"""
     auth.require_permission(session_id, 'industry_statistics')
     try:
@@ -509,7 +615,8 @@ async def get_industry_statistics(data: Dict = Body(...), session_id: Optional[s
 
 
 @app.post("/api/industry/top-stocks")
-async def get_industry_top_stocks(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
+@heavy_tasks.route('industry_top_stocks')
+def get_industry_top_stocks(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
     """行业中上涨概率最高的前20支股票"""
     auth.require_permission(session_id, 'industry_top_stocks')
     try:
@@ -566,10 +673,17 @@ async def update_data(background_tasks: BackgroundTasks, data: Dict = Body(defau
                 "already_running": True
             }
         
+        # 其他服务进程（多 worker 部署）中正在运行的更新任务
+        latest_job = db.get_resumable_update_job()
+        if latest_job and latest_job['active']:
+            raise HTTPException(status_code=409, detail="数据更新正在其他服务进程中进行，请稍后再试")
+        
         update_progress['is_running'] = True
         update_progress['current'] = 0
         update_progress['total'] = 100
         update_progress['message'] = '准备更新...'
+        update_progress['telemetry'] = None
+        update_progress['version'] += 1
         
         def update_task():
             try:
@@ -581,16 +695,24 @@ async def update_data(background_tasks: BackgroundTasks, data: Dict = Body(defau
                     # 获取更新模式：overwrite（覆盖模式）或 supplement（补充模式，默认）
                     overwrite_mode = data.get('overwrite_mode', False)
                     current_updater.update_all_data(overwrite_mode=overwrite_mode)
+                elif update_type == "resume":
+                    # 继续上次未完成的更新任务
+                    current_updater.resume_update(data.get('job_id'))
                 else:
                     current_updater.update_incremental()
             finally:
+                refresh_kline_snapshot()
                 update_progress['is_running'] = False
+                update_progress['version'] += 1
         
         background_tasks.add_task(update_task)
         
         return {"success": True, "message": "数据更新已开始"}
+    except HTTPException:
+        raise
     except Exception as e:
         update_progress['is_running'] = False
+        update_progress['version'] += 1
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -598,17 +720,86 @@ async def update_data(background_tasks: BackgroundTasks, data: Dict = Body(defau
 async def get_update_progress(session_id: Optional[str] = Cookie(None)):
     """获取更新进度（需要数据管理权限）"""
     auth.require_permission(session_id, 'data_management')
+    return {
+        "success": True,
+        "data": progress_snapshot()
+    }
+
+
+@app.get("/api/data/progress/stream")
+async def stream_update_progress(session_id: Optional[str] = Cookie(None)):
+    """
+    以 Server-Sent Events 推送更新进度（需要数据管理权限，只在建立连接时验证一次）
+    
+    进度变化时发送 progress 事件（内容同 /api/data/progress 的 data），更新结束后发送 done 事件并关闭连接
+    """
+    auth.require_permission(session_id, 'data_management')
+    
+    async def event_stream():
+        last_version = None
+        last_sent = time.monotonic()
+        while True:
+            version = update_progress['version']
+            if version != last_version:
+                last_version = version
+                snapshot = progress_snapshot()
+                yield f"event: progress\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+                last_sent = time.monotonic()
+                if not snapshot['is_running']:
+                    yield "event: done\ndata: {}\n\n"
+                    return
+            elif time.monotonic() - last_sent >= PROGRESS_STREAM_KEEPALIVE:
+                # 心跳（SSE注释行），防止代理因长时间无数据断开连接
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(PROGRESS_STREAM_INTERVAL)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/api/data/cache/clear")
+async def clear_fetch_cache(session_id: Optional[str] = Cookie(None)):
+    """清空数据源本地缓存（需要数据管理权限）"""
+    auth.require_permission(session_id, 'data_management')
+    try:
+        fetch_cache = get_fetch_cache(config)
+        if fetch_cache is not None:
+            fetch_cache.clear()
+        return {"success": True, "message": "缓存已清空"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/system/metrics")
+async def get_system_metrics(session_id: Optional[str] = Cookie(None)):
+    """接口响应时间和耗时请求执行器状态（仅管理员）"""
+    auth.require_admin(session_id)
     return {
         "success": True,
         "data": {
-            "current": update_progress['current'],
-            "total": update_progress['total'],
-            "message": update_progress['message'],
-            "is_running": update_progress['is_running']
+            "executor": heavy_tasks.status(),
+            "latency": request_latency.summary(),
+            "export": exporter.status(),
+            "result_cache": statistics.result_cache.status() if statistics.result_cache is not None else None,
+            "session_cache": auth.session_cache.status() if auth.session_cache is not None else None
         }
     }
 
 
+@app.post("/api/data/snapshot/rebuild")
+def rebuild_kline_snapshot(session_id: Optional[str] = Cookie(None)):
+    """重新导出月K线快照（需要数据管理权限，数据库被其他程序修改后使用）"""
+    auth.require_permission(session_id, 'data_management')
+    if statistics.kline_store is None or statistics.kline_store.snapshot is None:
+        return {"success": False, "message": "未启用月K线快照（statistics.kline_snapshot）"}
+    try:
+        generation = statistics.kline_store.export_snapshot()
+        return {"success": True, "message": "快照已更新", "generation": generation}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/api/config")
 async def get_config(session_id: Optional[str] = Cookie(None)):
     """获取配置（仅管理员）"""
@@ -647,7 +838,8 @@ async def get_available_data_sources(ts_code: Optional[str] = None):
 
 
 @app.post("/api/data/compare-sources")
-async def compare_data_sources(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
+@heavy_tasks.route('compare_sources')
+def compare_data_sources(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
     """对比不同数据源的数据"""
     auth.require_permission(session_id, 'source_compare')
     try:
@@ -694,12 +886,24 @@ async def get_data_status(session_id: Optional[str] = Cookie(None)):
         # 获取总体最新日期（所有数据源中的最新日期）
         latest_date = db.get_latest_trade_date()
         
+        # 当前数据源未完成的更新任务（更新进行中时不提示继续）
+        resumable_job = None
+        if not update_progress['is_running']:
+            resumable_job = db.get_resumable_update_job(config.get('data_source', 'akshare'))
+            if resumable_job and resumable_job['active']:
+                resumable_job = None  # 正在其他服务进程中运行
+        
+        fetch_cache = get_fetch_cache(config)
+        
         return {
             "success": True,
             "data": {
                 "total_stocks": total_stocks,
                 "latest_date": latest_date,
-                "data_sources": data_source_stats
+                "data_sources": data_source_stats,
+                "resumable_job": resumable_job,
+                "fetch_cache": fetch_cache.status() if fetch_cache is not None else None,
+                "kline_store": statistics.kline_store.status() if statistics.kline_store is not None else None
             }
         }
     except Exception as e:
@@ -707,37 +911,15 @@ async def get_data_status(session_id: Optional[str] = Cookie(None)):
 
 
 # Excel导出工具函数
-def export_to_excel(data: List[Dict], filename: str, sheet_name: str = "Sheet1") -> StreamingResponse:
-    """将数据导出为Excel文件"""
-    try:
-        # 创建DataFrame
-        df = pd.DataFrame(data)
-        
-        # 创建Excel文件在内存中
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-        
-        output.seek(0)
-        
-        # 返回文件流
-        # 处理中文文件名编码
-        from urllib.parse import quote
-        encoded_filename = quote(filename.encode('utf-8'))
-        
-        return StreamingResponse(
-            io.BytesIO(output.read()),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
-            }
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"导出Excel失败: {str(e)}")
+def export_to_excel(data: List[Dict], filename: str, sheet_name: str = "Sheet1",
+                    export_format: str = "xlsx") -> StreamingResponse:
+    """将数据导出为Excel文件（export_format 为 csv 时导出CSV），边生成边发送"""
+    return exporter.records_response(data, filename, sheet_name, export_format)
 
 
 @app.post("/api/export/stock-statistics")
-async def export_stock_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
+@heavy_tasks.route('export_stock_statistics')
+def export_stock_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
     """导出单只股票统计为Excel"""
     auth.require_permission(session_id, 'export_excel')
     try:
@@ -789,13 +971,14 @@ async def export_stock_statistics(data: Dict = Body(...), session_id: Optional[s
         }]
         
         filename = f"{stock.get('symbol', code)}_{stock.get('name', '')}_{month}月统计.xlsx"
-        return export_to_excel(export_data, filename, f"{month}月统计")
+        return export_to_excel(export_data, filename, f"{month}月统计", data.get('format', 'xlsx'))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
 
 @app.post("/api/export/multi-month-statistics")
-async def export_multi_month_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
+@heavy_tasks.route('export_multi_month_statistics')
+def export_multi_month_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
     """导出单只股票多月份统计为Excel"""
     auth.require_permission(session_id, 'export_excel')
     try:
@@ -849,13 +1032,14 @@ async def export_multi_month_statistics(data: Dict = Body(...), session_id: Opti
                 })
         
         filename = f"{stock.get('symbol', code)}_{stock.get('name', '')}_按月统计.xlsx"
-        return export_to_excel(export_data, filename, "按月统计")
+        return export_to_excel(export_data, filename, "按月统计", data.get('format', 'xlsx'))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
 
 @app.post("/api/export/month-filter")
-async def export_month_filter(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
+@heavy_tasks.route('export_month_filter')
+def export_month_filter(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
     """导出月份筛选统计为Excel"""
     auth.require_permission(session_id, 'export_excel')
     try:
@@ -893,13 +1077,14 @@ async def export_month_filter(data: Dict = Body(...), session_id: Optional[str]
         
         min_count_text = f"_最小涨跌次数{min_count}" if min_count > 0 else ""
         filename = f"{month}月上涨概率前{top_n}支股票{min_count_text}.xlsx"
-        return export_to_excel(export_data, filename, f"{month}月统计")
+        return export_to_excel(export_data, filename, f"{month}月统计", data.get('format', 'xlsx'))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
 
 @app.post("/api/export/industry-statistics")
-async def export_industry_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
+@heavy_tasks.route('export_industry_statistics')
+def export_industry_statistics(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
     """导出行业统计为Excel"""
     auth.require_permission(session_id, 'export_excel')
     try:
@@ -932,13 +1117,14 @@ async def export_industry_statistics(data: Dict = Body(...), session_id: Optiona
         
         industry_type_name = '申万' if industry_type == 'sw' else '中信'
         filename = f"{industry_type_name}行业_{month}月统计.xlsx"
-        return export_to_excel(export_data, filename, f"{industry_type_name}行业统计")
+        return export_to_excel(export_data, filename, f"{industry_type_name}行业统计", data.get('format', 'xlsx'))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
 
 @app.post("/api/export/industry-top-stocks")
-async def export_industry_top_stocks(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
+@heavy_tasks.route('export_industry_top_stocks')
+def export_industry_top_stocks(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
     """导出行业前20支股票为Excel"""
     auth.require_permission(session_id, 'export_excel')
     try:
@@ -975,13 +1161,14 @@ async def export_industry_top_stocks(data: Dict = Body(...), session_id: Optiona
             })
         
         filename = f"{industry_name}_{month}月前{top_n}支股票.xlsx"
-        return export_to_excel(export_data, filename, f"{industry_name}前{top_n}支")
+        return export_to_excel(export_data, filename, f"{industry_name}前{top_n}支", data.get('format', 'xlsx'))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
 
 @app.post("/api/export/compare-sources")
-async def export_compare_sources(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
+@heavy_tasks.route('export_compare_sources')
+def export_compare_sources(data: Dict = Body(...), session_id: Optional[str] = Cookie(None)):
     """导出数据源对比为Excel"""
     auth.require_permission(session_id, 'export_excel')
     try:
@@ -1027,7 +1214,25 @@ async def export_compare_sources(data: Dict = Body(...), session_id: Optional[st
         export_data = export_df.to_dict('records')
         
         filename = f"{ts_code}_数据源对比.xlsx"
-        return export_to_excel(export_data, filename, "数据源对比")
+        return export_to_excel(export_data, filename, "数据源对比", data.get('format', 'xlsx'))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
+
+
+# 全市场月K线导出的表头（与 Database.iter_monthly_kline_rows 的列顺序一致）
+MONTHLY_KLINE_EXPORT_COLUMNS = ['TS代码', '股票代码', '股票名称', '交易日期', '年份', '月份', '开盘价', '收盘价',
+                                '最高价', '最低价', '成交量', '成交额', '涨跌幅(%)', '数据源']
+
+
+@app.get("/api/export/monthly-kline")
+def export_monthly_kline(data_source: Optional[str] = None, start_year: Optional[int] = None,
+                         end_year: Optional[int] = None, format: str = 'csv',
+                         session_id: Optional[str] = Cookie(None)):
+    """导出全市场月K线（所有股票 × 所有月份），按批读取数据库边读边发送，默认CSV"""
+    auth.require_permission(session_id, 'export_excel')
+    current_data_source = data_source if data_source else config.get('data_source', 'akshare')
+    rows = db.iter_monthly_kline_rows(current_data_source, start_year, end_year)
+    year_text = f"_{start_year or ''}-{end_year or ''}" if start_year or end_year else ""
+    filename = f"全市场月K线_{current_data_source}{year_text}.{format}"
+    return exporter.response(MONTHLY_KLINE_EXPORT_COLUMNS, rows, filename, "月K线", format)
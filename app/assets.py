@@ -0,0 +1,188 @@
+"""
+首页模板和静态资源（启动时读取并预压缩，带内容哈希的地址、ETag 和缓存头）
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+
+# 带内容哈希的地址长期缓存；不带哈希的地址（和首页）每次向服务器确认，内容未变时返回 304
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# 小于该大小的文件不压缩
+MIN_COMPRESS_SIZE = 1024
+
+_FINGERPRINT_PATTERN = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{10})(?P<ext>\.[^./]+)$')
+
+
+def _accepted_encodings(request: Request) -> set:
+    """解析 Accept-Encoding（忽略 q=0 的编码）"""
+    encodings = set()
+    for part in request.headers.get('accept-encoding', '').split(','):
+        name, _, params = part.strip().partition(';')
+        if name and params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class Asset:
+    """一个文件的原始内容和预压缩的变体（编码 -> (内容, ETag)）"""
+
+    def __init__(self, content: bytes, media_type: str, mtime: float = 0.0):
+        self.media_type = media_type
+        self.mtime = mtime
+        self.digest = hashlib.sha256(content).hexdigest()
+        self.variants: Dict[Optional[str], tuple] = {None: (content, f'"{self.digest[:16]}"')}
+        if len(content) >= MIN_COMPRESS_SIZE:
+            if BROTLI_AVAILABLE:
+                compressed = brotli.compress(content, quality=11)
+                if len(compressed) < len(content):
+                    self.variants['br'] = (compressed, f'"{self.digest[:16]}-br"')
+            compressed = gzip.compress(content, compresslevel=9, mtime=0)
+            if len(compressed) < len(content):
+                self.variants['gzip'] = (compressed, f'"{self.digest[:16]}-gz"')
+
+    def response(self, request: Request, cache_control: str, response_class=Response) -> Response:
+        """按 Accept-Encoding 选择变体；If-None-Match 与 ETag 相同时返回 304"""
+        accepted = _accepted_encodings(request)
+        encoding = next((name for name in ('br', 'gzip') if name in self.variants and name in accepted), None)
+        content, etag = self.variants[encoding]
+        headers = {'ETag': etag, 'Cache-Control': cache_control}
+        if len(self.variants) > 1:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match and (if_none_match.strip() == '*' or
+                              etag in (tag.strip() for tag in if_none_match.split(','))):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return response_class(content=content, media_type=self.media_type, headers=headers)
+
+
+class StaticAssets:
+    """
+    静态资源目录（/static）
+
+    - 启动时读取目录下所有文件，计算内容哈希并预先压缩（gzip，安装了 brotli 时同时生成 br）
+    - url(name) 返回带内容哈希的地址（如 /static/app.1a2b3c4d5e.js），该地址的内容不会改变，可以长期缓存
+    - auto_reload 为 True 时每次请求检查文件修改时间，文件变化后重新读取（开发时使用）
+    """
+
+    def __init__(self, directory: str, url_prefix: str = '/static', auto_reload: bool = False):
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self.auto_reload = auto_reload
+        self.version = 0
+        self._lock = threading.Lock()
+        self._assets: Dict[str, Asset] = {}
+        self._scan()
+
+    def _files(self) -> Dict[str, str]:
+        files = {}
+        if os.path.isdir(self.directory):
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    path = os.path.join(root, name)
+                    files[os.path.relpath(path, self.directory).replace(os.sep, '/')] = path
+        return files
+
+    def _scan(self):
+        """读取有变化的文件（首次读取全部文件）"""
+        files = self._files()
+        assets = {}
+        for name, path in files.items():
+            mtime = os.path.getmtime(path)
+            asset = self._assets.get(name)
+            if asset is None or asset.mtime != mtime:
+                with open(path, 'rb') as f:
+                    content = f.read()
+                asset = Asset(content, mimetypes.guess_type(name)[0] or 'application/octet-stream', mtime)
+            assets[name] = asset
+        if assets.keys() != self._assets.keys() or any(assets[name] is not self._assets[name] for name in assets):
+            self._assets = assets
+            self.version += 1
+
+    def refresh(self):
+        """auto_reload 模式下重新检查文件"""
+        if self.auto_reload:
+            with self._lock:
+                self._scan()
+
+    def url(self, name: str) -> str:
+        """带内容哈希的地址（文件不存在时返回原地址）"""
+        asset = self._assets.get(name)
+        if asset is None:
+            return f"{self.url_prefix}/{name}"
+        stem, ext = os.path.splitext(name)
+        return f"{self.url_prefix}/{stem}.{asset.digest[:10]}{ext}"
+
+    def response(self, request: Request, path: str) -> Response:
+        """返回 path（带或不带内容哈希）对应的文件"""
+        self.refresh()
+        asset = self._assets.get(path)
+        cache_control = REVALIDATE_CACHE_CONTROL
+        if asset is None:
+            match = _FINGERPRINT_PATTERN.match(path)
+            if match:
+                asset = self._assets.get(match.group('stem') + match.group('ext'))
+                # 哈希与当前内容一致时可以长期缓存；旧页面引用的旧哈希仍返回当前内容，但不长期缓存
+                if asset is not None and asset.digest.startswith(match.group('digest')):
+                    cache_control = IMMUTABLE_CACHE_CONTROL
+        if asset is None:
+            return Response(status_code=404)
+        return asset.response(request, cache_control)
+
+
+class IndexPage:
+    """
+    首页：模板只编译一次，渲染结果（及其压缩变体）缓存到模板或静态资源变化为止
+
+    模板中可以用 static_url('app.js') 引用带内容哈希的静态资源地址
+    """
+
+    def __init__(self, template_directory: str, template_name: str, assets: StaticAssets,
+                 auto_reload: bool = False):
+        self.template_name = template_name
+        self.assets = assets
+        self.env = Environment(loader=FileSystemLoader(template_directory), auto_reload=auto_reload)
+        self.env.globals['static_url'] = assets.url
+        self._lock = threading.Lock()
+        self._page: Optional[Asset] = None
+        self._template = None
+        self._assets_version = None
+
+    def _render(self) -> Optional[Asset]:
+        try:
+            template = self.env.get_template(self.template_name)
+        except TemplateNotFound:
+            return None
+        # 模板未重新编译且静态资源版本不变时直接使用缓存的渲染结果
+        with self._lock:
+            if self._page is None or template is not self._template or self._assets_version != self.assets.version:
+                self._page = Asset(template.render().encode('utf-8'), 'text/html')
+                self._template = template
+                self._assets_version = self.assets.version
+            return self._page
+
+    def response(self, request: Request) -> Response:
+        self.assets.refresh()
+        page = self._render()
+        if page is None:
+            return HTMLResponse(content="<h1>模板文件未找到</h1>", status_code=404)
+        return page.response(request, REVALIDATE_CACHE_CONTROL, response_class=HTMLResponse)
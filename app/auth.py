@@ -1,6 +1,8 @@
 """
 认证和权限管理
 """
+import threading
+import time
 import uuid
 import bcrypt
 from datetime import datetime, timedelta
@@ -10,9 +12,102 @@ from app.database import Database
 from app.permissions import ALL_PERMISSIONS
 
 
+class SessionCache:
+    """
+    会话缓存：session_id -> 当前用户信息（含权限）、会话过期时间、账号有效期
+    
+    - 缓存 ttl_seconds 秒，期间同一会话的认证不访问数据库
+    - Database 修改用户、权限或删除会话时按用户或会话失效（见 Database.session_cache）
+    - 其他服务进程的修改通过数据库中的认证版本（Database.auth_version）感知：版本变化时清空全部缓存
+    - 失效计数 generation：读取数据库之前记下计数，写入缓存时计数已变化则放弃写入，
+      避免并发修改时把修改前读到的信息放进缓存
+    """
+    
+    def __init__(self, ttl_seconds: float = 60, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.generation = 0
+        self.version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+    
+    def get(self, session_id: str, version: Optional[int] = None) -> Optional[Dict]:
+        """
+        返回缓存的用户信息（副本），未缓存、缓存过期、会话过期或账号过期时返回 None
+        
+        Args:
+            version: 数据库中当前的认证版本，与上次不同时先清空缓存
+        """
+        now = time.time()
+        with self._lock:
+            if version is not None and version != self.version:
+                if self.version is not None:
+                    self._stats['invalidations'] += 1
+                self.version = version
+                self.generation += 1
+                self._entries.clear()
+            entry = self._entries.get(session_id)
+            if entry is not None and (now - entry['cached_at'] > self.ttl_seconds or
+                                      now >= entry['expires_at'] or now >= entry['valid_until']):
+                del self._entries[session_id]
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            user = entry['user']
+        return dict(user, permissions=list(user['permissions']))
+    
+    def put(self, session_id: str, user: Dict, expires_at: str, valid_until: Optional[str], generation: int):
+        """缓存用户信息（generation 为读取数据库之前的失效计数）"""
+        def timestamp(value):
+            return datetime.strptime(value, '%Y%m%d%H%M%S').timestamp() if value else float('inf')
+        
+        entry = {'user': dict(user, permissions=list(user['permissions'])), 'cached_at': time.time(),
+                 'expires_at': timestamp(expires_at), 'valid_until': timestamp(valid_until)}
+        with self._lock:
+            if generation != self.generation:
+                return
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[session_id] = entry
+    
+    def invalidate_session(self, session_id: str):
+        with self._lock:
+            self.generation += 1
+            self._stats['invalidations'] += 1
+            self._entries.pop(session_id, None)
+    
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self.generation += 1
+            self._stats['invalidations'] += 1
+            for session_id in [key for key, entry in self._entries.items() if entry['user']['id'] == user_id]:
+                del self._entries[session_id]
+    
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+    
+    def status(self) -> Dict:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(self._stats, entries=len(self._entries),
+                        hit_rate=round(self._stats['hits'] / lookups, 4) if lookups else 0.0)
+
+
 class AuthManager:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, session_cache_seconds: float = 60):
+        """
+        Args:
+            db: 数据库
+            session_cache_seconds: 会话缓存时间（秒），0 表示不缓存，每次认证都查询数据库
+        """
         self.db = db
+        self.session_cache = SessionCache(session_cache_seconds) if session_cache_seconds > 0 else None
+        db.session_cache = self.session_cache
     
     def verify_password(self, password: str, password_hash: str) -> bool:
         """验证密码"""
@@ -76,6 +171,13 @@ class AuthManager:
         if not session_id:
             return None
         
+        generation = 0
+        if self.session_cache is not None:
+            cached = self.session_cache.get(session_id, self.db.auth_version)
+            if cached is not None:
+                return cached
+            generation = self.session_cache.generation
+        
         session = self.db.get_session(session_id)
         if not session:
             return None
@@ -113,12 +215,15 @@ class AuthManager:
         else:
             permissions = self.db.get_user_permissions(user_id)
         
-        return {
+        current_user = {
             'id': user_id,
             'username': session['username'],
             'role': role,
             'permissions': permissions
         }
+        if self.session_cache is not None:
+            self.session_cache.put(session_id, current_user, session['expires_at'], user['valid_until'], generation)
+        return current_user
     
     def require_auth(self, session_id: Optional[str] = None) -> Dict:
         """要求用户已登录"""
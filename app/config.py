@@ -37,7 +37,64 @@ class Config:
                 "api_key": ""
             },
             "akshare": {},
-            "update_frequency": "monthly"
+            "update_frequency": "monthly",
+            "database": {
+                "pool_size": 5,
+                "read_pool_size": 5,
+                "max_connections": 20,
+                "pool_timeout": 30,
+                "busy_timeout": 30,
+                "pool_pre_ping": True,
+                "pool_recycle_seconds": 3600,
+                "profile": "performance",
+                "pragmas": {}
+            },
+            "update": {
+                "write_batch_size": 50,
+                "flush_interval": 5,
+                "retry_attempts": 2,
+                "retry_backoff": 5,
+                "bulk_incremental": True,
+                "bulk_max_months": 3,
+                "sources": {
+                    "akshare": {"workers": 4, "requests_per_second": 2, "burst": 4},
+                    "tushare": {"workers": 4, "requests_per_second": 3, "burst": 5},
+                    "baostock": {"workers": 1, "requests_per_second": 10, "burst": 10},
+                    "finnhub": {"workers": 2, "requests_per_second": 1, "burst": 1}
+                }
+            },
+            "statistics": {
+                "mode": "single",
+                "workers": 4,
+                "kline_store": False,
+                "kline_snapshot": False
+            },
+            "web": {
+                "auto_reload": False
+            },
+            "auth": {
+                "session_cache_seconds": 60
+            },
+            "result_cache": {
+                "enabled": True,
+                "max_entries": 256,
+                "ttl_seconds": 3600
+            },
+            "executor": {
+                "max_concurrency": 4,
+                "max_queue": 32
+            },
+            "export": {
+                "chunk_size": 65536,
+                "max_streams": 4
+            },
+            "fetch_cache": {
+                "enabled": False,
+                "mode": "ttl",
+                "ttl_seconds": 21600,
+                "history_ttl_seconds": 604800,
+                "max_size_mb": 512
+            }
         }
     
     def save_config(self):
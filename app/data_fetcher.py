@@ -3,13 +3,16 @@
 """
 import tushare as ts
 import baostock as bs
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Tuple
 import time
+import threading
 import requests
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from app.config import Config
+from app.fetch_cache import get_fetch_cache
 
 try:
     import akshare as ak
@@ -18,10 +21,198 @@ except ImportError:
     AKSHARE_AVAILABLE = False
 
 
+# 带超时的数据源请求共用一个长期存在的线程池
+# 每次请求新建 ThreadPoolExecutor 时，with 退出会等待超时的请求结束，超时实际上不起作用
+_request_executor: Optional[ThreadPoolExecutor] = None
+_request_executor_lock = threading.Lock()
+
+
+def _get_request_executor() -> ThreadPoolExecutor:
+    global _request_executor
+    with _request_executor_lock:
+        if _request_executor is None:
+            _request_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='fetch-request')
+        return _request_executor
+
+
+def call_with_timeout(func, timeout: float, *args, **kwargs):
+    """在共享线程池中执行请求，超过 timeout 秒抛出 FutureTimeoutError（请求线程在后台自行结束）"""
+    future = _get_request_executor().submit(func, *args, **kwargs)
+    return future.result(timeout=timeout)
+
+
+class FetchError(Exception):
+    """
+    数据源请求失败（网络错误、超时、接口返回错误）
+
+    逐只股票获取月K线时，请求失败抛出该异常，数据源确实没有数据时返回空 DataFrame，
+    更新任务据此把失败的股票标记为 failed 并在最后一轮重试
+    """
+
+
+# 需要重新登录的 BaoStock 错误码：用户未登录、网络错误（连接断开后需要重新建立连接并登录）
+BAOSTOCK_RELOGIN_ERROR_CODES = {
+    '10001001', '10002001', '10002002', '10002003', '10002004',
+    '10002005', '10002006', '10002007', '10002008',
+}
+
+
+class BaoStockSession:
+    """
+    BaoStock 登录会话（进程内共用一个）
+    
+    - 首次请求时登录，之后所有请求复用同一个会话，不再每只股票登录一次
+    - 返回未登录或网络错误时重新登录，并重试一次请求
+    - BaoStock 的连接是模块级的单个 socket，请求（包括分页读取结果）通过同一把锁串行执行
+    """
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.logged_in = False
+        self.stats = {'logins': 0, 'relogins': 0, 'queries': 0}
+    
+    def login(self):
+        """登录（已登录时直接返回），失败时抛出异常"""
+        with self._lock:
+            if self.logged_in:
+                return
+            lg = bs.login()
+            if lg.error_code != '0':
+                raise Exception(f"BaoStock登录失败: {lg.error_msg}")
+            self.logged_in = True
+            self.stats['logins'] += 1
+    
+    def logout(self):
+        """登出（未登录时忽略）"""
+        with self._lock:
+            if not self.logged_in:
+                return
+            self.logged_in = False
+            try:
+                bs.logout()
+            except Exception as e:
+                print(f"BaoStock登出失败: {e}")
+    
+    def query(self, func: Callable, *args, **kwargs) -> Tuple[object, pd.DataFrame]:
+        """
+        在会话中执行查询并读取全部结果
+        
+        Returns:
+            (结果集, 数据)，结果集为 None 或 error_code 不为 '0' 时数据为空 DataFrame
+        """
+        with self._lock:
+            self.login()
+            self.stats['queries'] += 1
+            rs = func(*args, **kwargs)
+            if rs is not None and rs.error_code in BAOSTOCK_RELOGIN_ERROR_CODES:
+                print(f"BaoStock会话失效（{rs.error_code} {rs.error_msg}），重新登录")
+                self.logout()
+                self.login()
+                self.stats['relogins'] += 1
+                rs = func(*args, **kwargs)
+            if rs is None or rs.error_code != '0':
+                return rs, pd.DataFrame()
+            return rs, rs.get_data()
+
+
+baostock_session = BaoStockSession()
+
+
+MONTHLY_KLINE_OUTPUT_COLUMNS = ['ts_code', 'trade_date', 'year', 'month', 'open', 'close',
+                                'high', 'low', 'vol', 'amount', 'pct_chg']
+
+
+def monthly_pct_chg(close: np.ndarray, open_: np.ndarray = None, prev_close: float = None) -> np.ndarray:
+    """
+    计算月涨跌幅（%）：以前一个月的收盘价为基准
+    
+    Args:
+        close: 按时间正序的月收盘价
+        open_: 月开盘价；提供时，基准收盘价无效（首个上市月份或前一月缺失）的月份以当月开盘价为基准
+        prev_close: 第一个月之前一个月的收盘价（没有则为 None）
+    """
+    close = np.asarray(close, dtype='float64')
+    base = np.empty_like(close)
+    if len(close):
+        base[0] = np.nan if prev_close is None else float(prev_close)
+        base[1:] = close[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = np.where(base > 0, (close - base) / base * 100, np.nan)
+        if open_ is not None:
+            open_ = np.asarray(open_, dtype='float64')
+            from_open = ~(base > 0) & (open_ > 0)
+            pct = np.where(from_open, (close - open_) / open_ * 100, pct)
+    return pct
+
+
+def resample_daily_to_monthly(daily: pd.DataFrame, ts_code: str, prev_close: float = None,
+                              open_as_base: bool = False) -> pd.DataFrame:
+    """
+    日线聚合为月线（按月分段后用 NumPy reduceat 一次算出所有月份）
+    
+    - 开盘价：当月第一个有效开盘价；收盘价：当月最后一个有效收盘价
+    - 最高/最低：当月最高/最低价（缺少该列时取收盘价）；成交量/成交额：当月合计（缺少该列时为0）
+    - 涨跌幅：以前一个月收盘价为基准，第一个月使用 prev_close
+    
+    Args:
+        daily: 日线数据，trade_date 为日期类型，包含 open, close 列，可选 high, low, vol, amount 列
+        ts_code: 股票代码
+        prev_close: 第一个月之前一个月的收盘价
+        open_as_base: 没有有效的上月收盘价时（如上市首月）是否以当月开盘价为基准计算涨跌幅
+    
+    Returns:
+        月K线 DataFrame（列见 MONTHLY_KLINE_OUTPUT_COLUMNS）
+    """
+    if daily.empty:
+        return pd.DataFrame(columns=MONTHLY_KLINE_OUTPUT_COLUMNS)
+    if not daily['trade_date'].is_monotonic_increasing:
+        daily = daily.sort_values('trade_date', kind='stable')
+    n = len(daily)
+    dates = daily['trade_date'].values.astype('datetime64[D]')
+    month_keys = dates.astype('datetime64[M]').astype('int64')
+    starts = np.flatnonzero(np.r_[True, month_keys[1:] != month_keys[:-1]])
+    positions = np.arange(n)
+    
+    def first_valid(values):
+        values = np.asarray(values, dtype='float64')
+        index = np.minimum.reduceat(np.where(np.isnan(values), n, positions), starts)
+        return np.where(index < n, values[np.minimum(index, n - 1)], np.nan)
+    
+    def last_valid(values):
+        values = np.asarray(values, dtype='float64')
+        index = np.maximum.reduceat(np.where(np.isnan(values), -1, positions), starts)
+        return np.where(index >= 0, values[np.maximum(index, 0)], np.nan)
+    
+    def column(name):
+        return daily[name].to_numpy(dtype='float64', na_value=np.nan) if name in daily.columns else None
+    
+    ends = np.r_[starts[1:], n] - 1
+    open_ = first_valid(column('open'))
+    close = last_valid(column('close'))
+    high, low, vol, amount = column('high'), column('low'), column('vol'), column('amount')
+    
+    monthly_keys = month_keys[starts]
+    return pd.DataFrame({
+        'ts_code': ts_code,
+        'trade_date': pd.to_datetime(dates[ends]).strftime('%Y%m%d'),
+        'year': monthly_keys // 12 + 1970,
+        'month': monthly_keys % 12 + 1,
+        'open': open_,
+        'close': close,
+        'high': np.fmax.reduceat(high, starts) if high is not None else close,
+        'low': np.fmin.reduceat(low, starts) if low is not None else close,
+        'vol': np.add.reduceat(np.nan_to_num(vol), starts) if vol is not None else 0,
+        'amount': np.add.reduceat(np.nan_to_num(amount), starts) if amount is not None else 0,
+        'pct_chg': monthly_pct_chg(close, open_ if open_as_base else None, prev_close),
+    }, columns=MONTHLY_KLINE_OUTPUT_COLUMNS)
+
+
 class DataFetcher:
     def __init__(self, config: Config):
         self.config = config
         self.data_source = config.get('data_source', 'tushare')
+        # 本地缓存（未启用时为 None）
+        self.cache = get_fetch_cache(config)
         self._init_data_source()
     
     def _init_data_source(self):
@@ -32,10 +223,11 @@ class DataFetcher:
                 ts.set_token(token)
                 self.pro = ts.pro_api()
         elif self.data_source == 'baostock':
-            lg = bs.login()
-            if lg.error_code != '0':
-                print(f"BaoStock登录失败: {lg.error_msg}")
-                raise Exception(f"BaoStock登录失败: {lg.error_msg}")
+            try:
+                baostock_session.login()
+            except Exception as e:
+                print(str(e))
+                raise
         elif self.data_source == 'finnhub':
             self.finnhub_key = self.config.get('finnhub.api_key', '')
         elif self.data_source == 'akshare':
@@ -110,8 +302,26 @@ class DataFetcher:
             print(f"Error fetching stock list from akshare: {e}")
             return pd.DataFrame()
     
-    def get_monthly_kline(self, ts_code: str, start_date: str, end_date: str) -> pd.DataFrame:
-        """获取月K线数据"""
+    def get_monthly_kline(self, ts_code: str, start_date: str, end_date: str,
+                          before_request: Optional[Callable[[], bool]] = None) -> pd.DataFrame:
+        """
+        获取月K线数据（启用本地缓存时优先使用缓存）
+        
+        Args:
+            before_request: 每次向数据源发起请求前的回调（用于限流，命中缓存时不调用），返回 False 表示放弃请求；
+                            随每次调用传入，同一个 DataFetcher 被多个抓取流水线共用时互不影响
+        """
+        if self.cache is not None:
+            return self.cache.get_monthly_kline(
+                self.data_source, ts_code, start_date, end_date,
+                lambda code, start, end: self._fetch_monthly_kline(code, start, end, before_request))
+        return self._fetch_monthly_kline(ts_code, start_date, end_date, before_request)
+    
+    def _fetch_monthly_kline(self, ts_code: str, start_date: str, end_date: str,
+                             before_request: Optional[Callable[[], bool]] = None) -> pd.DataFrame:
+        """从数据源获取月K线数据"""
+        if before_request is not None and not before_request():
+            raise InterruptedError("数据更新已停止")
         if self.data_source == 'tushare':
             return self._get_monthly_kline_tushare(ts_code, start_date, end_date)
         elif self.data_source == 'baostock':
@@ -123,8 +333,75 @@ class DataFetcher:
         else:
             raise ValueError(f"Unsupported data source: {self.data_source}")
     
+    def supports_bulk_monthly_kline(self) -> bool:
+        """
+        数据源是否支持按交易日期一次获取全市场月K线
+        
+        akshare 的实时行情快照只有当天的价格和成交量，BaoStock 的K线查询必须指定股票代码，
+        都无法得到整月的开盘/最高/最低/成交量，只能逐只股票获取
+        """
+        return self.data_source == 'tushare' and hasattr(self, 'pro')
+    
+    def get_month_end_trade_dates(self, start_date: str, end_date: str) -> List[str]:
+        """区间内每个月的最后一个交易日（end_date 所在月份取 end_date 之前最近的交易日）"""
+        if self.data_source == 'tushare':
+            cal = self.pro.trade_cal(exchange='SSE', start_date=start_date, end_date=end_date, is_open='1')
+            if cal is None or cal.empty:
+                return []
+            dates = pd.Series(sorted(cal['cal_date'].astype(str)))
+            return dates.groupby(dates.str[:6]).last().tolist()
+        return []
+    
+    def get_monthly_kline_bulk(self, trade_date: str) -> pd.DataFrame:
+        """
+        一次获取全市场某个月的月K线
+        
+        Args:
+            trade_date: 该月最后一个交易日（当月为最近一个交易日）
+        
+        Returns:
+            月K线 DataFrame（包含所有股票，已有 pct_chg）；数据源不支持或没有数据时返回空 DataFrame
+        """
+        if self.data_source == 'tushare':
+            return self._get_monthly_kline_bulk_tushare(trade_date)
+        return pd.DataFrame()
+    
+    def get_adj_factors_bulk(self, trade_date: str) -> pd.Series:
+        """
+        一次获取全市场某个交易日的复权因子
+        
+        Returns:
+            以 ts_code 为索引的复权因子；数据源不支持或没有数据时返回空 Series
+        """
+        if self.data_source == 'tushare':
+            df = self.pro.adj_factor(trade_date=trade_date, fields='ts_code,adj_factor')
+            if df is not None and not df.empty:
+                return df.drop_duplicates('ts_code').set_index('ts_code')['adj_factor']
+        return pd.Series(dtype=float)
+    
+    def _get_monthly_kline_bulk_tushare(self, trade_date: str) -> pd.DataFrame:
+        """
+        从tushare的 monthly 接口获取全市场月K线
+        
+        monthly 接口是不复权数据，只有区间内没有除权除息（复权因子不变）的股票与前复权数据一致，
+        调用方需要用 get_adj_factors_bulk 筛选
+        """
+        try:
+            df = self.pro.monthly(trade_date=trade_date,
+                                  fields='ts_code,trade_date,open,high,low,close,vol,amount,pct_chg')
+            if df is None or df.empty:
+                return pd.DataFrame()
+            df['trade_date'] = df['trade_date'].astype(str)
+            df['year'] = df['trade_date'].str[:4].astype(int)
+            df['month'] = df['trade_date'].str[4:6].astype(int)
+            return df[MONTHLY_KLINE_OUTPUT_COLUMNS]
+        except Exception as e:
+            print(f"Error fetching bulk monthly data from tushare ({trade_date}): {e}")
+            return pd.DataFrame()
+    
     def _get_monthly_kline_tushare(self, ts_code: str, start_date: str, end_date: str) -> pd.DataFrame:
-        """从tushare获取月K线（使用前复权数据）"""
+        """从tushare获取月K线（使用前复权数据）；月线和日线请求都失败时抛出 FetchError"""
+        monthly_error = None
         try:
             # 使用pro_bar获取前复权月线数据
             import tushare as ts
@@ -142,84 +419,48 @@ class DataFetcher:
                 return df
         except Exception as e:
             print(f"Error fetching monthly adjusted data from tushare: {e}")
+            monthly_error = e
         
         # 如果月线数据获取失败，从日线前复权数据计算月线
         try:
             import tushare as ts
-            df = ts.pro_bar(ts_code=ts_code, adj='qfq', start_date=start_date, end_date=end_date, freq='D')
+            # 多取上个月的日线（只多一个月），作为第一个月涨跌幅的基准
+            start_dt = pd.to_datetime(start_date, format='%Y%m%d')
+            prev_month_start = (start_dt - pd.DateOffset(months=1)).replace(day=1)
+            df = ts.pro_bar(ts_code=ts_code, adj='qfq', start_date=prev_month_start.strftime('%Y%m%d'),
+                            end_date=end_date, freq='D')
             if df is not None and not df.empty:
                 df['trade_date'] = pd.to_datetime(df['trade_date'])
-                df['year'] = df['trade_date'].dt.year
-                df['month'] = df['trade_date'].dt.month
+                # pro_bar 按日期倒序返回，按月取首/末交易日之前先改为正序
+                df = df.sort_values('trade_date')
                 
-                # 按月聚合
-                # 开盘价：取每月第一个交易日的开盘价
-                # 收盘价：取每月最后一天的收盘价
-                monthly_first = df.groupby(['year', 'month']).first().reset_index()
-                monthly_last = df.groupby(['year', 'month']).last().reset_index()
+                # 上个月最后一个交易日的收盘价
+                prev_month_df = df[df['trade_date'] < start_dt.replace(day=1)]
+                prev_close = prev_month_df['close'].iloc[-1] if not prev_month_df.empty else None
                 
-                # 合并数据
-                monthly_df = monthly_last[['year', 'month', 'trade_date']].copy()
-                monthly_df['trade_date'] = monthly_df['trade_date'].dt.strftime('%Y%m%d')
-                monthly_df['ts_code'] = ts_code
-                monthly_df['open'] = monthly_first['open'].values  # 第一个交易日的开盘价
-                monthly_df['close'] = monthly_last['close'].values  # 最后一天的收盘价
+                df = df[df['trade_date'] >= start_dt]
+                if df.empty:
+                    return pd.DataFrame()
                 
-                # 计算月K涨跌幅：需要获取上月的收盘价
-                monthly_df = monthly_df.sort_values('trade_date')
-                for idx, row in monthly_df.iterrows():
-                    year = row['year']
-                    month = row['month']
-                    # 计算上月日期
-                    if month == 1:
-                        prev_year = year - 1
-                        prev_month = 12
-                    else:
-                        prev_year = year
-                        prev_month = month - 1
-                    
-                    # 获取上月最后一天的收盘价
-                    try:
-                        prev_start = f"{prev_year}{prev_month:02d}01"
-                        prev_end = f"{prev_year}{prev_month:02d}31"
-                        prev_df = ts.pro_bar(ts_code=ts_code, adj='qfq', start_date=prev_start, end_date=prev_end, freq='D')
-                        if prev_df is not None and not prev_df.empty:
-                            prev_df = prev_df.sort_values('trade_date')
-                            prev_close = prev_df.iloc[-1]['close']
-                            current_close = row['close']
-                            if pd.notna(prev_close) and pd.notna(current_close) and prev_close > 0:
-                                monthly_df.loc[idx, 'pct_chg'] = (current_close - prev_close) / prev_close * 100
-                    except:
-                        pass
+                # 按月聚合，涨跌幅以前一个月收盘价为基准（第一个月使用多取的上月收盘价）
+                monthly_df = resample_daily_to_monthly(df, ts_code, prev_close=prev_close)
                 
                 # 如果没有pct_chg，使用close的pct_change
-                if 'pct_chg' not in monthly_df.columns or monthly_df['pct_chg'].isna().all():
+                if monthly_df['pct_chg'].isna().all():
                     monthly_df = self.calculate_pct_chg(monthly_df)
                 
                 return monthly_df
         except Exception as e:
-            print(f"Error fetching daily adjusted data from tushare: {e}")
+            raise FetchError(f"从tushare获取 {ts_code} 数据失败: 月线 {monthly_error}；日线 {e}") from e
         
+        # 日线请求成功但没有数据；月线请求失败时无法确认是否确实没有数据
+        if monthly_error is not None:
+            raise FetchError(f"从tushare获取 {ts_code} 月线数据失败: {monthly_error}") from monthly_error
         return pd.DataFrame()
     
     def _get_monthly_kline_baostock(self, ts_code: str, start_date: str, end_date: str) -> pd.DataFrame:
         """从BaoStock获取月K线"""
         try:
-            # 确保baostock已登录（在长时间运行的服务中，连接可能会断开）
-            # 先尝试登录，如果失败则先登出再重新登录
-            lg = bs.login()
-            if lg.error_code != '0':
-                print(f"BaoStock登录失败 {ts_code}: {lg.error_msg}，尝试重新连接...")
-                # 先登出，再重新登录
-                try:
-                    bs.logout()
-                except:
-                    pass
-                lg = bs.login()
-                if lg.error_code != '0':
-                    print(f"BaoStock重新登录失败 {ts_code}: {lg.error_msg}")
-                    return pd.DataFrame()
-            
             # BaoStock代码格式转换（如000001.SZ -> sz.000001）
             if ts_code.endswith('.SZ'):
                 code = f"sz.{ts_code.replace('.SZ', '')}"
@@ -236,7 +477,9 @@ class DataFetcher:
             start_date_formatted = f"{start_date[:4]}-{start_date[4:6]}-{start_date[6:8]}"
             end_date_formatted = f"{end_date[:4]}-{end_date[4:6]}-{end_date[6:8]}"
             
-            rs = bs.query_history_k_data_plus(
+            # 复用登录会话（会话失效时自动重新登录）
+            rs, df = baostock_session.query(
+                bs.query_history_k_data_plus,
                 code,
                 "date,open,high,low,close,volume,amount",
                 start_date=start_date_formatted,
@@ -247,14 +490,11 @@ class DataFetcher:
             
             # 检查返回结果
             if rs is None:
-                print(f"BaoStock查询返回None: {ts_code}")
-                return pd.DataFrame()
+                raise FetchError(f"BaoStock查询返回None: {ts_code}")
             
             if rs.error_code != '0':
-                print(f"BaoStock查询错误 {ts_code}: {rs.error_msg}")
-                return pd.DataFrame()
+                raise FetchError(f"BaoStock查询错误 {ts_code}: {rs.error_msg}")
             
-            df = rs.get_data()
             if df.empty:
                 return pd.DataFrame()
             
@@ -273,15 +513,14 @@ class DataFetcher:
             df['trade_date'] = pd.to_datetime(df['date']).dt.strftime('%Y%m%d')
             df['year'] = pd.to_datetime(df['date']).dt.year
             df['month'] = pd.to_datetime(df['date']).dt.month
-            df['pct_chg'] = df['close'].pct_change() * 100
+            df['pct_chg'] = monthly_pct_chg(df['close'].values)
             df = df.rename(columns={'volume': 'vol'})
             
             return df[['ts_code', 'trade_date', 'year', 'month', 'open', 'close', 'high', 'low', 'vol', 'amount', 'pct_chg']]
+        except FetchError:
+            raise
         except Exception as e:
-            print(f"Error fetching baostock data for {ts_code}: {e}")
-            import traceback
-            traceback.print_exc()
-            return pd.DataFrame()
+            raise FetchError(f"从BaoStock获取 {ts_code} 数据失败: {e}") from e
     
     def _get_monthly_kline_finnhub(self, ts_code: str, start_date: str, end_date: str) -> pd.DataFrame:
         """从FinnHub获取月K线（A股支持有限）"""
@@ -301,18 +540,14 @@ class DataFetcher:
             extended_start = prev_month_start.strftime('%Y%m%d')
             
             # 使用超时机制获取日线数据（前复权），防止卡住
-            def fetch_data():
-                return ak.stock_zh_a_hist(symbol=code, period="daily", start_date=extended_start, end_date=end_date, adjust="qfq")
-            
-            # 设置超时时间为30秒
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(fetch_data)
-                try:
-                    df = future.result(timeout=30)
-                except FutureTimeoutError:
-                    raise TimeoutError(f"获取 {ts_code} 数据超时（超过30秒）")
-                except Exception as e:
-                    raise Exception(f"获取 {ts_code} 数据失败: {str(e)}")
+            timeout = self.config.get('akshare.timeout', 30)
+            try:
+                df = call_with_timeout(ak.stock_zh_a_hist, timeout, symbol=code, period="daily",
+                                       start_date=extended_start, end_date=end_date, adjust="qfq")
+            except FutureTimeoutError:
+                raise FetchError(f"获取 {ts_code} 数据超时（超过{timeout}秒）")
+            except Exception as e:
+                raise FetchError(f"获取 {ts_code} 数据失败: {str(e)}") from e
             
             if df is None or df.empty:
                 return pd.DataFrame()
@@ -333,112 +568,46 @@ class DataFetcher:
             if not (date_col and open_col and close_col):
                 return pd.DataFrame()
             
-            # 转换日期格式
-            df[date_col] = pd.to_datetime(df[date_col])
-            df['year'] = df[date_col].dt.year
-            df['month'] = df[date_col].dt.month
-            df['trade_date'] = df[date_col].dt.strftime('%Y%m%d')
+            # 转换为统一的日线格式
+            daily = pd.DataFrame({
+                'trade_date': pd.to_datetime(df[date_col]),
+                'open': df[open_col],
+                'close': df[close_col],
+            })
+            for source_col, target_col in (('最高', 'high'), ('最低', 'low'), ('成交量', 'vol'), ('成交额', 'amount')):
+                if source_col in df.columns:
+                    daily[target_col] = df[source_col]
+            daily = daily.sort_values('trade_date', kind='stable')
+            
+            # 上个月最后一个交易日的收盘价（用于计算第一个月的涨跌幅）
+            # 请求已扩展到上个月，直接从同一份数据中取，不再单独请求
+            end_dt = pd.to_datetime(end_date, format='%Y%m%d')
+            prev_month_df = daily[daily['trade_date'] < start_dt]
+            prev_close = prev_month_df['close'].iloc[-1] if not prev_month_df.empty else None
             
             # 过滤掉上个月的数据（只保留请求范围内的数据）
-            start_dt = pd.to_datetime(start_date, format='%Y%m%d')
-            end_dt = pd.to_datetime(end_date, format='%Y%m%d')
-            df = df[(df[date_col] >= start_dt) & (df[date_col] <= end_dt)]
+            daily = daily[(daily['trade_date'] >= start_dt) & (daily['trade_date'] <= end_dt)]
             
-            if df.empty:
+            if daily.empty:
                 return pd.DataFrame()
             
-            # 获取上个月最后一天的收盘价（用于计算第一个月的涨跌幅）
-            # 使用超时机制获取上个月数据
-            def fetch_prev_month():
-                return ak.stock_zh_a_hist(symbol=code, period="daily", 
-                                         start_date=prev_month_start.strftime('%Y%m%d'), 
-                                         end_date=(start_dt - pd.Timedelta(days=1)).strftime('%Y%m%d'), 
-                                         adjust="qfq")
-            
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(fetch_prev_month)
-                try:
-                    prev_month_df = future.result(timeout=15)
-                except FutureTimeoutError:
-                    prev_month_df = None  # 超时则跳过
-                except Exception:
-                    prev_month_df = None  # 出错则跳过
-            prev_close = None
-            if prev_month_df is not None and not prev_month_df.empty:
-                prev_date_col = None
-                prev_close_col = None
-                for col in prev_month_df.columns:
-                    if '日期' in str(col) or 'date' in str(col).lower():
-                        prev_date_col = col
-                    if '收盘' in str(col) or 'close' in str(col).lower():
-                        prev_close_col = col
-                if prev_date_col and prev_close_col:
-                    prev_month_df = prev_month_df.sort_values(prev_date_col)
-                    prev_close = prev_month_df.iloc[-1][prev_close_col]
-            
-            # 按月聚合
-            # 开盘价：取每月第一个交易日的开盘价
-            # 收盘价：取每月最后一天的收盘价
-            monthly_first = df.groupby(['year', 'month']).first().reset_index()
-            monthly_last = df.groupby(['year', 'month']).last().reset_index()
-            
-            # 合并数据
-            monthly_df = monthly_last[['year', 'month', 'trade_date']].copy()
-            monthly_df['ts_code'] = ts_code
-            monthly_df['open'] = monthly_first[open_col].values  # 第一个交易日的开盘价
-            monthly_df['close'] = monthly_last[close_col].values  # 最后一天的收盘价
-            
-            # 获取最高、最低、成交量、成交额
-            if '最高' in df.columns:
-                monthly_df['high'] = df.groupby(['year', 'month'])['最高'].max().values
-            else:
-                monthly_df['high'] = monthly_df['close']
-            
-            if '最低' in df.columns:
-                monthly_df['low'] = df.groupby(['year', 'month'])['最低'].min().values
-            else:
-                monthly_df['low'] = monthly_df['close']
-            
-            if '成交量' in df.columns:
-                monthly_df['vol'] = df.groupby(['year', 'month'])['成交量'].sum().values
-            else:
-                monthly_df['vol'] = 0
-            
-            if '成交额' in df.columns:
-                monthly_df['amount'] = df.groupby(['year', 'month'])['成交额'].sum().values
-            else:
-                monthly_df['amount'] = 0
-            
-            # 计算月K涨跌幅
-            monthly_df = monthly_df.sort_values('trade_date')
-            prev_month_close = prev_close
-            
-            for idx, row in monthly_df.iterrows():
-                current_close = row['close']
-                current_open = row['open']
-                
-                if prev_month_close is not None and pd.notna(prev_month_close) and prev_month_close > 0:
-                    # 有上个月数据，使用上个月收盘价作为基准
-                    if pd.notna(current_close):
-                        monthly_df.loc[idx, 'pct_chg'] = (current_close - prev_month_close) / prev_month_close * 100
-                elif pd.notna(current_open) and current_open > 0:
-                    # 没有上个月数据（可能是新股上市首月），使用当月开盘价作为基准
-                    if pd.notna(current_close):
-                        monthly_df.loc[idx, 'pct_chg'] = (current_close - current_open) / current_open * 100
-                
-                # 更新prev_month_close为当前月的收盘价，用于下个月的计算
-                prev_month_close = row['close']
+            # 按月聚合；没有上月收盘价的月份（如新股上市首月）以当月开盘价为基准计算涨跌幅
+            monthly_df = resample_daily_to_monthly(daily, ts_code, prev_close=prev_close, open_as_base=True)
             
             # 如果没有pct_chg，使用close的pct_change
-            if 'pct_chg' not in monthly_df.columns or monthly_df['pct_chg'].isna().all():
+            if monthly_df['pct_chg'].isna().all():
                 monthly_df = self.calculate_pct_chg(monthly_df)
             
-            return monthly_df[['ts_code', 'trade_date', 'year', 'month', 'open', 'close', 'high', 'low', 'vol', 'amount', 'pct_chg']]
+            return monthly_df
+        except FetchError:
+            raise
         except Exception as e:
-            print(f"Error fetching monthly kline from akshare: {e}")
-            import traceback
-            traceback.print_exc()
-            return pd.DataFrame()
+            raise FetchError(f"处理 {ts_code} 的akshare数据失败: {e}") from e
+    
+    def close(self):
+        """释放数据源会话（数据更新结束时调用，BaoStock 登出；之后再请求时会重新登录）"""
+        if self.data_source == 'baostock':
+            baostock_session.logout()
     
     def get_industry_classification(self, industry_type: str = 'sw') -> Dict[str, List[str]]:
         """获取行业分类"""
@@ -3,12 +3,14 @@
 """
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import Callable, Optional
+from typing import Callable, Dict, List, Optional
+import threading
 import time
 import traceback
-from app.database import Database
+from app.database import Database, UPDATE_JOB_HEARTBEAT_SECONDS
 from app.data_fetcher import DataFetcher
 from app.config import Config
+from app.fetch_pipeline import FetchPipeline, get_fetch_options
 
 
 class DataUpdater:
@@ -18,15 +20,16 @@ class DataUpdater:
         self.fetcher = DataFetcher(config)
         self.data_source = config.get('data_source', 'tushare')
         self.progress_callback: Optional[Callable] = None
+        self._heartbeat_stop: Optional[threading.Event] = None
     
     def set_progress_callback(self, callback: Callable):
         """设置进度回调函数"""
         self.progress_callback = callback
     
-    def _update_progress(self, current: int, total: int, message: str = ""):
-        """更新进度"""
+    def _update_progress(self, current: int, total: int, message: str = "", telemetry: Optional[Dict] = None):
+        """更新进度（telemetry 为抓取阶段的结构化进度数据，见 _telemetry）"""
         if self.progress_callback:
-            self.progress_callback(current, total, message)
+            self.progress_callback(current, total, message, telemetry)
     
     def update_all_data(self, start_year: int = 2000, overwrite_mode: bool = False):
         """首次批量更新所有数据
@@ -37,6 +40,7 @@ class DataUpdater:
                 - True: 覆盖模式，先删除当前数据源的所有数据，然后重新获取
                 - False: 补充模式，只添加缺失的数据（默认）
         """
+        job_id = None
         try:
             # 1. 更新股票列表
             self._update_progress(0, 100, "正在获取股票列表...")
@@ -54,14 +58,18 @@ class DataUpdater:
                 deleted_count = self.db.delete_monthly_kline_by_source(self.data_source)
                 self._update_progress(10, 100, f"已删除 {deleted_count} 条旧数据，开始重新获取...")
             
-            # 3. 更新月K线数据
-            current_year = datetime.now().year
+            # 3. 更新月K线数据（并发抓取，批量写入）
+            end_date = datetime.now().strftime('%Y%m%d')
             total_stocks = len(stocks_df)
-            processed = 0
+            mode_text = "覆盖模式" if overwrite_mode else "补充模式"
+            
+            # 补充模式下一次查出每只股票已有的最新交易日期
+            latest_dates = {} if overwrite_mode else self.db.get_latest_trade_dates(self.data_source)
             
-            for idx, row in stocks_df.iterrows():
-                ts_code = row['ts_code']
-                list_date = row['list_date']
+            tasks = []
+            for row in stocks_df.itertuples(index=False):
+                ts_code = row.ts_code
+                list_date = row.list_date
                 
                 # 确定起始日期（上市日期或2000年）
                 if list_date and len(list_date) == 8:
@@ -69,65 +77,36 @@ class DataUpdater:
                 else:
                     start_date = f"{start_year}0101"
                 
-                end_date = datetime.now().strftime('%Y%m%d')
+                # 如果是补充模式且已有数据（按当前数据源），从最新日期之后开始
+                latest_date = latest_dates.get(ts_code)
+                if latest_date:
+                    start_date = (pd.to_datetime(latest_date, format='%Y%m%d') + timedelta(days=1)).strftime('%Y%m%d')
                 
-                try:
-                    # 如果是补充模式，检查是否已有数据（按当前数据源）
-                    if not overwrite_mode:
-                        latest_date = self.db.get_latest_trade_date(ts_code, data_source=self.data_source)
-                        if latest_date:
-                            # 增量更新：从最新日期之后开始
-                            start_date = (pd.to_datetime(latest_date, format='%Y%m%d') + timedelta(days=1)).strftime('%Y%m%d')
-                    
-                    # 获取数据（添加超时保护）
-                    try:
-                        kline_df = self.fetcher.get_monthly_kline(ts_code, start_date, end_date)
-                    except Exception as fetch_error:
-                        error_msg = str(fetch_error)
-                        print(f"Error fetching data for {ts_code}: {error_msg}")
-                        # 更新进度，显示错误信息
-                        processed += 1
-                        progress = 10 + int((processed / total_stocks) * 80)
-                        mode_text = "覆盖模式" if overwrite_mode else "补充模式"
-                        self._update_progress(progress, 100, f"获取 {row['name']} ({ts_code}) 数据失败: {error_msg[:50]}... [{processed}/{total_stocks}]")
-                        # 继续处理下一只股票
-                        if self.data_source == 'akshare':
-                            time.sleep(0.5)  # 即使失败也延迟一下
-                        continue
-                    
-                    if not kline_df.empty:
-                        # 计算涨跌幅（如果需要）
-                        kline_df = self.fetcher.calculate_pct_chg(kline_df)
-                        # 保存数据，记录数据源
-                        self.db.save_monthly_kline(kline_df, data_source=self.data_source)
-                    
-                    processed += 1
-                    progress = 10 + int((processed / total_stocks) * 80)
-                    mode_text = "覆盖模式" if overwrite_mode else "补充模式"
-                    self._update_progress(progress, 100, f"正在更新 {row['name']} ({ts_code})... [{processed}/{total_stocks}] [{mode_text}]")
-                    
-                    # 避免请求过快（akshare需要更长的延迟）
-                    if self.data_source == 'akshare':
-                        time.sleep(1.0)  # akshare建议延迟1秒
-                    else:
-                        time.sleep(0.2)
-                except Exception as e:
-                    error_msg = str(e)
-                    error_trace = traceback.format_exc()
-                    print(f"Error updating {ts_code}: {error_msg}")
-                    print(f"Traceback: {error_trace}")
-                    # 更新进度，显示错误信息
-                    processed += 1
-                    progress = 10 + int((processed / total_stocks) * 80)
-                    self._update_progress(progress, 100, f"更新 {row['name']} ({ts_code}) 时出错: {error_msg[:50]}... [{processed}/{total_stocks}]")
-                    continue
+                tasks.append({'ts_code': ts_code, 'name': row.name, 'start_date': start_date, 'end_date': end_date})
+            
+            def on_progress(task: Dict, error: Optional[str], stats: Dict):
+                processed = stats['processed']
+                progress = 10 + int((processed / total_stocks) * 80)
+                telemetry = self._telemetry(processed, total_stocks, stats)
+                if error:
+                    self._update_progress(progress, 100, f"获取 {task['name']} ({task['ts_code']}) 数据失败: {error[:50]}... [{processed}/{total_stocks}]", telemetry)
+                else:
+                    self._update_progress(progress, 100, f"正在更新 {task['name']} ({task['ts_code']})... [{processed}/{total_stocks}] [{mode_text}] [{self._format_throughput(stats)}]", telemetry)
+            
+            # 任务和每只股票的进度记录到数据库，进程中断后可用 resume_update 继续
+            job_id = self.db.create_update_job('full', 'overwrite' if overwrite_mode else 'supplement',
+                                               self.data_source, tasks, start_year=start_year)
+            self._start_heartbeat(job_id)
+            stats = self._run_update_job(job_id, tasks, on_progress, retry_progress=90)
+            print(f"月K线更新完成: {stats}")
             
             # 4. 更新行业分类
             self._update_progress(90, 100, "正在更新行业分类...")
             self._update_industry_classification()
             
-            mode_text = "覆盖模式" if overwrite_mode else "补充模式"
-            self._update_progress(100, 100, f"数据更新完成！[{mode_text}]")
+            self._checkpoint()
+            self.db.set_update_job_status(job_id, 'completed')
+            self._update_progress(100, 100, f"数据更新完成！[{mode_text}]{self._format_failed(stats)}")
             return True
             
         except Exception as e:
@@ -135,66 +114,69 @@ class DataUpdater:
             error_trace = traceback.format_exc()
             print(f"Error in update_all_data: {error_msg}")
             print(f"Traceback: {error_trace}")
+            self._interrupt_job(job_id)
             self._update_progress(100, 100, f"数据更新失败: {error_msg}")
             return False
+        finally:
+            self._stop_heartbeat()
+            # 更新结束后释放数据源会话（BaoStock 登出）
+            self.fetcher.close()
     
     def update_incremental(self):
         """增量更新（只更新最新数据）"""
+        job_id = None
         try:
             stocks_df = self.db.get_stocks(exclude_delisted=True)
             total_stocks = len(stocks_df)
-            processed = 0
+            end_date = datetime.now().strftime('%Y%m%d')
             
-            for idx, row in stocks_df.iterrows():
-                ts_code = row['ts_code']
+            # 一次查出每只股票的最新交易日期，据此规划整个增量更新
+            latest_dates = self.db.get_latest_trade_dates(self.data_source)
+            
+            tasks = []
+            for row in stocks_df.itertuples(index=False):
+                ts_code = row.ts_code
                 
-                # 获取最新交易日期
-                latest_date = self.db.get_latest_trade_date(ts_code, data_source=self.data_source)
+                latest_date = latest_dates.get(ts_code)
                 if latest_date:
                     start_date = (pd.to_datetime(latest_date, format='%Y%m%d') + timedelta(days=1)).strftime('%Y%m%d')
                 else:
                     # 如果没有数据，从上市日期开始
-                    list_date = row['list_date']
+                    list_date = row.list_date
                     start_date = list_date if list_date and len(list_date) == 8 else "20000101"
                 
-                end_date = datetime.now().strftime('%Y%m%d')
-                
                 if start_date >= end_date:
-                    processed += 1
                     continue
                 
-                try:
-                    try:
-                        kline_df = self.fetcher.get_monthly_kline(ts_code, start_date, end_date)
-                    except Exception as fetch_error:
-                        error_msg = str(fetch_error)
-                        print(f"Error fetching data for {ts_code}: {error_msg}")
-                        processed += 1
-                        progress = int((processed / total_stocks) * 100)
-                        self._update_progress(progress, 100, f"获取 {row['name']} ({ts_code}) 数据失败: {error_msg[:50]}...")
-                        time.sleep(0.2)
-                        continue
-                    
-                    if not kline_df.empty:
-                        kline_df = self.fetcher.calculate_pct_chg(kline_df)
-                        self.db.save_monthly_kline(kline_df, data_source=self.data_source)
-                    
-                    processed += 1
-                    progress = int((processed / total_stocks) * 100)
-                    self._update_progress(progress, 100, f"正在更新 {row['name']} ({ts_code})...")
-                    
-                    time.sleep(0.2)
-                except Exception as e:
-                    error_msg = str(e)
-                    error_trace = traceback.format_exc()
-                    print(f"Error updating {ts_code}: {error_msg}")
-                    print(f"Traceback: {error_trace}")
-                    processed += 1
-                    progress = int((processed / total_stocks) * 100)
-                    self._update_progress(progress, 100, f"更新 {row['name']} ({ts_code}) 时出错: {error_msg[:50]}...")
-                    continue
+                tasks.append({'ts_code': ts_code, 'name': row.name, 'start_date': start_date, 'end_date': end_date})
+            
+            # 已是最新的股票直接计入进度
+            skipped = total_stocks - len(tasks)
+            bulk_done = 0
+            
+            def on_progress(task: Dict, error: Optional[str], stats: Dict):
+                processed = skipped + bulk_done + stats['processed']
+                progress = int((processed / total_stocks) * 100)
+                telemetry = self._telemetry(processed, total_stocks, stats)
+                if error:
+                    self._update_progress(progress, 100, f"获取 {task['name']} ({task['ts_code']}) 数据失败: {error[:50]}...", telemetry)
+                else:
+                    self._update_progress(progress, 100, f"正在更新 {task['name']} ({task['ts_code']})... [{processed}/{total_stocks}] [{self._format_throughput(stats)}]", telemetry)
+            
+            job_id = self.db.create_update_job('incremental', 'incremental', self.data_source, tasks)
+            self._start_heartbeat(job_id)
+            
+            # 数据源支持时先按月批量获取全市场的最近几个月，批量数据覆盖不到的股票再逐只获取
+            remaining_tasks = self._update_bulk_months(job_id, tasks, end_date)
+            bulk_done = len(tasks) - len(remaining_tasks)
+            
+            stats = self._run_update_job(job_id, remaining_tasks, on_progress, retry_progress=99)
+            stats['bulk_updated'] = bulk_done
+            print(f"增量更新完成: {stats}")
             
-            self._update_progress(100, 100, "增量更新完成！")
+            self._checkpoint()
+            self.db.set_update_job_status(job_id, 'completed')
+            self._update_progress(100, 100, f"增量更新完成！{self._format_failed(stats)}")
             return True
             
         except Exception as e:
@@ -202,41 +184,286 @@ class DataUpdater:
             error_trace = traceback.format_exc()
             print(f"Error in update_incremental: {error_msg}")
             print(f"Traceback: {error_trace}")
+            self._interrupt_job(job_id)
             self._update_progress(100, 100, f"增量更新失败: {error_msg}")
             return False
+        finally:
+            self._stop_heartbeat()
+            # 更新结束后释放数据源会话（BaoStock 登出）
+            self.fetcher.close()
+    
+    def resume_update(self, job_id: int = None):
+        """继续未完成的数据更新任务（从第一只未完成的股票开始，最后重试失败的股票）
+        
+        Args:
+            job_id: 任务ID，不指定时继续当前数据源最近一个未完成的任务
+        """
+        try:
+            job = self.db.get_update_job(job_id) if job_id else self.db.get_resumable_update_job(self.data_source)
+            if not job or job['status'] not in ('running', 'interrupted'):
+                self._update_progress(100, 100, "没有可继续的数据更新任务")
+                return False
+            if job['data_source'] != self.data_source:
+                self._update_progress(100, 100, f"任务 #{job['id']} 的数据源为 {job['data_source']}，与当前数据源 {self.data_source} 不一致")
+                return False
+            if job['active']:
+                self._update_progress(100, 100, f"任务 #{job['id']} 正在其他服务进程中运行")
+                return False
+            
+            job_id = job['id']
+            self.db.set_update_job_status(job_id, 'running')
+            self._start_heartbeat(job_id)
+            tasks = self.db.get_update_job_tasks(job_id, 'pending')
+            total_stocks = job['total_count']
+            finished = job['done_count'] + job['failed_count']
+            job_text = "全量更新" if job['job_type'] == 'full' else "增量更新"
+            self._update_progress(int(finished / total_stocks * 90) if total_stocks else 0, 100,
+                                  f"继续{job_text}任务 #{job_id}：已完成 {job['done_count']}/{total_stocks}，剩余 {len(tasks)} 只，失败待重试 {job['failed_count']} 只")
+            
+            def on_progress(task: Dict, error: Optional[str], stats: Dict):
+                processed = finished + stats['processed']
+                progress = int((processed / total_stocks) * 90)
+                telemetry = self._telemetry(processed, total_stocks, stats)
+                if error:
+                    self._update_progress(progress, 100, f"获取 {task['name']} ({task['ts_code']}) 数据失败: {error[:50]}... [{processed}/{total_stocks}]", telemetry)
+                else:
+                    self._update_progress(progress, 100, f"正在更新 {task['name']} ({task['ts_code']})... [{processed}/{total_stocks}] [继续任务 #{job_id}] [{self._format_throughput(stats)}]", telemetry)
+            
+            stats = self._run_update_job(job_id, tasks, on_progress, retry_progress=90)
+            print(f"继续更新任务 #{job_id} 完成: {stats}")
+            
+            if job['job_type'] == 'full':
+                self._update_progress(90, 100, "正在更新行业分类...")
+                self._update_industry_classification()
+            
+            self._checkpoint()
+            self.db.set_update_job_status(job_id, 'completed')
+            self._update_progress(100, 100, f"{job_text}任务 #{job_id} 已完成！{self._format_failed(stats)}")
+            return True
+        
+        except Exception as e:
+            error_msg = str(e)
+            error_trace = traceback.format_exc()
+            print(f"Error in resume_update: {error_msg}")
+            print(f"Traceback: {error_trace}")
+            self._interrupt_job(job_id)
+            self._update_progress(100, 100, f"继续更新失败: {error_msg}")
+            return False
+        finally:
+            self._stop_heartbeat()
+            # 更新结束后释放数据源会话（BaoStock 登出）
+            self.fetcher.close()
+    
+    def _update_bulk_months(self, job_id: int, tasks: List[Dict], end_date: str) -> List[Dict]:
+        """
+        增量更新的批量模式：每个月一次请求获取全市场月K线（见 update.bulk_incremental / update.bulk_max_months）
+        
+        起始日期在最近 bulk_max_months 个月内、批量数据包含所需全部月份、并且从上月末到最近交易日复权因子不变
+        （没有除权除息，不复权数据与前复权数据一致）的股票直接写入并标记完成；
+        其余股票（期间有除权除息、批量数据缺失的月份、停牌、新股等）返回给调用方逐只获取前复权数据
+        
+        Returns:
+            需要逐只获取的任务
+        """
+        max_months = int(self.config.get('update.bulk_max_months', 3) or 0)
+        if not tasks or not self.config.get('update.bulk_incremental', True) or max_months <= 0 \
+                or not self.fetcher.supports_bulk_monthly_kline():
+            return tasks
+        
+        window_start = (pd.to_datetime(end_date, format='%Y%m%d') - pd.DateOffset(months=max_months - 1)).strftime('%Y%m01')
+        bulk_tasks = [task for task in tasks if task['start_date'] >= window_start]
+        if not bulk_tasks:
+            return tasks
+        
+        first_start = min(task['start_date'] for task in bulk_tasks)
+        prev_month_start = (pd.to_datetime(first_start, format='%Y%m%d') - pd.DateOffset(months=1)).strftime('%Y%m01')
+        try:
+            month_ends = self.fetcher.get_month_end_trade_dates(prev_month_start, end_date)
+            # 上月最后一个交易日的复权因子作为基准（第一个月涨跌幅以上月收盘价计算）
+            base_dates = [trade_date for trade_date in month_ends if trade_date < first_start]
+            trade_dates = [trade_date for trade_date in month_ends if trade_date >= first_start]
+            if not base_dates or not trade_dates:
+                return tasks
+            frames, factors = [], {}
+            for i, trade_date in enumerate(trade_dates):
+                self._update_progress(0, 100, f"正在批量获取全市场 {trade_date[:4]}年{trade_date[4:6]}月 月K线... [{i + 1}/{len(trade_dates)}]")
+                month_df = self.fetcher.get_monthly_kline_bulk(trade_date)
+                if not month_df.empty:
+                    frames.append(month_df)
+            for trade_date in [base_dates[-1]] + trade_dates:
+                factors[trade_date] = self.fetcher.get_adj_factors_bulk(trade_date)
+        except Exception as e:
+            print(f"批量获取全市场月K线失败，改为逐只获取: {e}")
+            return tasks
+        if not frames:
+            return tasks
+        
+        # 期间复权因子有变化（除权除息、送转）或缺少复权因子的股票，不复权数据与前复权不一致，逐只获取
+        factor_df = pd.DataFrame(factors)
+        unadjusted_codes = set(factor_df.index[factor_df.notna().all(axis=1) & (factor_df.nunique(axis=1) == 1)])
+        
+        bulk_df = pd.concat(frames, ignore_index=True)
+        available_dates = set(bulk_df['trade_date'])
+        groups = {ts_code: group for ts_code, group in bulk_df.groupby('ts_code', sort=False)}
+        
+        covered_frames, covered_codes, remaining = [], [], []
+        bulk_codes = {task['ts_code'] for task in bulk_tasks} & unadjusted_codes
+        for task in tasks:
+            needed = {trade_date for trade_date in trade_dates if trade_date >= task['start_date']}
+            group = groups.get(task['ts_code'])
+            if task['ts_code'] in bulk_codes and needed <= available_dates and \
+                    (not needed or (group is not None and needed <= set(group['trade_date']))):
+                if needed:
+                    covered_frames.append(group[group['trade_date'].isin(needed)])
+                covered_codes.append(task['ts_code'])
+            else:
+                remaining.append(task)
+        
+        if covered_codes:
+            rows = self.db.save_monthly_kline_batch(covered_frames, data_source=self.data_source)
+            self.db.record_update_job_results(job_id, [(ts_code, None) for ts_code in covered_codes])
+            print(f"批量模式: {len(trade_dates) * 2 + 1} 次请求更新 {len(covered_codes)} 只股票（{rows} 条），{len(remaining)} 只逐只获取")
+        return remaining
+    
+    def _run_fetch_pipeline(self, tasks: List[Dict], on_progress: Callable,
+                            on_written: Optional[Callable] = None) -> Dict:
+        """用并发抓取流水线执行月K线抓取任务（参数见 config.json 的 update 配置项）"""
+        options = get_fetch_options(self.config, self.data_source)
+        pipeline = FetchPipeline(self.fetcher, self.db, self.data_source, options)
+        return pipeline.run(tasks, on_progress, on_written)
+    
+    def _run_update_job(self, job_id: int, tasks: List[Dict], on_progress: Callable, retry_progress: int) -> Dict:
+        """
+        执行更新任务：先按顺序抓取所有股票，再对失败的股票按指数退避重试
+        
+        每批数据提交后把对应股票标记为 done/failed，进程中断时已写入的股票不会重复抓取
+        """
+        def on_written(results):
+            self.db.record_update_job_results(job_id, [(task['ts_code'], error) for task, error in results])
+        
+        stats = self._run_fetch_pipeline(tasks, on_progress, on_written)
+        
+        options = get_fetch_options(self.config, self.data_source)
+        retry_attempts = int(options['retry_attempts'])
+        for attempt in range(1, retry_attempts + 1):
+            failed_tasks = self.db.get_update_job_tasks(job_id, 'failed')
+            if not failed_tasks:
+                break
+            
+            delay = float(options['retry_backoff']) * 2 ** (attempt - 1)
+            self._update_progress(retry_progress, 100, f"{len(failed_tasks)} 只股票获取失败，{delay:.0f} 秒后进行第 {attempt}/{retry_attempts} 轮重试...")
+            time.sleep(delay)
+            
+            def on_retry_progress(task: Dict, error: Optional[str], retry_stats: Dict):
+                result_text = f"失败: {error[:50]}..." if error else "成功"
+                self._update_progress(retry_progress, 100, f"第 {attempt}/{retry_attempts} 轮重试 {task['name']} ({task['ts_code']}) {result_text} [{retry_stats['processed']}/{len(failed_tasks)}]")
+            
+            self._run_fetch_pipeline(failed_tasks, on_retry_progress, on_written)
+        
+        stats['failed_after_retry'] = len(self.db.get_update_job_tasks(job_id, 'failed'))
+        return stats
+    
+    def _start_heartbeat(self, job_id: int):
+        """任务运行期间定期记录心跳，其他服务进程据此判断任务仍在运行"""
+        self._stop_heartbeat()
+        stop = self._heartbeat_stop = threading.Event()
+        
+        def beat():
+            while not stop.wait(UPDATE_JOB_HEARTBEAT_SECONDS):
+                try:
+                    self.db.heartbeat_update_job(job_id)
+                except Exception as e:
+                    print(f"Error recording heartbeat for update job {job_id}: {e}")
+        
+        threading.Thread(target=beat, name=f"update-job-{job_id}-heartbeat", daemon=True).start()
+    
+    def _stop_heartbeat(self):
+        if self._heartbeat_stop is not None:
+            self._heartbeat_stop.set()
+            self._heartbeat_stop = None
+    
+    def _interrupt_job(self, job_id: Optional[int]):
+        """更新出错时把任务标记为 interrupted，之后可继续"""
+        if job_id is None:
+            return
+        try:
+            self.db.set_update_job_status(job_id, 'interrupted')
+        except Exception as e:
+            print(f"Error marking update job {job_id} interrupted: {e}")
+    
+    @staticmethod
+    def _format_failed(stats: Dict) -> str:
+        """完成消息中多次重试后仍失败的股票数"""
+        failed = stats.get('failed_after_retry', 0)
+        return f"（{failed} 只股票重试后仍失败，下次增量更新时会重新获取）" if failed else ""
+    
+    @staticmethod
+    def _telemetry(done: int, total: int, stats: Dict) -> Dict:
+        """抓取阶段的结构化进度：已完成/失败股票数、写入行数、吞吐量和预计剩余时间（秒）"""
+        speed = stats.get('stocks_per_second') or 0
+        return {
+            'done': done,
+            'total': total,
+            'failed': stats.get('failed', 0),
+            'rows': stats.get('rows', 0),
+            'stocks_per_second': speed,
+            'rows_per_second': stats.get('rows_per_second', 0),
+            'eta_seconds': round((total - done) / speed) if speed > 0 else None,
+            'elapsed': stats.get('elapsed', 0),
+            'workers': stats.get('workers', 0),
+            'cache_hits': stats.get('cache_hits', 0),
+        }
+    
+    @staticmethod
+    def _format_throughput(stats: Dict) -> str:
+        """进度消息中的吞吐量"""
+        text = f"{stats['stocks_per_second']:.2f} 只/秒, {stats['workers']} 线程"
+        if stats.get('cache_hits'):
+            text += f", 缓存命中 {stats['cache_hits']}"
+        return text
+    
+    def _checkpoint(self):
+        """批量写入结束后执行WAL检查点，避免WAL文件持续增长"""
+        try:
+            result = self.db.checkpoint()
+            if result and result['busy']:
+                print(f"WAL检查点未完成（有读写占用），将由自动检查点继续处理: {result}")
+        except Exception as e:
+            print(f"WAL检查点失败: {e}")
     
     def _update_industry_classification(self):
         """更新行业分类"""
         try:
-            # 从股票基本信息中获取行业分类
+            # 从股票基本信息中获取行业分类（tushare的industry字段是通用分类，同时作为申万和中信分类）
+            # akshare/baostock 的股票列表没有 industry 列，此时只使用数据源提供的行业分类
             stocks_df = self.db.get_stocks(exclude_delisted=True)
+            if 'industry' in stocks_df.columns:
+                has_industry = stocks_df['industry'].notna() & (stocks_df['industry'] != '')
+                basic_members = stocks_df.loc[has_industry, ['ts_code', 'industry']].rename(
+                    columns={'industry': 'industry_name'})
+            else:
+                basic_members = pd.DataFrame(columns=['ts_code', 'industry_name'])
             
-            # 更新申万行业分类（使用stock_basic中的industry字段）
-            for idx, row in stocks_df.iterrows():
-                if pd.notna(row.get('industry')) and row['industry']:
-                    industry_name = row['industry']
-                    self.db.save_industry(row['ts_code'], industry_name, 'L1', '', 'sw')
-                    # 同时保存到中信（如果tushare的industry字段是通用分类）
-                    self.db.save_industry(row['ts_code'], industry_name, 'L1', '', 'citics')
-            
-            # 如果数据源支持，尝试获取更详细的行业分类
-            try:
-                sw_industries = self.fetcher.get_industry_classification('sw')
-                if sw_industries:
-                    for industry_name, stock_codes in sw_industries.items():
-                        for ts_code in stock_codes:
-                            self.db.save_industry(ts_code, industry_name, 'L1', '', 'sw')
-            except:
-                pass
-            
-            try:
-                citics_industries = self.fetcher.get_industry_classification('citics')
-                if citics_industries:
-                    for industry_name, stock_codes in citics_industries.items():
-                        for ts_code in stock_codes:
-                            self.db.save_industry(ts_code, industry_name, 'L1', '', 'citics')
-            except:
-                pass
+            for industry_type in ('sw', 'citics'):
+                members = [basic_members]
+                # 如果数据源支持，追加更详细的行业分类
+                try:
+                    industries = self.fetcher.get_industry_classification(industry_type)
+                except Exception as e:
+                    print(f"Error fetching {industry_type} industry classification: {e}")
+                    industries = None
+                if industries:
+                    members.append(pd.DataFrame(
+                        [(ts_code, industry_name)
+                         for industry_name, stock_codes in industries.items()
+                         for ts_code in stock_codes],
+                        columns=['ts_code', 'industry_name']
+                    ))
+                
+                # 取得完整的详细分类时每个行业表一个事务整表替换，去掉已失效的成分股；
+                # 否则（获取失败或数据源不提供）只追加/更新，保留之前保存的详细分类
+                self.db.save_industries_bulk(pd.concat(members, ignore_index=True), industry_type,
+                                             replace_all=bool(industries))
         except Exception as e:
             print(f"Error updating industry classification: {e}")
 
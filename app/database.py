@@ -3,179 +3,417 @@
 """
 import sqlite3
 import os
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import Iterator, List, Dict, Optional, Tuple
+from urllib.request import pathname2url
 import pandas as pd
+from app.db_pool import ConnectionPool
+
+
+# 数据库默认选项（可通过 config.json 的 database 配置项覆盖）
+DEFAULT_DATABASE_OPTIONS = {
+    'pool_size': 5,                 # 连接池保留的空闲连接数
+    'read_pool_size': 5,            # 只读连接池保留的空闲连接数
+    'max_connections': 20,          # 每个连接池同时取出的连接数上限
+    'pool_timeout': 30,             # 连接数达到上限时等待归还的超时时间（秒）
+    'busy_timeout': 30,             # 等待写锁的超时时间（秒）
+    'pool_pre_ping': True,          # 取出连接时做健康检查
+    'pool_recycle_seconds': 3600,   # 连接最长存活时间（秒），0表示不回收
+    'profile': 'performance',       # PRAGMA配置档（见 DATABASE_PROFILES）
+    'pragmas': {},                  # 单独覆盖配置档中的PRAGMA
+}
+
+# PRAGMA配置档
+# - default: SQLite默认设置（回滚日志，读写互相阻塞）
+# - performance: WAL模式，读写互不阻塞；WAL文件由自动检查点和大小上限约束
+DATABASE_PROFILES = {
+    'default': {},
+    'performance': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 268435456,          # 256MB
+        'cache_size': -65536,            # 64MB（负数表示KB）
+        'temp_store': 'MEMORY',
+        'wal_autocheckpoint': 1000,      # 每1000页自动检查点
+        'journal_size_limit': 67108864,  # 检查点后WAL文件截断到64MB以内
+    },
+}
+
+# 只对写连接生效的PRAGMA（只读连接不能修改）
+WRITE_ONLY_PRAGMAS = ('journal_mode', 'wal_autocheckpoint', 'journal_size_limit')
+
+# 运行中的数据更新任务每隔 UPDATE_JOB_HEARTBEAT_SECONDS 秒记录一次心跳；
+# 超过 UPDATE_JOB_STALE_SECONDS 秒没有心跳的 running 任务视为所在进程已退出（多进程部署时据此区分其他进程正在运行的任务）
+UPDATE_JOB_HEARTBEAT_SECONDS = 30
+UPDATE_JOB_STALE_SECONDS = 120
+
+
+# 按 (股票, 数据源, 年, 月) 重算月度汇总；conditions 用于追加 AND 条件限定重算范围
+MONTHLY_SUMMARY_REFRESH_SQL = """
+    INSERT OR REPLACE INTO monthly_kline_summary
+    (ts_code, data_source, year, month, total_count, up_count, down_count, sum_up_pct, sum_down_pct)
+    SELECT ts_code, data_source, year, month,
+           COUNT(pct_chg),
+           SUM(CASE WHEN pct_chg > 0 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN pct_chg < 0 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN pct_chg > 0 THEN pct_chg ELSE 0 END),
+           SUM(CASE WHEN pct_chg < 0 THEN pct_chg ELSE 0 END)
+    FROM monthly_kline
+    WHERE data_source IS NOT NULL {conditions}
+    GROUP BY ts_code, data_source, year, month
+"""
+
+# 按股票刷新一段年月范围内的汇总（参数：ts_code, data_source, 起始年月, 结束年月，年月格式为 YYYYMM）
+# 年月条件写成表达式，使查询走 ts_code 索引只扫描单只股票的数据，
+# 而不是走 (year, month) 索引扫描全市场当月数据
+MONTHLY_SUMMARY_STOCK_RANGE_CONDITIONS = "AND ts_code = ? AND data_source = ? AND year * 100 + month BETWEEN ? AND ?"
+
+# 月K线写入的列（data_source 单独传入）
+MONTHLY_KLINE_COLUMNS = ('ts_code', 'trade_date', 'year', 'month', 'open', 'close',
+                         'high', 'low', 'vol', 'amount', 'pct_chg')
+
+# 月K线批量写入：已存在的 (ts_code, trade_date, data_source) 原地更新，不删除重插（id 保持不变）
+MONTHLY_KLINE_UPSERT_SQL = """
+    INSERT INTO monthly_kline
+    (ts_code, trade_date, year, month, open, close, high, low, vol, amount, pct_chg, data_source)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(ts_code, trade_date, data_source) DO UPDATE SET
+        year = excluded.year,
+        month = excluded.month,
+        open = excluded.open,
+        close = excluded.close,
+        high = excluded.high,
+        low = excluded.low,
+        vol = excluded.vol,
+        amount = excluded.amount,
+        pct_chg = excluded.pct_chg
+"""
+
+
+def _stale_before() -> str:
+    """心跳早于该时间（YYYYMMDDHHMMSS）的 running 任务视为已中断"""
+    return (datetime.now() - timedelta(seconds=UPDATE_JOB_STALE_SECONDS)).strftime('%Y%m%d%H%M%S')
+
+
+def read_only_uri(db_path: str) -> str:
+    """数据库文件的只读连接URI（sqlite3.connect(..., uri=True)）"""
+    return f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+
+
+def month_summary_query(month: int, start_year: int = None, end_year: int = None,
+                        data_source: str = None, ts_code: str = None,
+                        industry_name: str = None, industry_type: str = 'sw',
+                        ts_code_range: Tuple[Optional[str], Optional[str]] = None) -> Tuple[str, List]:
+    """
+    构造月度汇总查询（Database.get_month_summary 和统计进程池的工作进程共用）
+    
+    Args:
+        ts_code_range: 股票代码区间 (下界, 上界)，左闭右开，None 表示不限
+    
+    Returns:
+        (SQL, 参数列表)
+    """
+    query = """
+        SELECT ts_code, year, total_count, up_count, down_count, sum_up_pct, sum_down_pct
+        FROM monthly_kline_summary WHERE month = ?
+    """
+    params = [month]
+    
+    if ts_code:
+        query += " AND ts_code = ?"
+        params.append(ts_code)
+    if ts_code_range:
+        lower, upper = ts_code_range
+        if lower is not None:
+            query += " AND ts_code >= ?"
+            params.append(lower)
+        if upper is not None:
+            query += " AND ts_code < ?"
+            params.append(upper)
+    if industry_name:
+        table = 'industry_sw' if industry_type == 'sw' else 'industry_citics'
+        query += f" AND ts_code IN (SELECT ts_code FROM {table} WHERE industry_name = ?)"
+        params.append(industry_name)
+    if start_year:
+        query += " AND year >= ?"
+        params.append(start_year)
+    if end_year:
+        query += " AND year <= ?"
+        params.append(end_year)
+    if data_source:
+        query += " AND data_source = ?"
+        params.append(data_source)
+    
+    query += " ORDER BY ts_code, year"
+    return query, params
 
 
 class Database:
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, options: Dict = None):
         # 支持环境变量指定数据库路径（用于Docker部署）
         if db_path is None:
-            import os
             db_path = os.getenv("DB_PATH", "stock_data.db")
         self.db_path = db_path
+        self.options = dict(DEFAULT_DATABASE_OPTIONS, **(options or {}))
+        profile = DATABASE_PROFILES.get(self.options['profile'], {})
+        self.pragmas = dict(profile, **(self.options.get('pragmas') or {}))
+        self.pool = ConnectionPool(
+            db_path,
+            pool_size=self.options['pool_size'],
+            busy_timeout=self.options['busy_timeout'],
+            pre_ping=self.options['pool_pre_ping'],
+            recycle_seconds=self.options['pool_recycle_seconds'],
+            on_connect=self._configure_connection,
+            max_connections=self.options['max_connections'],
+            timeout=self.options['pool_timeout']
+        )
         self.init_database()
-    
-    def get_connection(self):
-        """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
-    
-    def init_database(self):
-        """初始化数据库表结构"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 股票基本信息表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS stocks (
-                ts_code TEXT PRIMARY KEY,
-                symbol TEXT NOT NULL,
-                name TEXT NOT NULL,
-                area TEXT,
-                industry TEXT,
-                list_date TEXT,
-                delist_date TEXT,
-                is_hs TEXT,
-                exchange TEXT
-            )
-        """)
-        
-        # 行业分类表（申万）
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS industry_sw (
-                ts_code TEXT,
-                industry_name TEXT,
-                level TEXT,
-                parent_code TEXT,
-                PRIMARY KEY (ts_code, industry_name)
-            )
-        """)
         
-        # 行业分类表（中信）
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS industry_citics (
-                ts_code TEXT,
-                industry_name TEXT,
-                level TEXT,
-                parent_code TEXT,
-                PRIMARY KEY (ts_code, industry_name)
-            )
-        """)
+        # 月K线内存列存储（启用时由 KlineStore 注册，写入和删除月K线后通知它刷新）
+        self.kline_store = None
         
-        # 用户表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL DEFAULT 'user',
-                is_active INTEGER NOT NULL DEFAULT 1,
-                valid_until TEXT,
-                created_at TEXT NOT NULL,
-                updated_at TEXT
-            )
-        """)
+        # 会话缓存（由 AuthManager 注册），修改用户、权限或删除会话后使对应的缓存失效
+        self.session_cache = None
         
-        # 会话表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                session_id TEXT PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                expires_at TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        """)
+        # 只读连接池（查询接口使用；数据库文件创建之后才能以只读方式打开）
+        self.read_pool = ConnectionPool(
+            read_only_uri(db_path),
+            pool_size=self.options['read_pool_size'],
+            busy_timeout=self.options['busy_timeout'],
+            pre_ping=self.options['pool_pre_ping'],
+            recycle_seconds=self.options['pool_recycle_seconds'],
+            on_connect=self._configure_read_connection,
+            uri=True,
+            max_connections=self.options['max_connections'],
+            timeout=self.options['pool_timeout']
+        )
+    
+    def _configure_connection(self, conn: sqlite3.Connection):
+        """为新建的写连接设置PRAGMA（journal_mode 在 init_database 中设置）"""
+        for name, value in self.pragmas.items():
+            if name != 'journal_mode':
+                conn.execute(f"PRAGMA {name} = {value}")
+    
+    def _configure_read_connection(self, conn: sqlite3.Connection):
+        """为新建的只读连接设置PRAGMA"""
+        for name, value in self.pragmas.items():
+            if name not in WRITE_ONLY_PRAGMAS:
+                conn.execute(f"PRAGMA {name} = {value}")
+        conn.execute("PRAGMA query_only = 1")
+    
+    def bump_data_version(self, conn: sqlite3.Connection = None):
+        """
+        数据版本加一，使之前缓存的统计结果失效
         
-        # 系统配置表（用于存储会话时长等系统配置）
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS system_config (
-                key TEXT PRIMARY KEY,
-                value TEXT NOT NULL,
-                updated_at TEXT
-            )
-        """)
+        传入写连接时在该连接当前的事务中更新，与数据写入一起提交；版本保存在数据库中，多个服务进程看到同一个版本
+        """
+        self._bump_version('data_version', conn)
+    
+    @property
+    def data_version(self) -> int:
+        """当前数据版本：股票列表、月K线、行业分类每次写入时加一（统计结果缓存的键包含该版本）"""
+        return self._read_version('data_version')
+    
+    def bump_auth_version(self, conn: sqlite3.Connection = None):
+        """认证版本加一（修改用户、权限或删除会话时调用），使所有服务进程中缓存的会话失效"""
+        self._bump_version('auth_version', conn)
+    
+    @property
+    def auth_version(self) -> int:
+        """当前认证版本（会话缓存据此判断其他进程是否修改过用户、权限或会话）"""
+        return self._read_version('auth_version')
+    
+    def _bump_version(self, table: str, conn: sqlite3.Connection = None):
+        if conn is not None:
+            conn.execute(f"UPDATE {table} SET version = version + 1 WHERE id = 1")
+            return
+        with self.transaction() as conn:
+            conn.execute(f"UPDATE {table} SET version = version + 1 WHERE id = 1")
+    
+    def _read_version(self, table: str) -> int:
+        with self.read_connection() as conn:
+            row = conn.execute(f"SELECT version FROM {table} WHERE id = 1").fetchone()
+        return row[0] if row else 0
+    
+    def get_connection(self):
+        """获取数据库连接（从连接池取出，close() 时归还连接池）"""
+        return self.pool.acquire()
+    
+    def get_read_connection(self):
+        """获取只读数据库连接（WAL模式下查询不会被后台写入阻塞）"""
+        return self.read_pool.acquire()
+    
+    @contextmanager
+    def connection(self):
+        """连接上下文：退出时自动归还连接池"""
+        conn = self.get_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    @contextmanager
+    def read_connection(self):
+        """只读连接上下文：退出时自动归还只读连接池"""
+        conn = self.get_read_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    @contextmanager
+    def transaction(self):
+        """事务上下文：正常退出时提交，出现异常时回滚，连接自动归还连接池"""
+        conn = self.get_connection()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def close(self):
+        """关闭连接池中的所有连接"""
+        self.pool.close_all()
+        if hasattr(self, 'read_pool'):
+            self.read_pool.close_all()
+    
+    def checkpoint(self, mode: str = 'TRUNCATE') -> Optional[Dict]:
+        """
+        执行WAL检查点：把WAL中的内容写回数据库文件（非WAL模式返回None）
         
-        # 用户权限表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_permissions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                permission_code TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                UNIQUE(user_id, permission_code)
-            )
-        """)
+        Args:
+            mode: PASSIVE / FULL / RESTART / TRUNCATE（TRUNCATE 会把WAL文件截断为0）
         
-        # 初始化默认管理员账号（如果不存在）
-        cursor.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'")
-        if cursor.fetchone()[0] == 0:
-            import bcrypt
-            password_hash = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        Returns:
+            {'busy': 是否因读写占用未完成, 'log_frames': WAL帧数, 'checkpointed_frames': 已写回帧数}
+        """
+        with self.connection() as conn:
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            if str(journal_mode).lower() != 'wal':
+                return None
+            busy, log_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        return {'busy': bool(busy), 'log_frames': log_frames, 'checkpointed_frames': checkpointed}
+    
+    def init_database(self):
+        """初始化数据库表结构"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            # 日志模式是持久化到数据库文件的设置，只需在初始化时设置一次
+            if 'journal_mode' in self.pragmas:
+                cursor.execute(f"PRAGMA journal_mode = {self.pragmas['journal_mode']}")
+            
+            # 股票基本信息表
             cursor.execute("""
-                INSERT INTO users (username, password_hash, role, is_active, created_at)
-                VALUES (?, ?, ?, ?, ?)
-            """, ('admin', password_hash, 'admin', 1, datetime.now().strftime('%Y%m%d%H%M%S')))
-        
-        # 初始化系统配置（会话时长，默认24小时）
-        cursor.execute("SELECT COUNT(*) FROM system_config WHERE key = 'session_duration_hours'")
-        if cursor.fetchone()[0] == 0:
+                CREATE TABLE IF NOT EXISTS stocks (
+                    ts_code TEXT PRIMARY KEY,
+                    symbol TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    area TEXT,
+                    industry TEXT,
+                    list_date TEXT,
+                    delist_date TEXT,
+                    is_hs TEXT,
+                    exchange TEXT
+                )
+            """)
+            
+            # 行业分类表（申万）
             cursor.execute("""
-                INSERT INTO system_config (key, value, updated_at)
-                VALUES (?, ?, ?)
-            """, ('session_duration_hours', '24', datetime.now().strftime('%Y%m%d%H%M%S')))
-        
-        # 提交所有更改
-        conn.commit()
-        
-        # 月K线数据表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS monthly_kline (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ts_code TEXT NOT NULL,
-                trade_date TEXT NOT NULL,
-                year INTEGER NOT NULL,
-                month INTEGER NOT NULL,
-                open REAL,
-                close REAL,
-                high REAL,
-                low REAL,
-                vol REAL,
-                amount REAL,
-                pct_chg REAL,
-                data_source TEXT DEFAULT 'akshare',
-                UNIQUE(ts_code, trade_date, data_source)
-            )
-        """)
-        
-        # 检查表结构和约束
-        cursor.execute("PRAGMA table_info(monthly_kline)")
-        columns = [col[1] for col in cursor.fetchall()]
-        
-        # 检查表定义中的UNIQUE约束
-        cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='monthly_kline'")
-        table_sql = cursor.fetchone()
-        has_old_constraint = False
-        if table_sql and 'UNIQUE(ts_code, trade_date)' in table_sql[0] and 'UNIQUE(ts_code, trade_date, data_source)' not in table_sql[0]:
-            has_old_constraint = True
-        
-        if 'data_source' not in columns or has_old_constraint:
-            # 需要重建表
-            print("检测到旧的表结构，正在重建表以支持多数据源...")
+                CREATE TABLE IF NOT EXISTS industry_sw (
+                    ts_code TEXT,
+                    industry_name TEXT,
+                    level TEXT,
+                    parent_code TEXT,
+                    PRIMARY KEY (ts_code, industry_name)
+                )
+            """)
+            
+            # 行业分类表（中信）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS industry_citics (
+                    ts_code TEXT,
+                    industry_name TEXT,
+                    level TEXT,
+                    parent_code TEXT,
+                    PRIMARY KEY (ts_code, industry_name)
+                )
+            """)
+            
+            # 用户表
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE NOT NULL,
+                    password_hash TEXT NOT NULL,
+                    role TEXT NOT NULL DEFAULT 'user',
+                    is_active INTEGER NOT NULL DEFAULT 1,
+                    valid_until TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT
+                )
+            """)
+            
+            # 会话表
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    expires_at TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES users(id)
+                )
+            """)
+            
+            # 系统配置表（用于存储会话时长等系统配置）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS system_config (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at TEXT
+                )
+            """)
+            
+            # 用户权限表
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS user_permissions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    permission_code TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES users(id),
+                    UNIQUE(user_id, permission_code)
+                )
+            """)
+            
+            # 初始化默认管理员账号（如果不存在）
+            cursor.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'")
+            if cursor.fetchone()[0] == 0:
+                import bcrypt
+                password_hash = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                cursor.execute("""
+                    INSERT INTO users (username, password_hash, role, is_active, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, ('admin', password_hash, 'admin', 1, datetime.now().strftime('%Y%m%d%H%M%S')))
             
-            # 备份数据
-            cursor.execute("SELECT * FROM monthly_kline")
-            old_data = cursor.fetchall()
-            old_columns = [desc[0] for desc in cursor.description]
+            # 初始化系统配置（会话时长，默认24小时）
+            cursor.execute("SELECT COUNT(*) FROM system_config WHERE key = 'session_duration_hours'")
+            if cursor.fetchone()[0] == 0:
+                cursor.execute("""
+                    INSERT INTO system_config (key, value, updated_at)
+                    VALUES (?, ?, ?)
+                """, ('session_duration_hours', '24', datetime.now().strftime('%Y%m%d%H%M%S')))
             
-            # 删除旧表
-            cursor.execute("DROP TABLE IF EXISTS monthly_kline")
+            # 提交所有更改
+            conn.commit()
             
-            # 创建新表
+            # 月K线数据表
             cursor.execute("""
-                CREATE TABLE monthly_kline (
+                CREATE TABLE IF NOT EXISTS monthly_kline (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     ts_code TEXT NOT NULL,
                     trade_date TEXT NOT NULL,
@@ -193,102 +431,402 @@ class Database:
                 )
             """)
             
-            # 恢复数据（如果有data_source字段则使用，否则默认为akshare）
-            if old_data:
-                data_source_col_idx = old_columns.index('data_source') if 'data_source' in old_columns else None
-                for row in old_data:
-                    data_source = row[data_source_col_idx] if data_source_col_idx is not None and row[data_source_col_idx] else 'akshare'
-                    cursor.execute("""
-                        INSERT INTO monthly_kline 
-                        (ts_code, trade_date, year, month, open, close, high, low, vol, amount, pct_chg, data_source)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        row[old_columns.index('ts_code')],
-                        row[old_columns.index('trade_date')],
-                        row[old_columns.index('year')],
-                        row[old_columns.index('month')],
-                        row[old_columns.index('open')],
-                        row[old_columns.index('close')],
-                        row[old_columns.index('high')],
-                        row[old_columns.index('low')],
-                        row[old_columns.index('vol')],
-                        row[old_columns.index('amount')],
-                        row[old_columns.index('pct_chg')],
-                        data_source
-                    ))
-            
-            print("✓ 表重建完成")
-        else:
-            # 如果字段已存在，确保有唯一索引
-            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_monthly_kline_unique ON monthly_kline(ts_code, trade_date, data_source)")
-        
-        # 创建索引
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_monthly_kline_code ON monthly_kline(ts_code)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_monthly_kline_date ON monthly_kline(trade_date)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_monthly_kline_year_month ON monthly_kline(year, month)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stocks_delist ON stocks(delist_date)")
-        
-        conn.commit()
-        conn.close()
+            # 检查表结构和约束
+            cursor.execute("PRAGMA table_info(monthly_kline)")
+            columns = [col[1] for col in cursor.fetchall()]
+            
+            # 检查表定义中的UNIQUE约束
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='monthly_kline'")
+            table_sql = cursor.fetchone()
+            has_old_constraint = False
+            if table_sql and 'UNIQUE(ts_code, trade_date)' in table_sql[0] and 'UNIQUE(ts_code, trade_date, data_source)' not in table_sql[0]:
+                has_old_constraint = True
+            
+            if 'data_source' not in columns or has_old_constraint:
+                # 需要重建表
+                print("检测到旧的表结构，正在重建表以支持多数据源...")
+                
+                # 备份数据
+                cursor.execute("SELECT * FROM monthly_kline")
+                old_data = cursor.fetchall()
+                old_columns = [desc[0] for desc in cursor.description]
+                
+                # 删除旧表
+                cursor.execute("DROP TABLE IF EXISTS monthly_kline")
+                
+                # 创建新表
+                cursor.execute("""
+                    CREATE TABLE monthly_kline (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        ts_code TEXT NOT NULL,
+                        trade_date TEXT NOT NULL,
+                        year INTEGER NOT NULL,
+                        month INTEGER NOT NULL,
+                        open REAL,
+                        close REAL,
+                        high REAL,
+                        low REAL,
+                        vol REAL,
+                        amount REAL,
+                        pct_chg REAL,
+                        data_source TEXT DEFAULT 'akshare',
+                        UNIQUE(ts_code, trade_date, data_source)
+                    )
+                """)
+                
+                # 恢复数据（如果有data_source字段则使用，否则默认为akshare）
+                if old_data:
+                    data_source_col_idx = old_columns.index('data_source') if 'data_source' in old_columns else None
+                    for row in old_data:
+                        data_source = row[data_source_col_idx] if data_source_col_idx is not None and row[data_source_col_idx] else 'akshare'
+                        cursor.execute("""
+                            INSERT INTO monthly_kline 
+                            (ts_code, trade_date, year, month, open, close, high, low, vol, amount, pct_chg, data_source)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """, (
+                            row[old_columns.index('ts_code')],
+                            row[old_columns.index('trade_date')],
+                            row[old_columns.index('year')],
+                            row[old_columns.index('month')],
+                            row[old_columns.index('open')],
+                            row[old_columns.index('close')],
+                            row[old_columns.index('high')],
+                            row[old_columns.index('low')],
+                            row[old_columns.index('vol')],
+                            row[old_columns.index('amount')],
+                            row[old_columns.index('pct_chg')],
+                            data_source
+                        ))
+                
+                print("✓ 表重建完成")
+            else:
+                # 如果字段已存在，确保有唯一索引
+                cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_monthly_kline_unique ON monthly_kline(ts_code, trade_date, data_source)")
+            
+            # 创建索引
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_monthly_kline_code ON monthly_kline(ts_code)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_monthly_kline_date ON monthly_kline(trade_date)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_monthly_kline_year_month ON monthly_kline(year, month)")
+            # 按数据源取每只股票最新交易日期（GROUP BY 直接在索引上完成）
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_monthly_kline_source_code_date ON monthly_kline(data_source, ts_code, trade_date)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_stocks_delist ON stocks(delist_date)")
+            
+            # 月度涨跌汇总表（按 股票/数据源/年/月 预聚合，统计查询只需累加少量汇总行）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS monthly_kline_summary (
+                    ts_code TEXT NOT NULL,
+                    data_source TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    month INTEGER NOT NULL,
+                    total_count INTEGER NOT NULL DEFAULT 0,
+                    up_count INTEGER NOT NULL DEFAULT 0,
+                    down_count INTEGER NOT NULL DEFAULT 0,
+                    sum_up_pct REAL NOT NULL DEFAULT 0,
+                    sum_down_pct REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (ts_code, data_source, year, month)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_monthly_kline_summary_month ON monthly_kline_summary(data_source, month, ts_code, year)")
+            
+            # 已有K线数据但汇总表为空（旧版本数据库），一次性回填汇总表
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM monthly_kline_summary)")
+            summary_empty = cursor.fetchone()[0] == 0
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM monthly_kline)")
+            kline_exists = cursor.fetchone()[0] == 1
+            if summary_empty and kline_exists:
+                print("正在生成月度涨跌汇总表...")
+                cursor.execute(MONTHLY_SUMMARY_REFRESH_SQL.format(conditions=""))
+                print("✓ 汇总表生成完成")
+            
+            # 数据更新任务表（进程重启后可从未完成的股票继续）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS update_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_type TEXT NOT NULL,
+                    mode TEXT,
+                    data_source TEXT NOT NULL,
+                    start_year INTEGER,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    created_at TEXT,
+                    updated_at TEXT,
+                    finished_at TEXT,
+                    heartbeat_at TEXT
+                )
+            """)
+            cursor.execute("PRAGMA table_info(update_jobs)")
+            if 'heartbeat_at' not in [col[1] for col in cursor.fetchall()]:
+                cursor.execute("ALTER TABLE update_jobs ADD COLUMN heartbeat_at TEXT")
+            
+            # 数据更新任务明细（每只股票一行）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS update_job_items (
+                    job_id INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    ts_code TEXT NOT NULL,
+                    name TEXT,
+                    start_date TEXT,
+                    end_date TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    retry_count INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    updated_at TEXT,
+                    PRIMARY KEY (job_id, ts_code)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_update_job_items_status ON update_job_items(job_id, status, seq)")
+            
+            # 数据版本和认证版本（各一行）：多个服务进程共享，分别用于统计结果缓存和会话缓存失效
+            for table in ('data_version', 'auth_version'):
+                cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        version INTEGER NOT NULL
+                    )
+                """)
+                cursor.execute(f"INSERT OR IGNORE INTO {table} (id, version) VALUES (1, 0)")
+            
+            conn.commit()
     
     def save_stocks(self, stocks_df: pd.DataFrame):
         """保存股票基本信息"""
-        conn = self.get_connection()
-        stocks_df.to_sql('stocks', conn, if_exists='replace', index=False)
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            stocks_df.to_sql('stocks', conn, if_exists='replace', index=False)
+            self.bump_data_version(conn)
+            conn.commit()
     
     def save_monthly_kline(self, kline_df: pd.DataFrame, data_source: str = 'akshare'):
-        """保存月K线数据（使用INSERT OR REPLACE避免重复，支持多数据源）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """保存月K线数据（重复数据原地更新，支持多数据源），并同步刷新月度汇总"""
+        self.save_monthly_kline_batch([kline_df], data_source=data_source)
+    
+    def save_monthly_kline_batch(self, kline_dfs: List[pd.DataFrame], data_source: str = 'akshare') -> int:
+        """
+        批量保存多只股票的月K线数据（同一事务内写入，只提交一次），并同步刷新月度汇总
         
-        for idx, row in kline_df.iterrows():
-            cursor.execute("""
-                INSERT OR REPLACE INTO monthly_kline 
-                (ts_code, trade_date, year, month, open, close, high, low, vol, amount, pct_chg, data_source)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                row.get('ts_code'),
-                row.get('trade_date'),
-                row.get('year'),
-                row.get('month'),
-                row.get('open'),
-                row.get('close'),
-                row.get('high'),
-                row.get('low'),
-                row.get('vol'),
-                row.get('amount'),
-                row.get('pct_chg'),
-                data_source
-            ))
+        Args:
+            kline_dfs: 月K线 DataFrame 列表（通常每只股票一个）
+            data_source: 数据源
+        
+        Returns:
+            写入的行数
+        """
+        kline_dfs = [df for df in kline_dfs if df is not None and not df.empty]
+        if not kline_dfs:
+            return 0
+        kline_df = pd.concat(kline_dfs, ignore_index=True) if len(kline_dfs) > 1 else kline_dfs[0]
         
-        conn.commit()
-        conn.close()
+        # 按列一次性转换为Python原生类型（缺失的列写入NULL），不再逐行 iterrows
+        rows = len(kline_df)
+        columns = [kline_df[col].tolist() if col in kline_df.columns else [None] * rows
+                   for col in MONTHLY_KLINE_COLUMNS]
+        columns.append([data_source] * rows)
+        
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(MONTHLY_KLINE_UPSERT_SQL, zip(*columns))
+            
+            # 只重算本次写入涉及的汇总行：每只股票一条语句，覆盖其写入的年月范围
+            if {'ts_code', 'year', 'month'}.issubset(kline_df.columns):
+                year_months = kline_df['year'].astype('int64') * 100 + kline_df['month'].astype('int64')
+                ranges = year_months.groupby(kline_df['ts_code'], sort=False).agg(['min', 'max'])
+                cursor.executemany(
+                    MONTHLY_SUMMARY_REFRESH_SQL.format(conditions=MONTHLY_SUMMARY_STOCK_RANGE_CONDITIONS),
+                    [(ts_code, data_source, int(first), int(last))
+                     for ts_code, first, last in ranges.itertuples()]
+                )
+            self.bump_data_version(conn)
+        if self.kline_store is not None and 'ts_code' in kline_df.columns:
+            self.kline_store.mark_dirty(data_source, kline_df['ts_code'].unique())
+        return rows
     
     def delete_monthly_kline_by_source(self, data_source: str):
-        """删除指定数据源的所有月K线数据"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM monthly_kline WHERE data_source = ?", (data_source,))
-        deleted_count = cursor.rowcount
-        conn.commit()
-        conn.close()
+        """删除指定数据源的所有月K线数据（同时清除对应的月度汇总）"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM monthly_kline WHERE data_source = ?", (data_source,))
+            deleted_count = cursor.rowcount
+            cursor.execute("DELETE FROM monthly_kline_summary WHERE data_source = ?", (data_source,))
+            self.bump_data_version(conn)
+            conn.commit()
+        if self.kline_store is not None:
+            self.kline_store.invalidate(data_source)
         return deleted_count
     
+    def rebuild_monthly_kline_summary(self, data_source: str = None):
+        """从月K线数据全量重建月度汇总表（可只重建指定数据源）"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            if data_source:
+                cursor.execute("DELETE FROM monthly_kline_summary WHERE data_source = ?", (data_source,))
+                cursor.execute(MONTHLY_SUMMARY_REFRESH_SQL.format(conditions="AND data_source = ?"), (data_source,))
+            else:
+                cursor.execute("DELETE FROM monthly_kline_summary")
+                cursor.execute(MONTHLY_SUMMARY_REFRESH_SQL.format(conditions=""))
+            self.bump_data_version(conn)
+            conn.commit()
+    
+    # ========== 数据更新任务 ==========
+    
+    def create_update_job(self, job_type: str, mode: str, data_source: str, tasks: List[Dict],
+                          start_year: int = None, keep_jobs: int = 10) -> int:
+        """
+        创建数据更新任务并记录每只股票的待更新区间
+        
+        同一数据源之前未完成的任务标记为 abandoned，只保留最近 keep_jobs 个任务的明细
+        
+        Args:
+            job_type: full / incremental
+            mode: overwrite / supplement / incremental
+            data_source: 数据源
+            tasks: 任务列表，每项包含 ts_code, name, start_date, end_date
+            start_year: 全量更新的起始年份
+        
+        Returns:
+            任务ID
+        """
+        now = datetime.now().strftime('%Y%m%d%H%M%S')
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE update_jobs SET status = 'abandoned', updated_at = ?
+                WHERE data_source = ? AND status IN ('running', 'interrupted')
+            """, (now, data_source))
+            cursor.execute("""
+                INSERT INTO update_jobs (job_type, mode, data_source, start_year, status, created_at, updated_at,
+                                         heartbeat_at)
+                VALUES (?, ?, ?, ?, 'running', ?, ?, ?)
+            """, (job_type, mode, data_source, start_year, now, now, now))
+            job_id = cursor.lastrowid
+            cursor.executemany("""
+                INSERT INTO update_job_items (job_id, seq, ts_code, name, start_date, end_date, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(job_id, seq, task['ts_code'], task.get('name'), task['start_date'], task['end_date'], now)
+                  for seq, task in enumerate(tasks)])
+            cursor.execute("""
+                DELETE FROM update_job_items WHERE job_id IN (
+                    SELECT id FROM update_jobs WHERE id <= ? - ?
+                )
+            """, (job_id, keep_jobs))
+            cursor.execute("DELETE FROM update_jobs WHERE id <= ? - ?", (job_id, keep_jobs))
+        return job_id
+    
+    def get_update_job(self, job_id: int) -> Optional[Dict]:
+        """获取数据更新任务（含各状态的股票数）"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, job_type, mode, data_source, start_year, status, created_at, updated_at, finished_at,
+                       heartbeat_at
+                FROM update_jobs WHERE id = ?
+            """, (job_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            job = dict(zip(['id', 'job_type', 'mode', 'data_source', 'start_year', 'status',
+                            'created_at', 'updated_at', 'finished_at', 'heartbeat_at'], row))
+            cursor.execute("""
+                SELECT status, COUNT(*) FROM update_job_items WHERE job_id = ? GROUP BY status
+            """, (job_id,))
+            counts = dict(cursor.fetchall())
+        job['pending_count'] = counts.get('pending', 0)
+        job['done_count'] = counts.get('done', 0)
+        job['failed_count'] = counts.get('failed', 0)
+        job['total_count'] = sum(counts.values())
+        # running 且心跳未过期：任务正在某个进程中运行（不能继续，也不会被标记为中断）
+        job['active'] = job['status'] == 'running' and (job['heartbeat_at'] or '') >= _stale_before()
+        return job
+    
+    def get_resumable_update_job(self, data_source: str = None) -> Optional[Dict]:
+        """获取最近一个未完成（running/interrupted）的数据更新任务"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            query = "SELECT id FROM update_jobs WHERE status IN ('running', 'interrupted')"
+            params = []
+            if data_source:
+                query += " AND data_source = ?"
+                params.append(data_source)
+            cursor.execute(query + " ORDER BY id DESC LIMIT 1", params)
+            row = cursor.fetchone()
+        return self.get_update_job(row[0]) if row else None
+    
+    def get_update_job_tasks(self, job_id: int, status: str = 'pending') -> List[Dict]:
+        """按原始顺序获取任务中指定状态的股票"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT ts_code, name, start_date, end_date, retry_count
+                FROM update_job_items
+                WHERE job_id = ? AND status = ?
+                ORDER BY seq
+            """, (job_id, status))
+            rows = cursor.fetchall()
+        return [{'ts_code': ts_code, 'name': name, 'start_date': start_date, 'end_date': end_date,
+                 'retry_count': retry_count}
+                for ts_code, name, start_date, end_date, retry_count in rows]
+    
+    def record_update_job_results(self, job_id: int, results: List[Tuple[str, Optional[str]]]):
+        """
+        记录一批股票的更新结果
+        
+        Args:
+            results: [(ts_code, error_msg)]，error_msg 为 None 表示数据已写入，否则记为失败并累加重试次数
+        """
+        if not results:
+            return
+        now = datetime.now().strftime('%Y%m%d%H%M%S')
+        with self.transaction() as conn:
+            conn.executemany("""
+                UPDATE update_job_items
+                SET status = CASE WHEN ? IS NULL THEN 'done' ELSE 'failed' END,
+                    retry_count = retry_count + (CASE WHEN ? IS NULL THEN 0 ELSE 1 END),
+                    last_error = ?,
+                    updated_at = ?
+                WHERE job_id = ? AND ts_code = ?
+            """, [(error, error, error, now, job_id, ts_code) for ts_code, error in results])
+            conn.execute("UPDATE update_jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+    
+    def set_update_job_status(self, job_id: int, status: str):
+        """设置数据更新任务状态（completed/interrupted/...；设为 running 时同时记录心跳）"""
+        now = datetime.now().strftime('%Y%m%d%H%M%S')
+        finished_at = now if status == 'completed' else None
+        with self.transaction() as conn:
+            conn.execute("""
+                UPDATE update_jobs SET status = ?, updated_at = ?, finished_at = ?,
+                    heartbeat_at = CASE WHEN ? = 'running' THEN ? ELSE heartbeat_at END
+                WHERE id = ?
+            """, (status, now, finished_at, status, now, job_id))
+    
+    def heartbeat_update_job(self, job_id: int):
+        """记录运行中任务的心跳（由执行任务的进程定期调用）"""
+        now = datetime.now().strftime('%Y%m%d%H%M%S')
+        with self.transaction() as conn:
+            conn.execute("UPDATE update_jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'", (now, job_id))
+    
+    def interrupt_running_update_jobs(self) -> int:
+        """
+        把心跳已过期的 running 任务标记为 interrupted（执行任务的进程已退出，之后可继续）
+        
+        其他进程中正在运行的任务会定期记录心跳，不受影响，因此每个服务进程启动时都可以调用
+        """
+        now = datetime.now().strftime('%Y%m%d%H%M%S')
+        with self.transaction() as conn:
+            cursor = conn.execute("""
+                UPDATE update_jobs SET status = 'interrupted', updated_at = ?
+                WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+            """, (now, _stale_before()))
+            return cursor.rowcount
+    
     # ========== 用户和权限管理方法 ==========
     
     def get_user_by_username(self, username: str) -> Optional[Dict]:
         """根据用户名获取用户信息"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, username, password_hash, role, is_active, valid_until, created_at
-            FROM users
-            WHERE username = ?
-        """, (username,))
-        row = cursor.fetchone()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, username, password_hash, role, is_active, valid_until, created_at
+                FROM users
+                WHERE username = ?
+            """, (username,))
+            row = cursor.fetchone()
         
         if row:
             return {
@@ -304,15 +842,12 @@ class Database:
     
     def get_user_by_id(self, user_id: int) -> Optional[Dict]:
         """根据ID获取用户信息"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, username, password_hash, role, is_active, valid_until, created_at
-            FROM users
-            WHERE id = ?
-        """, (user_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with self.connection() as conn:
+            row = conn.execute("""
+                SELECT id, username, password_hash, role, is_active, valid_until, created_at
+                FROM users
+                WHERE id = ?
+            """, (user_id,)).fetchone()
         
         if row:
             return {
@@ -330,128 +865,127 @@ class Database:
         """创建用户"""
         import bcrypt
         password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("""
-                INSERT INTO users (username, password_hash, role, is_active, valid_until, created_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (username, password_hash, role, 1, valid_until, datetime.now().strftime('%Y%m%d%H%M%S')))
-            user_id = cursor.lastrowid
-            conn.commit()
-            return user_id
-        except sqlite3.IntegrityError:
-            raise ValueError(f"用户名 {username} 已存在")
-        finally:
-            conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    INSERT INTO users (username, password_hash, role, is_active, valid_until, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (username, password_hash, role, 1, valid_until, datetime.now().strftime('%Y%m%d%H%M%S')))
+                user_id = cursor.lastrowid
+                conn.commit()
+                return user_id
+            except sqlite3.IntegrityError:
+                raise ValueError(f"用户名 {username} 已存在")
     
     def update_user(self, user_id: int, username: str = None, password: str = None, 
                    role: str = None, is_active: bool = None, valid_until: str = None):
         """更新用户信息"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        updates = []
-        params = []
-        
-        if username is not None:
-            updates.append("username = ?")
-            params.append(username)
-        if password is not None:
-            import bcrypt
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            updates.append("password_hash = ?")
-            params.append(password_hash)
-        if role is not None:
-            updates.append("role = ?")
-            params.append(role)
-        if is_active is not None:
-            updates.append("is_active = ?")
-            params.append(1 if is_active else 0)
-        if valid_until is not None:
-            updates.append("valid_until = ?")
-            params.append(valid_until)
-        
-        if updates:
-            updates.append("updated_at = ?")
-            params.append(datetime.now().strftime('%Y%m%d%H%M%S'))
-            params.append(user_id)
+        with self.connection() as conn:
+            cursor = conn.cursor()
             
-            cursor.execute(f"""
-                UPDATE users
-                SET {', '.join(updates)}
-                WHERE id = ?
-            """, params)
-            conn.commit()
-        
-        conn.close()
+            updates = []
+            params = []
+            
+            if username is not None:
+                updates.append("username = ?")
+                params.append(username)
+            if password is not None:
+                import bcrypt
+                password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                updates.append("password_hash = ?")
+                params.append(password_hash)
+            if role is not None:
+                updates.append("role = ?")
+                params.append(role)
+            if is_active is not None:
+                updates.append("is_active = ?")
+                params.append(1 if is_active else 0)
+            if valid_until is not None:
+                updates.append("valid_until = ?")
+                params.append(valid_until)
+            
+            if updates:
+                updates.append("updated_at = ?")
+                params.append(datetime.now().strftime('%Y%m%d%H%M%S'))
+                params.append(user_id)
+                
+                cursor.execute(f"""
+                    UPDATE users
+                    SET {', '.join(updates)}
+                    WHERE id = ?
+                """, params)
+                self.bump_auth_version(conn)
+                conn.commit()
+            
+        if self.session_cache is not None:
+            self.session_cache.invalidate_user(user_id)
     
     def delete_user(self, user_id: int):
         """删除用户"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-        cursor.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            cursor.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+            self.bump_auth_version(conn)
+            conn.commit()
+        if self.session_cache is not None:
+            self.session_cache.invalidate_user(user_id)
     
     def get_all_users(self) -> List[Dict]:
         """获取所有用户列表"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, username, role, is_active, valid_until, created_at
-            FROM users
-            ORDER BY created_at DESC
-        """)
-        users = []
-        for row in cursor.fetchall():
-            users.append({
-                'id': row[0],
-                'username': row[1],
-                'role': row[2],
-                'is_active': bool(row[3]),
-                'valid_until': row[4],
-                'created_at': row[5]
-            })
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, username, role, is_active, valid_until, created_at
+                FROM users
+                ORDER BY created_at DESC
+            """)
+            users = []
+            for row in cursor.fetchall():
+                users.append({
+                    'id': row[0],
+                    'username': row[1],
+                    'role': row[2],
+                    'is_active': bool(row[3]),
+                    'valid_until': row[4],
+                    'created_at': row[5]
+                })
         return users
     
     def create_session(self, user_id: int, session_id: str, expires_at: str) -> bool:
         """创建会话"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("""
-                INSERT INTO sessions (session_id, user_id, expires_at, created_at)
-                VALUES (?, ?, ?, ?)
-            """, (session_id, user_id, expires_at, datetime.now().strftime('%Y%m%d%H%M%S')))
-            conn.commit()
-            return True
-        except sqlite3.IntegrityError:
-            # 如果session_id已存在，更新它
-            cursor.execute("""
-                UPDATE sessions
-                SET user_id = ?, expires_at = ?, created_at = ?
-                WHERE session_id = ?
-            """, (user_id, expires_at, datetime.now().strftime('%Y%m%d%H%M%S'), session_id))
-            conn.commit()
-            return True
-        finally:
-            conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    INSERT INTO sessions (session_id, user_id, expires_at, created_at)
+                    VALUES (?, ?, ?, ?)
+                """, (session_id, user_id, expires_at, datetime.now().strftime('%Y%m%d%H%M%S')))
+                conn.commit()
+                return True
+            except sqlite3.IntegrityError:
+                # 如果session_id已存在，更新它
+                cursor.execute("""
+                    UPDATE sessions
+                    SET user_id = ?, expires_at = ?, created_at = ?
+                    WHERE session_id = ?
+                """, (user_id, expires_at, datetime.now().strftime('%Y%m%d%H%M%S'), session_id))
+                self.bump_auth_version(conn)
+                conn.commit()
+                if self.session_cache is not None:
+                    self.session_cache.invalidate_session(session_id)
+                return True
     
     def get_session(self, session_id: str) -> Optional[Dict]:
         """获取会话信息"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT s.session_id, s.user_id, s.expires_at, u.username, u.role, u.is_active
-            FROM sessions s
-            JOIN users u ON s.user_id = u.id
-            WHERE s.session_id = ?
-        """, (session_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with self.connection() as conn:
+            row = conn.execute("""
+                SELECT s.session_id, s.user_id, s.expires_at, u.username, u.role, u.is_active
+                FROM sessions s
+                JOIN users u ON s.user_id = u.id
+                WHERE s.session_id = ?
+            """, (session_id,)).fetchone()
         
         if row:
             expires_at = datetime.strptime(row[2], '%Y%m%d%H%M%S')
@@ -472,159 +1006,155 @@ class Database:
     
     def delete_session(self, session_id: str):
         """删除会话"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self.bump_auth_version(conn)
+            conn.commit()
+        if self.session_cache is not None:
+            self.session_cache.invalidate_session(session_id)
     
     def cleanup_expired_sessions(self):
         """清理过期会话"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        current_time = datetime.now().strftime('%Y%m%d%H%M%S')
-        cursor.execute("DELETE FROM sessions WHERE expires_at < ?", (current_time,))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            current_time = datetime.now().strftime('%Y%m%d%H%M%S')
+            cursor.execute("DELETE FROM sessions WHERE expires_at < ?", (current_time,))
+            conn.commit()
     
     def get_system_config(self, key: str, default: str = None) -> Optional[str]:
         """获取系统配置"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT value FROM system_config WHERE key = ?", (key,))
-        row = cursor.fetchone()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM system_config WHERE key = ?", (key,))
+            row = cursor.fetchone()
         return row[0] if row else default
     
     def set_system_config(self, key: str, value: str):
         """设置系统配置"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO system_config (key, value, updated_at)
-            VALUES (?, ?, ?)
-        """, (key, value, datetime.now().strftime('%Y%m%d%H%M%S')))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR REPLACE INTO system_config (key, value, updated_at)
+                VALUES (?, ?, ?)
+            """, (key, value, datetime.now().strftime('%Y%m%d%H%M%S')))
+            conn.commit()
     
     # ========== 权限管理方法 ==========
     
     def get_user_permissions(self, user_id: int) -> List[str]:
         """获取用户权限列表"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT permission_code
-            FROM user_permissions
-            WHERE user_id = ?
-        """, (user_id,))
-        permissions = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return permissions
+        with self.connection() as conn:
+            rows = conn.execute("""
+                SELECT permission_code
+                FROM user_permissions
+                WHERE user_id = ?
+            """, (user_id,)).fetchall()
+        return [row[0] for row in rows]
     
     def set_user_permissions(self, user_id: int, permission_codes: List[str]):
         """设置用户权限（覆盖原有权限）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 先删除所有现有权限
-        cursor.execute("DELETE FROM user_permissions WHERE user_id = ?", (user_id,))
-        
-        # 添加新权限
-        current_time = datetime.now().strftime('%Y%m%d%H%M%S')
-        for code in permission_codes:
-            cursor.execute("""
-                INSERT INTO user_permissions (user_id, permission_code, created_at)
-                VALUES (?, ?, ?)
-            """, (user_id, code, current_time))
-        
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            # 先删除所有现有权限
+            cursor.execute("DELETE FROM user_permissions WHERE user_id = ?", (user_id,))
+            
+            # 添加新权限
+            current_time = datetime.now().strftime('%Y%m%d%H%M%S')
+            for code in permission_codes:
+                cursor.execute("""
+                    INSERT INTO user_permissions (user_id, permission_code, created_at)
+                    VALUES (?, ?, ?)
+                """, (user_id, code, current_time))
+            
+            self.bump_auth_version(conn)
+            conn.commit()
+        if self.session_cache is not None:
+            self.session_cache.invalidate_user(user_id)
     
     def add_user_permission(self, user_id: int, permission_code: str):
         """添加单个权限"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("""
-                INSERT INTO user_permissions (user_id, permission_code, created_at)
-                VALUES (?, ?, ?)
-            """, (user_id, permission_code, datetime.now().strftime('%Y%m%d%H%M%S')))
-            conn.commit()
-        except sqlite3.IntegrityError:
-            # 权限已存在，忽略
-            pass
-        finally:
-            conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    INSERT INTO user_permissions (user_id, permission_code, created_at)
+                    VALUES (?, ?, ?)
+                """, (user_id, permission_code, datetime.now().strftime('%Y%m%d%H%M%S')))
+                self.bump_auth_version(conn)
+                conn.commit()
+            except sqlite3.IntegrityError:
+                # 权限已存在，忽略
+                pass
+        if self.session_cache is not None:
+            self.session_cache.invalidate_user(user_id)
     
     def remove_user_permission(self, user_id: int, permission_code: str):
         """移除单个权限"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            DELETE FROM user_permissions
-            WHERE user_id = ? AND permission_code = ?
-        """, (user_id, permission_code))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM user_permissions
+                WHERE user_id = ? AND permission_code = ?
+            """, (user_id, permission_code))
+            self.bump_auth_version(conn)
+            conn.commit()
+        if self.session_cache is not None:
+            self.session_cache.invalidate_user(user_id)
     
     def has_permission(self, user_id: int, permission_code: str) -> bool:
         """检查用户是否有指定权限"""
-        # 管理员始终拥有所有权限
-        user = self.get_user_by_id(user_id)
-        if user and user['role'] == 'admin':
-            return True
-        
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM user_permissions
-            WHERE user_id = ? AND permission_code = ?
-        """, (user_id, permission_code))
-        count = cursor.fetchone()[0]
-        conn.close()
+        with self.connection() as conn:
+            # 管理员始终拥有所有权限
+            row = conn.execute("SELECT role FROM users WHERE id = ?", (user_id,)).fetchone()
+            if row and row[0] == 'admin':
+                return True
+            
+            count = conn.execute("""
+                SELECT COUNT(*)
+                FROM user_permissions
+                WHERE user_id = ? AND permission_code = ?
+            """, (user_id, permission_code)).fetchone()[0]
         return count > 0
     
     def get_stocks(self, exclude_delisted: bool = True) -> pd.DataFrame:
         """获取股票列表"""
-        conn = self.get_connection()
-        query = "SELECT * FROM stocks"
-        if exclude_delisted:
-            query += " WHERE delist_date IS NULL OR delist_date = ''"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with self.read_connection() as conn:
+            query = "SELECT * FROM stocks"
+            if exclude_delisted:
+                query += " WHERE delist_date IS NULL OR delist_date = ''"
+            df = pd.read_sql_query(query, conn)
         return df
     
     def get_stock_by_code(self, code: str) -> Optional[Dict]:
         """根据代码获取股票信息"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 先获取表结构，确定有哪些列
-        cursor.execute("PRAGMA table_info(stocks)")
-        columns_info = cursor.fetchall()
-        column_names = [col[1] for col in columns_info]
-        
-        # 构建查询语句
-        if column_names:
-            select_cols = ', '.join(column_names)
-            cursor.execute(f"""
-                SELECT {select_cols}
-                FROM stocks 
-                WHERE symbol = ? OR ts_code = ?
-            """, (code, code))
-        else:
-            # 如果表不存在或为空，使用默认列
-            cursor.execute("""
-                SELECT ts_code, symbol, name, list_date, delist_date, exchange 
-                FROM stocks 
-                WHERE symbol = ? OR ts_code = ?
-            """, (code, code))
-            column_names = ['ts_code', 'symbol', 'name', 'list_date', 'delist_date', 'exchange']
-        
-        row = cursor.fetchone()
-        conn.close()
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            
+            # 先获取表结构，确定有哪些列
+            cursor.execute("PRAGMA table_info(stocks)")
+            columns_info = cursor.fetchall()
+            column_names = [col[1] for col in columns_info]
+            
+            # 构建查询语句
+            if column_names:
+                select_cols = ', '.join(column_names)
+                cursor.execute(f"""
+                    SELECT {select_cols}
+                    FROM stocks 
+                    WHERE symbol = ? OR ts_code = ?
+                """, (code, code))
+            else:
+                # 如果表不存在或为空，使用默认列
+                cursor.execute("""
+                    SELECT ts_code, symbol, name, list_date, delist_date, exchange 
+                    FROM stocks 
+                    WHERE symbol = ? OR ts_code = ?
+                """, (code, code))
+                column_names = ['ts_code', 'symbol', 'name', 'list_date', 'delist_date', 'exchange']
+            
+            row = cursor.fetchone()
         
         if row:
             result = {}
@@ -638,195 +1168,321 @@ class Database:
     
     def search_stocks(self, keyword: str, limit: int = 20) -> List[Dict]:
         """根据关键词搜索股票（支持代码和名称）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 模糊搜索：匹配代码或名称
-        keyword_pattern = f"%{keyword}%"
-        cursor.execute("""
-            SELECT ts_code, symbol, name, exchange
-            FROM stocks 
-            WHERE (symbol LIKE ? OR ts_code LIKE ? OR name LIKE ?)
-            AND (delist_date IS NULL OR delist_date = '')
-            ORDER BY 
-                CASE 
-                    WHEN symbol = ? THEN 1
-                    WHEN ts_code = ? THEN 2
-                    WHEN symbol LIKE ? THEN 3
-                    WHEN ts_code LIKE ? THEN 4
-                    WHEN name LIKE ? THEN 5
-                    ELSE 6
-                END,
-                symbol
-            LIMIT ?
-        """, (keyword_pattern, keyword_pattern, keyword_pattern, 
-              keyword, keyword, f"{keyword}%", f"{keyword}%", f"{keyword}%", limit))
-        
-        results = []
-        for row in cursor.fetchall():
-            results.append({
-                'ts_code': row[0],
-                'symbol': row[1],
-                'name': row[2],
-                'exchange': row[3]
-            })
-        
-        conn.close()
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            
+            # 模糊搜索：匹配代码或名称
+            keyword_pattern = f"%{keyword}%"
+            cursor.execute("""
+                SELECT ts_code, symbol, name, exchange
+                FROM stocks 
+                WHERE (symbol LIKE ? OR ts_code LIKE ? OR name LIKE ?)
+                AND (delist_date IS NULL OR delist_date = '')
+                ORDER BY 
+                    CASE 
+                        WHEN symbol = ? THEN 1
+                        WHEN ts_code = ? THEN 2
+                        WHEN symbol LIKE ? THEN 3
+                        WHEN ts_code LIKE ? THEN 4
+                        WHEN name LIKE ? THEN 5
+                        ELSE 6
+                    END,
+                    symbol
+                LIMIT ?
+            """, (keyword_pattern, keyword_pattern, keyword_pattern, 
+                  keyword, keyword, f"{keyword}%", f"{keyword}%", f"{keyword}%", limit))
+            
+            results = []
+            for row in cursor.fetchall():
+                results.append({
+                    'ts_code': row[0],
+                    'symbol': row[1],
+                    'name': row[2],
+                    'exchange': row[3]
+                })
+            
         return results
     
     def get_monthly_kline(self, ts_code: str = None, year: int = None, 
                           month: int = None, start_year: int = None, 
                           end_year: int = None, data_source: str = None) -> pd.DataFrame:
         """获取月K线数据（支持按数据源过滤）"""
-        conn = self.get_connection()
-        query = "SELECT * FROM monthly_kline WHERE 1=1"
+        with self.read_connection() as conn:
+            query = "SELECT * FROM monthly_kline WHERE 1=1"
+            params = []
+            
+            if ts_code:
+                query += " AND ts_code = ?"
+                params.append(ts_code)
+            if year:
+                query += " AND year = ?"
+                params.append(year)
+            if month:
+                query += " AND month = ?"
+                params.append(month)
+            if start_year:
+                query += " AND year >= ?"
+                params.append(start_year)
+            if end_year:
+                query += " AND year <= ?"
+                params.append(end_year)
+            if data_source:
+                query += " AND data_source = ?"
+                params.append(data_source)
+            
+            query += " ORDER BY trade_date"
+            df = pd.read_sql_query(query, conn, params=params)
+        return df
+
+    def iter_monthly_kline_rows(self, data_source: str = None, start_year: int = None,
+                                end_year: int = None, batch_size: int = 5000) -> Iterator[tuple]:
+        """
+        按股票、交易日期顺序逐行读取全市场月K线（附股票代码和名称），每次从游标取 batch_size 行，
+        不会把整张表载入内存；生成器结束或关闭时归还只读连接
+
+        Yields:
+            (ts_code, symbol, name, trade_date, year, month, open, close, high, low, vol, amount, pct_chg, data_source)
+        """
+        query = """
+            SELECT k.ts_code, s.symbol, s.name, k.trade_date, k.year, k.month,
+                   k.open, k.close, k.high, k.low, k.vol, k.amount, k.pct_chg, k.data_source
+            FROM monthly_kline k LEFT JOIN stocks s ON s.ts_code = k.ts_code
+            WHERE 1=1
+        """
         params = []
-        
-        if ts_code:
-            query += " AND ts_code = ?"
-            params.append(ts_code)
-        if year:
-            query += " AND year = ?"
-            params.append(year)
-        if month:
-            query += " AND month = ?"
-            params.append(month)
+        if data_source:
+            query += " AND k.data_source = ?"
+            params.append(data_source)
         if start_year:
-            query += " AND year >= ?"
+            query += " AND k.year >= ?"
             params.append(start_year)
         if end_year:
-            query += " AND year <= ?"
+            query += " AND k.year <= ?"
             params.append(end_year)
-        if data_source:
-            query += " AND data_source = ?"
-            params.append(data_source)
-        
-        query += " ORDER BY trade_date"
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
+        query += " ORDER BY k.data_source, k.ts_code, k.trade_date"
+
+        with self.read_connection() as conn:
+            cursor = conn.execute(query, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+            finally:
+                cursor.close()
+
+    def get_month_summary(self, month: int, start_year: int = None, end_year: int = None,
+                          data_source: str = None, ts_code: str = None,
+                          industry_name: str = None, industry_type: str = 'sw',
+                          ts_code_range: Tuple[Optional[str], Optional[str]] = None) -> pd.DataFrame:
+        """获取指定月份的年度涨跌汇总（每只股票每年一行，按股票、年份排序，可按行业、股票代码区间过滤）"""
+        with self.read_connection() as conn:
+            query, params = month_summary_query(month, start_year, end_year, data_source, ts_code,
+                                                industry_name, industry_type, ts_code_range)
+            df = pd.read_sql_query(query, conn, params=params)
         return df
     
     def get_available_data_sources(self, ts_code: str = None) -> List[str]:
         """获取可用的数据源列表"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if ts_code:
-            cursor.execute("SELECT DISTINCT data_source FROM monthly_kline WHERE ts_code = ?", (ts_code,))
-        else:
-            cursor.execute("SELECT DISTINCT data_source FROM monthly_kline")
-        
-        sources = [row[0] for row in cursor.fetchall() if row[0]]
-        conn.close()
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            
+            if ts_code:
+                cursor.execute("SELECT DISTINCT data_source FROM monthly_kline WHERE ts_code = ?", (ts_code,))
+            else:
+                cursor.execute("SELECT DISTINCT data_source FROM monthly_kline")
+            
+            sources = [row[0] for row in cursor.fetchall() if row[0]]
         return sources
     
     def get_data_source_statistics(self) -> List[Dict]:
         """获取每个数据源的统计信息（数据量和最新日期）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 查询每个数据源的统计信息
-        cursor.execute("""
-            SELECT 
-                data_source,
-                COUNT(*) as data_count,
-                MAX(trade_date) as latest_date,
-                COUNT(DISTINCT ts_code) as stock_count
-            FROM monthly_kline
-            GROUP BY data_source
-            ORDER BY data_source
-        """)
-        
-        results = []
-        for row in cursor.fetchall():
-            results.append({
-                'data_source': row[0],
-                'data_count': row[1],
-                'latest_date': row[2],
-                'stock_count': row[3]
-            })
-        
-        conn.close()
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            
+            # 查询每个数据源的统计信息
+            cursor.execute("""
+                SELECT 
+                    data_source,
+                    COUNT(*) as data_count,
+                    MAX(trade_date) as latest_date,
+                    COUNT(DISTINCT ts_code) as stock_count
+                FROM monthly_kline
+                GROUP BY data_source
+                ORDER BY data_source
+            """)
+            
+            results = []
+            for row in cursor.fetchall():
+                results.append({
+                    'data_source': row[0],
+                    'data_count': row[1],
+                    'latest_date': row[2],
+                    'stock_count': row[3]
+                })
+            
         return results
     
     def compare_data_sources(self, ts_code: str, trade_date: str = None, 
                             month: int = None, year: int = None) -> pd.DataFrame:
         """对比不同数据源的数据"""
-        conn = self.get_connection()
-        query = """
-            SELECT ts_code, trade_date, year, month, open, close, pct_chg, data_source
-            FROM monthly_kline 
-            WHERE ts_code = ?
-        """
-        params = [ts_code]
-        
-        if trade_date:
-            query += " AND trade_date = ?"
-            params.append(trade_date)
-        if month:
-            query += " AND month = ?"
-            params.append(month)
-        if year:
-            query += " AND year = ?"
-            params.append(year)
-        
-        query += " ORDER BY trade_date, data_source"
-        
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
+        with self.read_connection() as conn:
+            query = """
+                SELECT ts_code, trade_date, year, month, open, close, pct_chg, data_source
+                FROM monthly_kline 
+                WHERE ts_code = ?
+            """
+            params = [ts_code]
+            
+            if trade_date:
+                query += " AND trade_date = ?"
+                params.append(trade_date)
+            if month:
+                query += " AND month = ?"
+                params.append(month)
+            if year:
+                query += " AND year = ?"
+                params.append(year)
+            
+            query += " ORDER BY trade_date, data_source"
+            
+            df = pd.read_sql_query(query, conn, params=params)
         return df
     
     def get_latest_trade_date(self, ts_code: str = None, data_source: str = None) -> Optional[str]:
         """获取最新的交易日期（支持按数据源过滤）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        query = "SELECT MAX(trade_date) FROM monthly_kline WHERE 1=1"
-        params = []
-        
-        if ts_code:
-            query += " AND ts_code = ?"
-            params.append(ts_code)
-        
-        if data_source:
-            query += " AND data_source = ?"
-            params.append(data_source)
-        
-        cursor.execute(query, params)
-        result = cursor.fetchone()
-        conn.close()
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            
+            query = "SELECT MAX(trade_date) FROM monthly_kline WHERE 1=1"
+            params = []
+            
+            if ts_code:
+                query += " AND ts_code = ?"
+                params.append(ts_code)
+            
+            if data_source:
+                query += " AND data_source = ?"
+                params.append(data_source)
+            
+            cursor.execute(query, params)
+            result = cursor.fetchone()
         return result[0] if result and result[0] else None
     
+    def get_latest_trade_dates(self, data_source: str) -> Dict[str, str]:
+        """
+        获取指定数据源每只股票的最新交易日期（一次查询），返回 {ts_code: trade_date}
+        
+        等价于 SELECT ts_code, MAX(trade_date) ... GROUP BY ts_code，但 GROUP BY 会扫描该数据源的全部索引项；
+        这里用递归CTE在 (data_source, ts_code, trade_date) 索引上逐个跳到下一只股票，
+        每只股票只做两次索引查找，耗时与历史数据量无关
+        """
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                WITH RECURSIVE codes(ts_code) AS (
+                    SELECT MIN(ts_code) FROM monthly_kline WHERE data_source = :data_source
+                    UNION ALL
+                    SELECT (SELECT MIN(ts_code) FROM monthly_kline
+                            WHERE data_source = :data_source AND ts_code > codes.ts_code)
+                    FROM codes WHERE codes.ts_code IS NOT NULL
+                )
+                SELECT ts_code,
+                       (SELECT MAX(trade_date) FROM monthly_kline k
+                        WHERE k.data_source = :data_source AND k.ts_code = codes.ts_code)
+                FROM codes
+                WHERE ts_code IS NOT NULL
+            """, {'data_source': data_source})
+            results = cursor.fetchall()
+        return {ts_code: trade_date for ts_code, trade_date in results if trade_date}
+    
     def save_industry(self, ts_code: str, industry_name: str, level: str, 
                      parent_code: str, industry_type: str = 'sw'):
         """保存行业分类"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            table = 'industry_sw' if industry_type == 'sw' else 'industry_citics'
+            cursor.execute(f"""
+                INSERT OR REPLACE INTO {table} (ts_code, industry_name, level, parent_code)
+                VALUES (?, ?, ?, ?)
+            """, (ts_code, industry_name, level, parent_code))
+            self.bump_data_version(conn)
+            conn.commit()
+    
+    def save_industries_bulk(self, industries, industry_type: str = 'sw', replace_all: bool = False,
+                             level: str = 'L1', parent_code: str = '') -> int:
+        """
+        批量保存行业分类（整张表在一个事务内写入）
+        
+        Args:
+            industries: DataFrame（ts_code, industry_name 列，可选 level, parent_code 列）
+                        或 {行业名称: [股票代码, ...]} 映射
+            industry_type: 行业类型（sw/citics）
+            replace_all: 是否整表替换。删除旧数据和写入新数据在同一事务内完成，
+                         提交前其他连接读到的始终是旧的完整数据，不会读到空表
+            level: 未提供 level 列时使用的行业级别
+            parent_code: 未提供 parent_code 列时使用的父级代码
+        
+        Returns:
+            写入的记录数
+        """
         table = 'industry_sw' if industry_type == 'sw' else 'industry_citics'
-        cursor.execute(f"""
-            INSERT OR REPLACE INTO {table} (ts_code, industry_name, level, parent_code)
-            VALUES (?, ?, ?, ?)
-        """, (ts_code, industry_name, level, parent_code))
-        conn.commit()
-        conn.close()
+        
+        if isinstance(industries, dict):
+            records = [(ts_code, industry_name, level, parent_code)
+                       for industry_name, stock_codes in industries.items()
+                       for ts_code in stock_codes]
+        else:
+            rows = len(industries)
+            records = list(zip(
+                industries['ts_code'].tolist(),
+                industries['industry_name'].tolist(),
+                industries['level'].tolist() if 'level' in industries.columns else [level] * rows,
+                industries['parent_code'].tolist() if 'parent_code' in industries.columns else [parent_code] * rows
+            ))
+        
+        # 整表替换时没有新数据则保留旧数据，避免获取失败时清空行业分类
+        if not records:
+            return 0
+        
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            if replace_all:
+                cursor.execute(f"DELETE FROM {table}")
+            cursor.executemany(f"""
+                INSERT OR REPLACE INTO {table} (ts_code, industry_name, level, parent_code)
+                VALUES (?, ?, ?, ?)
+            """, records)
+            self.bump_data_version(conn)
+        return len(records)
     
     def get_industry_stocks(self, industry_name: str, industry_type: str = 'sw') -> List[str]:
         """获取行业下的股票代码列表"""
-        conn = self.get_connection()
-        table = 'industry_sw' if industry_type == 'sw' else 'industry_citics'
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT DISTINCT ts_code FROM {table} WHERE industry_name = ?", (industry_name,))
-        results = cursor.fetchall()
-        conn.close()
+        with self.read_connection() as conn:
+            table = 'industry_sw' if industry_type == 'sw' else 'industry_citics'
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT DISTINCT ts_code FROM {table} WHERE industry_name = ?", (industry_name,))
+            results = cursor.fetchall()
         return [r[0] for r in results]
     
+    def get_industry_members(self, industry_type: str = 'sw') -> pd.DataFrame:
+        """一次性获取所有行业的成分股（industry_name, ts_code，按行业、股票代码排序）"""
+        with self.read_connection() as conn:
+            table = 'industry_sw' if industry_type == 'sw' else 'industry_citics'
+            df = pd.read_sql_query(f"""
+                SELECT DISTINCT industry_name, ts_code FROM {table}
+                WHERE industry_name IS NOT NULL AND ts_code IS NOT NULL
+                ORDER BY industry_name, ts_code
+            """, conn)
+        return df
+    
     def get_all_industries(self, industry_type: str = 'sw') -> List[str]:
         """获取所有行业名称"""
-        conn = self.get_connection()
-        table = 'industry_sw' if industry_type == 'sw' else 'industry_citics'
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT DISTINCT industry_name FROM {table} ORDER BY industry_name")
-        results = cursor.fetchall()
-        conn.close()
+        with self.read_connection() as conn:
+            table = 'industry_sw' if industry_type == 'sw' else 'industry_citics'
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT DISTINCT industry_name FROM {table} ORDER BY industry_name")
+            results = cursor.fetchall()
         return [r[0] for r in results]
 
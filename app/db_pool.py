@@ -0,0 +1,200 @@
+"""
+SQLite连接池
+"""
+import gc
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """等待可用连接超时（取出的连接数已达到 max_connections）"""
+
+
+class PooledConnection(sqlite3.Connection):
+    """连接池中的连接：close() 时归还连接池而不是真正关闭"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool: Optional['ConnectionPool'] = None
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.checked_out = False
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def close_physically(self):
+        """真正关闭底层连接"""
+        self.pool = None
+        super().close()
+
+    def __del__(self):
+        # 取出后没有归还就被回收（调用方出错时没有 close），通知连接池收回它占用的名额；
+        # 回收可能发生在持有连接池锁的代码中，这里只记录，由下次 acquire() 释放名额
+        if getattr(self, 'checked_out', False) and getattr(self, 'pool', None) is not None:
+            self.checked_out = False
+            self.pool._orphans.append(None)
+
+
+class ConnectionPool:
+    """
+    有界的SQLite连接池（线程安全）
+
+    - 同时取出的连接数不超过 max_connections，达到上限时等待其他线程归还，等待超过 timeout 秒抛出 PoolTimeoutError
+    - 连接以后进先出方式复用，空闲连接数不超过 pool_size，超出的连接归还时直接关闭
+    - 重复归还同一个连接（例如 close() 调用两次）会被忽略，不会把同一个连接交给两个线程
+    - 取出后没有归还就被垃圾回收的连接，其名额在之后的 acquire() 中收回，不会永久占用上限
+    - 取出连接时做健康检查（SELECT 1），失效或超过回收时间的连接会被丢弃并重建
+    - 连接创建时设置 check_same_thread=False，可在FastAPI线程池和后台更新线程之间传递，
+      但同一时刻只会被一个线程持有
+    """
+
+    def __init__(self, db_path: str, pool_size: int = 5, busy_timeout: float = 30.0,
+                 pre_ping: bool = True, recycle_seconds: float = 3600,
+                 on_connect: Optional[Callable[[sqlite3.Connection], None]] = None,
+                 uri: bool = False, max_connections: int = 20, timeout: float = 30.0):
+        self.db_path = db_path
+        self.uri = uri
+        self.pool_size = max(int(pool_size), 0)
+        self.busy_timeout = busy_timeout
+        self.pre_ping = pre_ping
+        self.recycle_seconds = recycle_seconds
+        self.on_connect = on_connect
+        self.max_connections = max(int(max_connections), 1)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._idle: List[PooledConnection] = []
+        self._orphans: List[None] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {'created': 0, 'reused': 0, 'discarded': 0, 'checked_out': 0, 'timeouts': 0,
+                       'reclaimed': 0}
+
+    def _create(self) -> PooledConnection:
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, uri=self.uri,
+                               check_same_thread=False, factory=PooledConnection)
+        if self.on_connect:
+            self.on_connect(conn)
+        conn.pool = self
+        with self._lock:
+            self._stats['created'] += 1
+        return conn
+
+    def _is_healthy(self, conn: PooledConnection) -> bool:
+        if self.recycle_seconds and time.monotonic() - conn.created_at > self.recycle_seconds:
+            return False
+        if self.pre_ping:
+            try:
+                conn.execute("SELECT 1").fetchone()
+            except sqlite3.Error:
+                return False
+        return True
+
+    def acquire(self) -> PooledConnection:
+        """取出一个可用连接（没有空闲连接时新建；取出的连接数达到上限时等待归还）"""
+        self._reclaim_orphans()
+        if not self._slots.acquire(blocking=False):
+            # 名额用完时先做一次垃圾回收：出错后未归还的连接通常被异常的 traceback 引用成环，回收后才能收回名额
+            gc.collect()
+            self._reclaim_orphans()
+            deadline = time.monotonic() + self.timeout
+            # 分段等待，期间被回收的未归还连接的名额也能及时收回
+            while not self._slots.acquire(timeout=min(max(deadline - time.monotonic(), 0), 1.0)):
+                if time.monotonic() >= deadline:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"等待数据库连接超时（{self.timeout}秒内没有可用连接，上限 {self.max_connections}）")
+                self._reclaim_orphans()
+        try:
+            conn = self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+        conn.checked_out = True
+        return conn
+
+    def _reclaim_orphans(self):
+        """释放未归还就被回收的连接占用的名额"""
+        while self._orphans:
+            try:
+                self._orphans.pop()
+            except IndexError:
+                break
+            with self._lock:
+                self._stats['checked_out'] -= 1
+                self._stats['reclaimed'] += 1
+            self._slots.release()
+
+    def _checkout(self) -> PooledConnection:
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._create()
+                with self._lock:
+                    self._stats['checked_out'] += 1
+                return conn
+            if self._is_healthy(conn):
+                with self._lock:
+                    self._stats['reused'] += 1
+                    self._stats['checked_out'] += 1
+                conn.last_used_at = time.monotonic()
+                return conn
+            with self._lock:
+                self._stats['discarded'] += 1
+            try:
+                conn.close_physically()
+            except sqlite3.Error:
+                pass
+
+    def release(self, conn: PooledConnection):
+        """归还连接（未提交的事务会被回滚，与关闭连接的语义一致）；重复归还时忽略"""
+        with self._lock:
+            if not conn.checked_out:
+                return
+            conn.checked_out = False
+            self._stats['checked_out'] -= 1
+        try:
+            self._return(conn)
+        finally:
+            self._slots.release()
+
+    def _return(self, conn: PooledConnection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            with self._lock:
+                self._stats['discarded'] += 1
+            conn.close_physically()
+            return
+
+        with self._lock:
+            if not self._closed and len(self._idle) < self.pool_size:
+                conn.last_used_at = time.monotonic()
+                self._idle.append(conn)
+                return
+        conn.close_physically()
+
+    def close_all(self):
+        """关闭所有空闲连接，之后归还的连接也会直接关闭"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.close_physically()
+            except sqlite3.Error:
+                pass
+
+    def status(self) -> Dict:
+        """连接池状态（用于监控）"""
+        with self._lock:
+            return dict(self._stats, idle=len(self._idle), pool_size=self.pool_size,
+                        max_connections=self.max_connections)
@@ -0,0 +1,134 @@
+"""
+耗时接口的有界执行器和接口耗时统计
+"""
+import asyncio
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from fastapi import HTTPException
+
+
+# 执行器默认参数（可通过 config.json 的 executor 配置项覆盖）
+# - max_concurrency: 同时执行的耗时请求数（统计查询、导出）
+# - max_queue: 排队等待的请求数上限，超过时直接返回 503
+DEFAULT_EXECUTOR_OPTIONS = {
+    'max_concurrency': 4,
+    'max_queue': 32,
+}
+
+
+class LatencyRecorder:
+    """按名称记录耗时（每个名称保留最近 window 个样本），用于查看各接口的响应时间分布"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def summary(self) -> Dict[str, Dict]:
+        """每个名称的请求数和最近样本的平均/中位数/p95/最大耗时（毫秒）"""
+        with self._lock:
+            snapshot = {name: (self._counts[name], sorted(samples)) for name, samples in self._samples.items()}
+        result = {}
+        for name, (count, samples) in sorted(snapshot.items()):
+            result[name] = {
+                'count': count,
+                'avg_ms': round(sum(samples) / len(samples) * 1000, 2),
+                'p50_ms': round(samples[len(samples) // 2] * 1000, 2),
+                'p95_ms': round(samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000, 2),
+                'max_ms': round(samples[-1] * 1000, 2),
+            }
+        return result
+
+
+class HeavyTaskExecutor:
+    """
+    耗时请求的有界执行器
+
+    - 专用线程池执行同步的 pandas/SQLite 计算，不阻塞事件循环，也不占用 FastAPI 默认线程池，
+      统计查询或导出进行时登录、进度查询等轻量接口仍能及时响应
+    - 最多 max_concurrency 个请求同时执行，其余排队；排队数超过 max_queue 时返回 503
+    - 记录每类请求的排队时间和执行时间
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 32):
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.max_queue = max(int(max_queue), 0)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='heavy-task')
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+        self.wait_times = LatencyRecorder()
+        self.run_times = LatencyRecorder()
+
+    async def run(self, name: str, func: Callable, *args, **kwargs):
+        """在执行器中运行 func(*args, **kwargs) 并等待结果"""
+        with self._lock:
+            if self._running + self._queued >= self.max_concurrency + self.max_queue:
+                self._stats['rejected'] += 1
+                raise HTTPException(status_code=503, detail="服务器繁忙，请稍后重试")
+            self._queued += 1
+            self._stats['submitted'] += 1
+        submitted_at = time.perf_counter()
+
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            self.wait_times.record(name, started_at - submitted_at)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.run_times.record(name, time.perf_counter() - started_at)
+                with self._lock:
+                    self._running -= 1
+
+        try:
+            result = await asyncio.wrap_future(self._executor.submit(task))
+        except BaseException:
+            with self._lock:
+                self._stats['failed'] += 1
+            raise
+        with self._lock:
+            self._stats['completed'] += 1
+        return result
+
+    def status(self) -> Dict:
+        """执行器状态：并发数、排队数、请求计数以及各类请求的排队/执行耗时"""
+        with self._lock:
+            status = dict(self._stats, running=self._running, queued=self._queued,
+                          max_concurrency=self.max_concurrency, max_queue=self.max_queue)
+        status['wait_time'] = self.wait_times.summary()
+        status['run_time'] = self.run_times.summary()
+        return status
+
+    def route(self, name: str):
+        """
+        路由装饰器：把同步的路由函数放到执行器中运行
+
+        用法:
+            @app.post("/api/month/filter")
+            @heavy_tasks.route('month_filter')
+            def get_month_filter_statistics(...):
+        """
+        def decorator(func: Callable):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                return await self.run(name, func, *args, **kwargs)
+            return wrapper
+        return decorator
@@ -0,0 +1,278 @@
+"""
+Excel/CSV 流式导出（边生成边发送，不在内存中拼出完整文件）
+"""
+import csv
+import io
+import math
+import queue
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+from urllib.parse import quote
+
+from fastapi import BackgroundTasks, HTTPException
+from fastapi.responses import StreamingResponse
+from openpyxl import Workbook
+
+
+# 导出默认参数（可通过 config.json 的 export 配置项覆盖）
+# - chunk_size: 每次发送的数据块大小（字节）
+# - max_streams: 同时进行的导出数上限，超过时返回 503
+DEFAULT_EXPORT_OPTIONS = {
+    'chunk_size': 65536,
+    'max_streams': 4,
+}
+
+EXPORT_MEDIA_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# 单个工作表的最大行数（含表头），超出时续写到新的工作表
+XLSX_MAX_ROWS = 1048576
+
+_SHEET_TITLE_INVALID_CHARS = str.maketrans({c: '_' for c in '[]:*?/\\'})
+
+
+def _cell(value):
+    """单元格的值：NaN 写为空，numpy 标量转为 Python 类型"""
+    if value is None:
+        return None
+    if hasattr(value, 'item') and not isinstance(value, (str, bytes)):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def iter_csv(columns: Sequence[str], rows: Iterable[Sequence], chunk_size: int = 65536) -> Iterator[bytes]:
+    """逐块生成 CSV（UTF-8 带 BOM，Excel 打开时中文不乱码）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in map(_cell, row)])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkPipe:
+    """
+    写入端给 openpyxl/zipfile 使用的只写文件对象：写入的数据凑够 chunk_size 后放入有界队列，
+    读取端（响应生成器）从队列取出发送；队列满时写入端等待，生成速度不会超过发送速度
+    """
+
+    def __init__(self, chunk_size: int, max_chunks: int = 4):
+        self.chunk_size = chunk_size
+        self.chunks: queue.Queue = queue.Queue(maxsize=max_chunks)
+        self.cancelled = threading.Event()
+        self._buffer = bytearray()
+
+    def _put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise RuntimeError("导出已取消")
+
+    def write(self, data) -> int:
+        self._buffer += data
+        if len(self._buffer) >= self.chunk_size:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self, error: Optional[BaseException] = None):
+        """写入结束（error 不为空表示生成失败）"""
+        if error is None and self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        self._put(error)
+
+
+def _write_xlsx(pipe: _ChunkPipe, columns: Sequence[str], rows: Iterable[Sequence], sheet_name: str):
+    """用 openpyxl 只写模式生成工作簿：行数据写入临时文件，保存时按 zip 流写入 pipe"""
+    error = None
+    try:
+        workbook = Workbook(write_only=True)
+        title = (sheet_name or 'Sheet1').translate(_SHEET_TITLE_INVALID_CHARS)[:31]
+        sheet_count = 1
+        worksheet = workbook.create_sheet(title)
+        worksheet.append(list(columns))
+        row_count = 1
+        for row in rows:
+            if pipe.cancelled.is_set():
+                raise RuntimeError("导出已取消")
+            if row_count >= XLSX_MAX_ROWS:
+                sheet_count += 1
+                suffix = f"_{sheet_count}"
+                worksheet = workbook.create_sheet(title[:31 - len(suffix)] + suffix)
+                worksheet.append(list(columns))
+                row_count = 1
+            worksheet.append([_cell(value) for value in row])
+            row_count += 1
+        workbook.save(pipe)
+    except BaseException as e:
+        error = e
+    try:
+        pipe.finish(error)
+    except RuntimeError:
+        pass
+
+
+def iter_xlsx(columns: Sequence[str], rows: Iterable[Sequence], sheet_name: str = 'Sheet1',
+              chunk_size: int = 65536) -> Iterator[bytes]:
+    """逐块生成 xlsx（后台线程写工作簿，当前生成器按块取出）"""
+    pipe = _ChunkPipe(chunk_size)
+    writer = threading.Thread(target=_write_xlsx, args=(pipe, columns, rows, sheet_name),
+                              name='xlsx-export', daemon=True)
+    writer.start()
+    try:
+        while True:
+            chunk = pipe.chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield chunk
+    finally:
+        # 客户端断开或出错时让写入线程退出
+        pipe.cancelled.set()
+        writer.join()
+
+
+class _ExportStream:
+    """
+    一次导出的响应体：持有一个导出名额，发送结束、出错、客户端断开或响应从未开始发送时都会释放
+
+    StreamingResponse 不会关闭未开始迭代的响应体，因此除了迭代结束时释放，还通过响应的 background
+    任务和对象回收时兜底释放（release 可以重复调用）
+    """
+
+    def __init__(self, exporter: 'Exporter', chunks: Iterator[bytes]):
+        self._exporter = exporter
+        self._chunks = chunks
+        self._lock = threading.Lock()
+        self._released = False
+        self._iterator: Optional[Iterator[bytes]] = None
+
+    def __iter__(self) -> '_ExportStream':
+        return self
+
+    def __next__(self) -> bytes:
+        if self._iterator is None:
+            self._iterator = self._iterate()
+        return next(self._iterator)
+
+    def _iterate(self) -> Iterator[bytes]:
+        result = 'cancelled'
+        try:
+            for chunk in self._chunks:
+                self._exporter._record_bytes(len(chunk))
+                yield chunk
+            result = 'completed'
+        except Exception:
+            result = 'failed'
+            raise
+        finally:
+            self.release(result)
+
+    def release(self, result: str = 'cancelled'):
+        """释放导出名额并关闭数据生成器（只有第一次调用生效）"""
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        try:
+            self._chunks.close()
+        finally:
+            self._exporter._release(result)
+
+    def __del__(self):
+        self.release()
+
+
+class Exporter:
+    """
+    导出响应：按格式生成 CSV 或 xlsx 数据流，交给 StreamingResponse 边生成边发送
+
+    rows 可以是生成器（例如按批读取数据库的游标），数据不会一次性载入内存；
+    同时进行的导出数超过 max_streams 时返回 503
+    """
+
+    def __init__(self, chunk_size: int = 65536, max_streams: int = 4):
+        self.chunk_size = max(int(chunk_size), 1024)
+        self.max_streams = max(int(max_streams), 1)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._stats = {'started': 0, 'completed': 0, 'failed': 0, 'cancelled': 0, 'rejected': 0,
+                       'bytes_sent': 0}
+
+    def _record_bytes(self, size: int):
+        with self._lock:
+            self._stats['bytes_sent'] += size
+
+    def _release(self, result: str):
+        with self._lock:
+            self._active -= 1
+            self._stats[result] += 1
+
+    def response(self, columns: Sequence[str], rows: Iterable[Sequence], filename: str,
+                 sheet_name: str = 'Sheet1', export_format: str = 'xlsx') -> StreamingResponse:
+        """
+        Args:
+            columns: 表头
+            rows: 行数据（与表头顺序一致的序列）
+            filename: 下载文件名（扩展名按 export_format 替换）
+            export_format: xlsx 或 csv
+        """
+        export_format = (export_format or 'xlsx').lower()
+        if export_format not in EXPORT_MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail=f"不支持的导出格式: {export_format}")
+        with self._lock:
+            if self._active >= self.max_streams:
+                self._stats['rejected'] += 1
+                raise HTTPException(status_code=503, detail="导出任务过多，请稍后重试")
+            self._active += 1
+            self._stats['started'] += 1
+
+        if export_format == 'csv':
+            chunks = iter_csv(columns, rows, self.chunk_size)
+        else:
+            chunks = iter_xlsx(columns, rows, sheet_name, self.chunk_size)
+        stream = _ExportStream(self, chunks)
+        try:
+            background = BackgroundTasks()
+            background.add_task(stream.release)
+            stem = filename.rsplit('.', 1)[0] if filename.lower().endswith(('.xlsx', '.csv')) else filename
+            # 处理中文文件名编码
+            encoded_filename = quote(f"{stem}.{export_format}".encode('utf-8'))
+            return StreamingResponse(
+                stream,
+                media_type=EXPORT_MEDIA_TYPES[export_format],
+                headers={"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"},
+                background=background
+            )
+        except BaseException:
+            stream.release('failed')
+            raise
+
+    def records_response(self, records: List[Dict], filename: str, sheet_name: str = 'Sheet1',
+                         export_format: str = 'xlsx') -> StreamingResponse:
+        """导出字典列表（表头取各条记录中出现的键，按首次出现的顺序）"""
+        columns = list(dict.fromkeys(key for record in records for key in record))
+        rows = ([record.get(column) for column in columns] for record in records)
+        return self.response(columns, rows, filename, sheet_name, export_format)
+
+    def status(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, active=self._active, max_streams=self.max_streams)
@@ -0,0 +1,274 @@
+"""
+数据源原始数据本地缓存（月K线，压缩 NumPy 格式存储，支持过期时间和按大小淘汰）
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.config import Config
+
+
+# 缓存默认参数（可通过 config.json 的 fetch_cache 配置项覆盖）
+# - mode: ttl（相同参数的请求在有效期内直接返回缓存）或 historical（已结束月份的数据长期缓存，只请求当月数据）
+# - ttl_seconds: ttl 模式下缓存的有效期
+# - history_ttl_seconds: historical 模式下历史数据的有效期（前复权价格在除权除息后会整体变化，0表示永不过期）
+# - max_size_mb: 缓存目录的最大占用空间，超出时淘汰最久未使用的缓存
+DEFAULT_FETCH_CACHE_OPTIONS = {
+    'enabled': False,
+    'mode': 'ttl',
+    'directory': None,
+    'ttl_seconds': 21600,
+    'history_ttl_seconds': 604800,
+    'max_size_mb': 512,
+}
+
+_META_KEY = '__meta__'
+
+
+def _next_month_start(trade_date: str) -> str:
+    year, month = int(trade_date[:4]), int(trade_date[4:6])
+    return f"{year + month // 12}{month % 12 + 1:02d}01"
+
+
+class FetchCache:
+    """
+    月K线本地缓存（线程安全）
+
+    - 缓存键：(数据源, 股票代码, 起始日期, 结束日期, 复权方式)，每个键一个 .npz 文件
+    - 文件修改时间记录最近一次访问时间，总大小超过 max_size_mb 时按最近最少使用淘汰
+    - 空结果（多为请求失败）不缓存
+    """
+
+    def __init__(self, directory: str, mode: str = 'ttl', ttl_seconds: float = 21600,
+                 history_ttl_seconds: float = 604800, max_size_mb: float = 512):
+        self.directory = directory
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.history_ttl_seconds = history_ttl_seconds
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()  # 文件路径 -> 大小，按最近访问时间排序
+        self._size = 0
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'expired': 0}
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """扫描缓存目录，按文件修改时间（最近访问时间）建立淘汰顺序"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.npz'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._entries[path] = size
+            self._size += size
+
+    def _path(self, data_source: str, *key) -> str:
+        digest = hashlib.sha1('|'.join(str(part) for part in (data_source,) + key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, data_source, f"{digest}.npz")
+
+    def _read(self, path: str, ttl: float) -> Optional[Tuple[pd.DataFrame, Dict]]:
+        """读取缓存文件，过期或损坏时删除并返回 None"""
+        try:
+            with np.load(path, allow_pickle=False) as payload:
+                meta = json.loads(str(payload[_META_KEY]))
+                if ttl and time.time() - meta['created'] > ttl:
+                    self._remove(path)
+                    with self._lock:
+                        self._stats['expired'] += 1
+                    return None
+                df = pd.DataFrame({column: payload[f"c{i}"] for i, column in enumerate(meta['columns'])})
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"读取缓存失败 {path}: {e}")
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        return df, meta
+
+    def _write(self, path: str, df: pd.DataFrame, meta: Optional[Dict] = None):
+        """写入缓存文件（先写临时文件再替换），超出大小限制时淘汰最久未使用的缓存"""
+        meta = dict(meta or {}, created=time.time(), columns=[str(column) for column in df.columns])
+        arrays = {_META_KEY: np.array(json.dumps(meta))}
+        for i, column in enumerate(df.columns):
+            values = df[column].to_numpy()
+            if values.dtype == object:
+                values = df[column].astype(str).to_numpy(dtype=str)
+            arrays[f"c{i}"] = values
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(buffer.getvalue())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"写入缓存失败 {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        size = buffer.getbuffer().nbytes
+        evicted = []
+        with self._lock:
+            self._size += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            self._stats['writes'] += 1
+            while self._size > self.max_size and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                self._stats['evictions'] += 1
+                evicted.append(old_path)
+        for old_path in evicted:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def _remove(self, path: str):
+        with self._lock:
+            self._size -= self._entries.pop(path, 0)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _record(self, hit: bool):
+        with self._lock:
+            self._stats['hits' if hit else 'misses'] += 1
+
+    def get_monthly_kline(self, data_source: str, ts_code: str, start_date: str, end_date: str,
+                          fetch: Callable[[str, str, str], pd.DataFrame], adjust: str = 'qfq') -> pd.DataFrame:
+        """
+        获取月K线：命中缓存时直接返回，否则调用 fetch(ts_code, start_date, end_date) 并写入缓存
+        """
+        if self.mode == 'historical':
+            return self._get_monthly_kline_historical(data_source, ts_code, start_date, end_date, fetch, adjust)
+
+        path = self._path(data_source, ts_code, start_date, end_date, adjust)
+        cached = self._read(path, self.ttl_seconds)
+        self._record(cached is not None)
+        if cached is not None:
+            return cached[0]
+
+        df = fetch(ts_code, start_date, end_date)
+        if df is not None and not df.empty:
+            self._write(path, df)
+        return df
+
+    def _get_monthly_kline_historical(self, data_source: str, ts_code: str, start_date: str, end_date: str,
+                                      fetch: Callable[[str, str, str], pd.DataFrame], adjust: str) -> pd.DataFrame:
+        """
+        历史月份缓存模式：每只股票缓存一份已结束月份的月K线，请求时只从数据源获取缓存之后的月份
+
+        只有请求从缓存的起始日期（或之后某个月的1日）开始、并且截止到当月时才使用缓存，
+        否则首尾月份可能只包含部分交易日，与缓存中的整月数据不一致
+        """
+        path = self._path(data_source, ts_code, 'history', adjust)
+        current_month = datetime.now().strftime('%Y%m01')
+        cached = self._read(path, self.history_ttl_seconds)
+        usable = cached is not None and end_date >= current_month and (
+            start_date == cached[1]['start'] or (start_date > cached[1]['start'] and start_date.endswith('01')))
+        self._record(usable)
+
+        if not usable:
+            df = fetch(ts_code, start_date, end_date)
+            if df is not None and not df.empty and end_date >= current_month and \
+                    (cached is None or start_date <= cached[1]['start']):
+                complete = df[df['trade_date'].astype(str) < current_month]
+                last_trade_date = str(complete['trade_date'].iloc[-1]) if not complete.empty else ''
+                self._write(path, complete, {'start': start_date, 'last_trade_date': last_trade_date})
+            return df
+
+        history_df, meta = cached
+        fetch_start = _next_month_start(meta['last_trade_date']) if meta['last_trade_date'] else meta['start']
+        recent_df = fetch(ts_code, max(fetch_start, start_date), end_date)
+        df = history_df[history_df['trade_date'].astype(str) >= start_date]
+        if recent_df is None or recent_df.empty:
+            return df.reset_index(drop=True)
+
+        # 缓存之后又有月份结束时追加到缓存
+        completed = recent_df[recent_df['trade_date'].astype(str) < current_month]
+        if not completed.empty:
+            self._write(path, pd.concat([history_df, completed], ignore_index=True),
+                        {'start': meta['start'], 'last_trade_date': str(completed['trade_date'].iloc[-1])})
+        return pd.concat([df, recent_df], ignore_index=True)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            paths = list(self._entries)
+            self._entries.clear()
+            self._size = 0
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def status(self) -> Dict:
+        """缓存状态（命中次数、文件数、占用空间等）"""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(self._stats, mode=self.mode, entries=len(self._entries),
+                        size_mb=round(self._size / 1024 / 1024, 2),
+                        max_size_mb=round(self.max_size / 1024 / 1024, 2),
+                        hit_rate=round(self._stats['hits'] / lookups, 4) if lookups else 0.0)
+
+
+# 同一进程内共用一个缓存实例（切换数据源重建 DataFetcher 时命中统计不丢失）
+_fetch_cache: Optional[FetchCache] = None
+_fetch_cache_options: Optional[Dict] = None
+_fetch_cache_lock = threading.Lock()
+
+
+def get_fetch_cache_options(config: Config) -> Dict:
+    """合并默认值和 config.json 中的缓存参数"""
+    options = dict(DEFAULT_FETCH_CACHE_OPTIONS)
+    options.update(config.get('fetch_cache', {}) or {})
+    if not options.get('directory'):
+        options['directory'] = os.path.join(os.getenv('DATA_DIR', '.'), 'fetch_cache')
+    return options
+
+
+def get_fetch_cache(config: Config) -> Optional[FetchCache]:
+    """获取进程内共用的缓存实例（未启用时返回 None，配置变化时重建）"""
+    global _fetch_cache, _fetch_cache_options
+    options = get_fetch_cache_options(config)
+    if not options.get('enabled'):
+        return None
+    with _fetch_cache_lock:
+        if _fetch_cache is None or options != _fetch_cache_options:
+            _fetch_cache = FetchCache(options['directory'], mode=options['mode'],
+                                      ttl_seconds=options['ttl_seconds'],
+                                      history_ttl_seconds=options['history_ttl_seconds'],
+                                      max_size_mb=options['max_size_mb'])
+            _fetch_cache_options = options
+        return _fetch_cache
@@ -0,0 +1,250 @@
+"""
+月K线并发抓取流水线（多线程抓取 + 按数据源令牌桶限流 + 单线程批量写入）
+"""
+import queue
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.config import Config
+from app.data_fetcher import DataFetcher
+from app.database import Database
+
+
+# 各数据源默认的抓取参数（可通过 config.json 的 update.sources.<数据源> 覆盖）
+# - workers: 并发抓取线程数
+# - requests_per_second: 平均每秒请求数（0表示不限流）
+# - burst: 允许的突发请求数（令牌桶容量）
+DEFAULT_SOURCE_OPTIONS = {
+    'akshare': {'workers': 4, 'requests_per_second': 2.0, 'burst': 4},
+    'tushare': {'workers': 4, 'requests_per_second': 3.0, 'burst': 5},
+    # BaoStock 使用模块级的单个socket连接，不能多线程并发请求
+    'baostock': {'workers': 1, 'requests_per_second': 10.0, 'burst': 10},
+    'finnhub': {'workers': 2, 'requests_per_second': 1.0, 'burst': 1},
+}
+
+# 写入阶段默认参数（可通过 config.json 的 update 配置项覆盖）
+DEFAULT_WRITE_OPTIONS = {
+    'write_batch_size': 50,      # 每次提交包含的股票数
+    'flush_interval': 5.0,       # 距上次提交超过该秒数时，即使未满一批也提交
+}
+
+# 失败重试默认参数（可通过 config.json 的 update 配置项覆盖）
+DEFAULT_RETRY_OPTIONS = {
+    'retry_attempts': 2,         # 全部股票处理完后，对失败股票的重试轮数
+    'retry_backoff': 5.0,        # 第一轮重试前的等待秒数，之后每轮翻倍
+}
+
+
+class TokenBucket:
+    """令牌桶限流器（线程安全）：平均每秒 rate 个请求，最多允许 burst 个突发请求"""
+
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate = float(rate)
+        self.capacity = max(float(burst), 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop_event: Optional[threading.Event] = None) -> bool:
+        """取得一个令牌（令牌不足时阻塞等待），stop_event 被设置时放弃并返回 False"""
+        if self.rate <= 0:
+            return True
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+# 同一进程内每个数据源共用一个限流器（多个更新任务同时运行时也不会超过数据源的频率限制）
+_rate_limiters: Dict[str, TokenBucket] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(data_source: str, rate: float, burst: float) -> TokenBucket:
+    """获取数据源的限流器（配置变化时重建）"""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(data_source)
+        if limiter is None or limiter.rate != float(rate) or limiter.capacity != max(float(burst), 1.0):
+            limiter = TokenBucket(rate, burst)
+            _rate_limiters[data_source] = limiter
+        return limiter
+
+
+def get_fetch_options(config: Config, data_source: str) -> Dict:
+    """合并默认值和 config.json 中的抓取参数"""
+    options = dict(DEFAULT_WRITE_OPTIONS, **DEFAULT_RETRY_OPTIONS)
+    options.update(DEFAULT_SOURCE_OPTIONS.get(data_source, {'workers': 1, 'requests_per_second': 1.0, 'burst': 1}))
+    for key in list(DEFAULT_WRITE_OPTIONS) + list(DEFAULT_RETRY_OPTIONS):
+        value = config.get(f'update.{key}')
+        if value is not None:
+            options[key] = value
+    options.update(config.get(f'update.sources.{data_source}', {}) or {})
+    options['workers'] = max(int(options['workers']), 1)
+    options['write_batch_size'] = max(int(options['write_batch_size']), 1)
+    return options
+
+
+class FetchPipeline:
+    """
+    月K线抓取流水线
+
+    - 抓取阶段：workers 个线程从任务队列取股票调用 DataFetcher.get_monthly_kline，
+      向数据源发起请求前经令牌桶限流（命中本地缓存时不占用请求配额）
+    - 写入阶段：调用 run() 的线程作为唯一的写入者，把抓取结果攒批后用 save_monthly_kline_batch 一次提交
+    - 结果队列有界，写入跟不上时抓取线程会等待，内存占用不会无限增长
+    """
+
+    def __init__(self, fetcher: DataFetcher, db: Database, data_source: str, options: Dict):
+        self.fetcher = fetcher
+        self.db = db
+        self.data_source = data_source
+        self.options = options
+        self.limiter = get_rate_limiter(data_source, options['requests_per_second'], options['burst'])
+        self.stats = {}
+
+    def run(self, tasks: List[Dict], on_progress: Optional[Callable[[Dict, Optional[str], Dict], None]] = None,
+            on_written: Optional[Callable[[List[Tuple[Dict, Optional[str]]]], None]] = None) -> Dict:
+        """
+        执行抓取任务
+
+        Args:
+            tasks: 任务列表，每项包含 ts_code, name, start_date, end_date
+            on_progress: 每只股票抓取完成（或失败）时在写入线程中回调 (task, error_msg, stats)
+            on_written: 每批提交后回调 [(task, error_msg)]，error_msg 为 None 表示该股票数据已写入数据库
+                        （没有新数据的股票也算成功），否则为抓取或写入失败的原因
+
+        Returns:
+            统计信息：processed, succeeded, failed, rows, elapsed, stocks_per_second, rows_per_second, cache_hits
+        """
+        workers = min(self.options['workers'], len(tasks)) or 1
+        task_queue: queue.Queue = queue.Queue()
+        for task in tasks:
+            task_queue.put(task)
+        result_queue: queue.Queue = queue.Queue(maxsize=max(workers * 2, self.options['write_batch_size']))
+        stop_event = threading.Event()
+
+        self.stats = {'total': len(tasks), 'processed': 0, 'succeeded': 0, 'failed': 0, 'rows': 0,
+                      'elapsed': 0.0, 'stocks_per_second': 0.0, 'rows_per_second': 0.0, 'workers': workers,
+                      'cache_hits': 0}
+        self._cache_hits_at_start = self._cache_hits()
+        started = time.monotonic()
+
+        threads = [threading.Thread(target=self._fetch_worker, args=(task_queue, result_queue, stop_event),
+                                    name=f"fetch-{self.data_source}-{i}", daemon=True)
+                   for i in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        pending: List[Tuple[Dict, Optional[pd.DataFrame], Optional[str]]] = []
+        last_flush = time.monotonic()
+        try:
+            while self.stats['processed'] < len(tasks):
+                try:
+                    task, kline_df, error = result_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if pending and time.monotonic() - last_flush >= self.options['flush_interval']:
+                        self._flush(pending, on_written)
+                        pending, last_flush = [], time.monotonic()
+                    if not any(thread.is_alive() for thread in threads) and result_queue.empty():
+                        break
+                    continue
+
+                self.stats['processed'] += 1
+                if error is None:
+                    self.stats['succeeded'] += 1
+                else:
+                    self.stats['failed'] += 1
+                pending.append((task, kline_df, error))
+                self._update_throughput(started)
+                if on_progress:
+                    on_progress(task, error, dict(self.stats))
+
+                if len(pending) >= self.options['write_batch_size'] or \
+                        (pending and time.monotonic() - last_flush >= self.options['flush_interval']):
+                    self._flush(pending, on_written)
+                    pending, last_flush = [], time.monotonic()
+
+            if pending:
+                self._flush(pending, on_written)
+        finally:
+            stop_event.set()
+            for thread in threads:
+                thread.join(timeout=5)
+
+        self._update_throughput(started)
+        return dict(self.stats)
+
+    def _fetch_worker(self, task_queue: queue.Queue, result_queue: queue.Queue, stop_event: threading.Event):
+        """抓取线程：获取月K线并计算涨跌幅（请求失败抛出 FetchError 时记为失败，空结果表示没有新数据）"""
+        while not stop_event.is_set():
+            try:
+                task = task_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            ts_code = task['ts_code']
+            try:
+                kline_df = self.fetcher.get_monthly_kline(ts_code, task['start_date'], task['end_date'],
+                                                          before_request=lambda: self.limiter.acquire(stop_event))
+                if not kline_df.empty:
+                    kline_df = self.fetcher.calculate_pct_chg(kline_df)
+                result = (task, kline_df, None)
+            except Exception as e:
+                print(f"Error fetching data for {ts_code}: {e}")
+                result = (task, None, str(e))
+
+            while not stop_event.is_set():
+                try:
+                    result_queue.put(result, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def _flush(self, items: List[Tuple[Dict, Optional[pd.DataFrame], Optional[str]]],
+               on_written: Optional[Callable] = None):
+        """批量写入；整批失败时逐只股票写入，只跳过出错的股票"""
+        results = [(task, error) for task, kline_df, error in items]
+        written = [(index, kline_df) for index, (task, kline_df, error) in enumerate(items)
+                   if error is None and kline_df is not None and not kline_df.empty]
+        try:
+            self.stats['rows'] += self.db.save_monthly_kline_batch([kline_df for _, kline_df in written],
+                                                                   data_source=self.data_source)
+        except Exception as e:
+            print(f"Error saving batch of {len(written)} stocks: {e}，改为逐只写入")
+            for index, kline_df in written:
+                try:
+                    self.stats['rows'] += self.db.save_monthly_kline_batch([kline_df], data_source=self.data_source)
+                except Exception as save_error:
+                    task = results[index][0]
+                    print(f"Error saving data for {task['ts_code']}: {save_error}")
+                    print(f"Traceback: {traceback.format_exc()}")
+                    results[index] = (task, f"写入失败: {save_error}")
+                    self.stats['succeeded'] -= 1
+                    self.stats['failed'] += 1
+        if on_written:
+            on_written(results)
+
+    def _cache_hits(self) -> int:
+        return self.fetcher.cache.status()['hits'] if self.fetcher.cache is not None else 0
+
+    def _update_throughput(self, started: float):
+        self.stats['cache_hits'] = self._cache_hits() - self._cache_hits_at_start
+        elapsed = time.monotonic() - started
+        self.stats['elapsed'] = round(elapsed, 2)
+        if elapsed > 0:
+            self.stats['stocks_per_second'] = round(self.stats['processed'] / elapsed, 2)
+            self.stats['rows_per_second'] = round(self.stats['rows'] / elapsed, 1)
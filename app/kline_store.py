@@ -0,0 +1,335 @@
+"""
+月K线内存列存储（统计查询直接在内存中的 NumPy 数组上计算，不再每次从 SQLite 读取）
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+
+# 与 Database.get_month_summary 返回的列一致
+MONTH_SUMMARY_COLUMNS = ['ts_code', 'year', 'total_count', 'up_count', 'down_count', 'sum_up_pct', 'sum_down_pct']
+
+# 快照中每个分区保存的数组（每个数组一个 .npy 文件，股票代码保存在 codes.npy）
+_PARTITION_ARRAYS = ('stock_index', 'offsets', 'trade_date', 'year', 'month', 'close', 'pct_chg')
+
+_KLINE_QUERY = """
+    SELECT ts_code, trade_date, year, month, close, pct_chg FROM monthly_kline
+    WHERE data_source = ? {conditions}
+    ORDER BY ts_code, trade_date
+"""
+
+
+class KlinePartition:
+    """
+    一个数据源的月K线列数据（按 ts_code、trade_date 排序）
+
+    - codes: 排序后的股票代码，stock_index 为每行所属股票在 codes 中的下标
+    - offsets: 第 i 只股票的行为 offsets[i]:offsets[i + 1]
+    - trade_date（YYYYMMDD 整数）/ year / month / close / pct_chg: 每行一个值的连续数组（缺失值为 NaN）
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        stock_index, codes = pd.factorize(df['ts_code'], sort=True)
+        self.codes = codes.to_numpy(dtype=object)
+        self.stock_index = stock_index.astype(np.int32)
+        self.offsets = np.searchsorted(self.stock_index, np.arange(len(self.codes) + 1)).astype(np.int64)
+        self.trade_date = pd.to_numeric(df['trade_date'], errors='coerce').fillna(0).to_numpy(dtype=np.int32)
+        self.year = df['year'].to_numpy(dtype=np.int16)
+        self.month = df['month'].to_numpy(dtype=np.int8)
+        self.close = pd.to_numeric(df['close'], errors='coerce').to_numpy(dtype=np.float64)
+        self.pct_chg = pd.to_numeric(df['pct_chg'], errors='coerce').to_numpy(dtype=np.float64)
+        self.mapped = False
+
+    def save(self, directory: str):
+        """把各数组保存为 .npy 文件（股票代码保存为定长字符串数组）"""
+        os.makedirs(directory, exist_ok=True)
+        codes = self.codes.astype(str) if len(self.codes) else np.empty(0, dtype='<U1')
+        np.save(os.path.join(directory, 'codes.npy'), codes)
+        for name in _PARTITION_ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: str) -> 'KlinePartition':
+        """以只读内存映射方式打开 save() 保存的分区（不复制数据，多个进程共享同一份页缓存）"""
+        partition = cls.__new__(cls)
+        partition.codes = np.load(os.path.join(directory, 'codes.npy')).astype(object)
+        for name in _PARTITION_ARRAYS:
+            setattr(partition, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r'))
+        partition.mapped = True
+        return partition
+
+    def __len__(self):
+        return len(self.stock_index)
+
+    @property
+    def nbytes(self) -> int:
+        """数组占用的内存（股票代码按字符串对象估算）"""
+        arrays = (self.stock_index, self.offsets, self.trade_date, self.year, self.month, self.close, self.pct_chg)
+        return sum(array.nbytes for array in arrays) + sum(len(code) + 49 for code in self.codes)
+
+    def to_frame(self, keep: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """还原为 DataFrame（keep 为要保留的股票的布尔掩码）"""
+        rows = keep[self.stock_index] if keep is not None else slice(None)
+        return pd.DataFrame({
+            'ts_code': self.codes[self.stock_index[rows]], 'trade_date': self.trade_date[rows],
+            'year': self.year[rows], 'month': self.month[rows],
+            'close': self.close[rows], 'pct_chg': self.pct_chg[rows],
+        })
+
+    def month_summary(self, month: int, start_year: int = None, end_year: int = None,
+                      ts_codes: Iterable[str] = None) -> pd.DataFrame:
+        """
+        指定月份的年度涨跌汇总，结果与 Database.get_month_summary 相同（每只股票每年一行，按股票、年份排序）
+
+        Args:
+            ts_codes: 只统计这些股票（None 表示全部）
+        """
+        if ts_codes is not None:
+            wanted = np.asarray(list(ts_codes), dtype=object)
+            positions = np.searchsorted(self.codes, wanted)
+            found = positions < len(self.codes)
+            found[found] = self.codes[positions[found]] == wanted[found]
+            stocks = np.unique(positions[found])
+            # 少量股票（单只股票、单个行业）按偏移量取各自的行，不扫描全部数据
+            rows = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in stocks]) \
+                if len(stocks) else np.empty(0, dtype=np.int64)
+            mask = self.month[rows] == month
+        else:
+            rows = None
+            mask = self.month == month
+        year = self.year if rows is None else self.year[rows]
+        if start_year:
+            mask &= year >= start_year
+        if end_year:
+            mask &= year <= end_year
+
+        selected = np.flatnonzero(mask)
+        if rows is not None:
+            selected = rows[selected]
+        if len(selected) == 0:
+            return pd.DataFrame(columns=MONTH_SUMMARY_COLUMNS)
+
+        # 同一股票、同一年的行相邻（按 ts_code、trade_date 排序），逐段累加
+        stock_index = self.stock_index[selected]
+        year = self.year[selected].astype(np.int64)
+        keys = stock_index.astype(np.int64) * 10000 + year
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        pct = self.pct_chg[selected]
+        up = pct > 0
+        down = pct < 0
+        return pd.DataFrame({
+            'ts_code': self.codes[stock_index[starts]],
+            'year': year[starts],
+            'total_count': np.add.reduceat((~np.isnan(pct)).astype(np.int64), starts),
+            'up_count': np.add.reduceat(up.astype(np.int64), starts),
+            'down_count': np.add.reduceat(down.astype(np.int64), starts),
+            'sum_up_pct': np.add.reduceat(np.where(up, pct, 0.0), starts),
+            'sum_down_pct': np.add.reduceat(np.where(down, pct, 0.0), starts),
+        })
+
+
+class KlineSnapshot:
+    """
+    月K线快照目录（多个 Web 服务进程共享）
+
+    每次导出写入一个新的版本目录（gen-纳秒时间戳-进程号/数据源/*.npy），全部写完后替换 CURRENT 文件指向新版本，
+    读取方看到的总是完整的某一版本；只保留最近 keep 个版本（仍在使用旧版本的进程已映射的文件删除后仍可读取）
+    """
+
+    def __init__(self, directory: str, keep: int = 2):
+        self.directory = directory
+        self.keep = max(int(keep), 1)
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def _current_file(self) -> str:
+        return os.path.join(self.directory, 'CURRENT')
+
+    def current(self) -> Optional[Dict]:
+        """当前版本信息（generation, created, data_sources），尚未导出时返回 None"""
+        try:
+            with open(self._current_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def open(self, generation: str, data_source: str) -> Optional[KlinePartition]:
+        """映射指定版本中的数据源分区（版本中没有该数据源时返回 None）"""
+        directory = os.path.join(self.directory, generation, data_source)
+        if not os.path.isdir(directory):
+            return None
+        return KlinePartition.load(directory)
+
+    def export(self, partitions: Dict[str, KlinePartition]) -> str:
+        """写入新版本并切换 CURRENT，返回版本名"""
+        generation = f"gen-{time.time_ns():020d}-{os.getpid()}"
+        tmp_directory = os.path.join(self.directory, f".{generation}.tmp")
+        for data_source, partition in partitions.items():
+            partition.save(os.path.join(tmp_directory, data_source))
+        os.makedirs(tmp_directory, exist_ok=True)
+        os.replace(tmp_directory, os.path.join(self.directory, generation))
+
+        current = {'generation': generation, 'created': time.time(), 'data_sources': sorted(partitions)}
+        tmp_file = f"{self._current_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(current, f)
+        os.replace(tmp_file, self._current_file)
+        self._cleanup(generation)
+        return generation
+
+    def _cleanup(self, current_generation: str):
+        """删除较旧的版本和中断的导出留下的临时目录"""
+        generations = sorted(name for name in os.listdir(self.directory) if name.startswith('gen-'))
+        stale = [name for name in generations[:-self.keep] if name != current_generation]
+        stale += [name for name in os.listdir(self.directory)
+                  if name.startswith('.gen-') and os.path.getmtime(os.path.join(self.directory, name)) < time.time() - 3600]
+        for name in stale:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+class KlineStore:
+    """
+    月K线内存列存储（线程安全）
+
+    - 每个数据源首次查询时从 SQLite 整体载入
+    - Database.save_monthly_kline_batch 写入后把涉及的股票标记为待刷新，下次查询时只重新读取这些股票
+    - Database.delete_monthly_kline_by_source 删除数据源时丢弃对应的分区
+    - 只能感知同一个 Database 实例的写入，其他进程直接修改数据库后需要调用 invalidate()
+    - 指定 snapshot 时优先映射快照中的分区（多个进程共享内存），快照切换到新版本后下次查询自动重新映射；
+      快照中没有的数据源仍从 SQLite 载入
+    """
+
+    def __init__(self, db, snapshot: Optional[KlineSnapshot] = None):
+        self.db = db
+        self.snapshot = snapshot
+        self._generation: Optional[str] = None
+        self._lock = threading.RLock()
+        self._partitions: Dict[str, KlinePartition] = {}
+        self._dirty: Dict[str, Set[str]] = {}
+        self._stats = {'loads': 0, 'patches': 0, 'invalidations': 0, 'load_seconds': 0.0,
+                       'snapshot_maps': 0, 'snapshot_exports': 0}
+        db.kline_store = self
+
+    def _read(self, data_source: str, ts_codes: List[str] = None) -> pd.DataFrame:
+        conditions = ''
+        params = [data_source]
+        if ts_codes is not None:
+            conditions = f"AND ts_code IN ({','.join('?' * len(ts_codes))})"
+            params.extend(ts_codes)
+        with self.db.read_connection() as conn:
+            return pd.read_sql_query(_KLINE_QUERY.format(conditions=conditions), conn, params=params)
+
+    def partition(self, data_source: str) -> KlinePartition:
+        """获取数据源的列数据（首次使用时载入，有待刷新的股票时先增量更新）"""
+        with self._lock:
+            if self.snapshot is not None:
+                self._check_snapshot()
+            partition = self._partitions.get(data_source)
+            dirty = self._dirty.pop(data_source, None)
+            if partition is None and self._generation is not None:
+                partition = self.snapshot.open(self._generation, data_source)
+                if partition is not None:
+                    self._stats['snapshot_maps'] += 1
+                    self._partitions[data_source] = partition
+                    return partition
+            if partition is None:
+                started = time.perf_counter()
+                partition = KlinePartition(self._read(data_source))
+                self._stats['loads'] += 1
+                self._stats['load_seconds'] += time.perf_counter() - started
+                self._partitions[data_source] = partition
+            elif dirty:
+                partition = self._patch(data_source, partition, sorted(dirty))
+                self._partitions[data_source] = partition
+            return partition
+
+    def _check_snapshot(self):
+        """
+        快照切换到新版本时丢弃已映射的旧版本分区，以及新版本中包含的数据源的分区
+        （从 SQLite 载入的分区可能缺少其他进程写入的数据，新版本导出时已包含这些数据）
+        """
+        current = self.snapshot.current()
+        generation = current['generation'] if current else None
+        if generation != self._generation:
+            data_sources = set(current['data_sources']) if current else set()
+            for data_source in [name for name, partition in self._partitions.items()
+                                if partition.mapped or name in data_sources]:
+                del self._partitions[data_source]
+                self._dirty.pop(data_source, None)
+            self._generation = generation
+
+    def export_snapshot(self) -> Optional[str]:
+        """从 SQLite 重新读取所有数据源的月K线并导出为快照新版本（未启用快照时返回 None）"""
+        if self.snapshot is None:
+            return None
+        partitions = {data_source: KlinePartition(self._read(data_source))
+                      for data_source in self.db.get_available_data_sources()}
+        generation = self.snapshot.export(partitions)
+        with self._lock:
+            self._stats['snapshot_exports'] += 1
+            # 本进程写入后等待刷新的股票已包含在新版本中
+            for data_source in partitions:
+                if data_source in self._partitions and not self._partitions[data_source].mapped:
+                    del self._partitions[data_source]
+                self._dirty.pop(data_source, None)
+        return generation
+
+    def _patch(self, data_source: str, partition: KlinePartition, ts_codes: List[str]) -> KlinePartition:
+        """重新读取指定股票的月K线，替换分区中这些股票的行"""
+        keep = ~np.isin(partition.codes, ts_codes)
+        fresh = pd.concat([self._read(data_source, ts_codes[i:i + 500]) for i in range(0, len(ts_codes), 500)],
+                          ignore_index=True)
+        df = pd.concat([partition.to_frame(keep), KlinePartition(fresh).to_frame()], ignore_index=True)
+        df = df.sort_values(['ts_code', 'trade_date'], kind='stable', ignore_index=True)
+        self._stats['patches'] += 1
+        return KlinePartition(df)
+
+    def mark_dirty(self, data_source: str, ts_codes: Iterable[str]):
+        """记录写入过的股票（只对从 SQLite 载入的分区有效，快照分区在重新导出后更新）"""
+        with self._lock:
+            partition = self._partitions.get(data_source)
+            if partition is not None and not partition.mapped:
+                self._dirty.setdefault(data_source, set()).update(ts_codes)
+
+    def invalidate(self, data_source: str = None):
+        """丢弃指定数据源（或全部）的列数据，下次查询时重新载入"""
+        with self._lock:
+            if data_source is None:
+                self._partitions.clear()
+                self._dirty.clear()
+            else:
+                self._partitions.pop(data_source, None)
+                self._dirty.pop(data_source, None)
+            self._stats['invalidations'] += 1
+
+    def month_summary(self, month: int, start_year: int = None, end_year: int = None,
+                      data_source: str = None, ts_codes: Iterable[str] = None) -> pd.DataFrame:
+        """指定月份的年度涨跌汇总（同 Database.get_month_summary）"""
+        return self.partition(data_source).month_summary(month, start_year, end_year, ts_codes)
+
+    def status(self) -> Dict:
+        """已载入的分区、行数和内存占用"""
+        with self._lock:
+            partitions = {
+                data_source: {
+                    'rows': len(partition),
+                    'stocks': len(partition.codes),
+                    'memory_mb': round(partition.nbytes / 1024 / 1024, 2),
+                    'mapped': partition.mapped,
+                    'pending_stocks': len(self._dirty.get(data_source, ())),
+                }
+                for data_source, partition in self._partitions.items()
+            }
+            status = dict(self._stats, load_seconds=round(self._stats['load_seconds'], 3), partitions=partitions,
+                          memory_mb=round(sum(p['memory_mb'] for p in partitions.values() if not p['mapped']), 2),
+                          mapped_mb=round(sum(p['memory_mb'] for p in partitions.values() if p['mapped']), 2))
+        if self.snapshot is not None:
+            status['snapshot'] = dict(self.snapshot.current() or {}, directory=self.snapshot.directory,
+                                      mapped_generation=self._generation)
+        return status
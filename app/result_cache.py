@@ -0,0 +1,83 @@
+"""
+统计结果缓存（进程内 LRU + 过期时间）
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+# 结果缓存默认参数（可通过 config.json 的 result_cache 配置项覆盖）
+# - max_entries: 最多缓存的查询结果数，超出时淘汰最久未使用的结果
+# - ttl_seconds: 结果有效期（数据变化时缓存键中的数据版本随之变化，有效期只用于回收不再使用的结果）
+DEFAULT_RESULT_CACHE_OPTIONS = {
+    'enabled': True,
+    'max_entries': 256,
+    'ttl_seconds': 3600,
+}
+
+
+class ResultCache:
+    """
+    查询结果缓存（线程安全）
+
+    缓存键由调用方给出（规范化后的查询参数 + 数据版本），数据更新后版本变化，旧结果不会再被命中，
+    之后按 LRU 或过期时间回收
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600):
+        self.max_entries = max(int(max_entries), 1)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()  # 键 -> (写入时间, 结果)
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds and time.time() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """命中时返回缓存的结果，否则调用 compute() 计算并缓存（同一键并发未命中时可能重复计算）"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def status(self) -> Dict:
+        """命中次数、命中率和缓存条数"""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries,
+                        hit_rate=round(self._stats['hits'] / lookups, 4) if lookups else 0.0)
+
+
+def create_result_cache(options: Optional[Dict] = None) -> Optional[ResultCache]:
+    """按配置创建结果缓存（未启用时返回 None）"""
+    options = dict(DEFAULT_RESULT_CACHE_OPTIONS, **(options or {}))
+    if not options.get('enabled'):
+        return None
+    return ResultCache(max_entries=options['max_entries'], ttl_seconds=options['ttl_seconds'])
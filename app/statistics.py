@@ -1,14 +1,152 @@
 """
 统计计算模块
 """
+import functools
+import inspect
+import multiprocessing
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 from typing import Dict, List, Optional, Tuple
-from app.database import Database
+from app.database import Database, month_summary_query, read_only_uri
+from app.kline_store import KlineSnapshot, KlineStore
+from app.result_cache import ResultCache
+
+
+# 统计计算默认参数（可通过 config.json 的 statistics 配置项覆盖）
+# - mode: single（在当前进程中计算）或 process（全市场统计按股票代码区间分片，
+#   由进程池中的工作进程以只读方式各自读取数据库并累加，主进程合并结果）
+# - workers: 进程池大小（分片数）
+# - kline_store: 是否把月K线载入内存列存储，统计直接在内存中计算（启用时优先于 mode）
+# - kline_snapshot: 是否使用磁盘快照（内存映射，多个 Web 服务进程共享，数据更新后重新导出；启用时同时启用 kline_store）
+# - snapshot_directory: 快照目录（默认 $DATA_DIR/kline_snapshot）
+DEFAULT_STATISTICS_OPTIONS = {
+    'mode': 'single',
+    'workers': 4,
+    'kline_store': False,
+    'kline_snapshot': False,
+    'snapshot_directory': None,
+}
+
+
+def _cached_result(name: str):
+    """
+    统计结果缓存装饰器：缓存键为 (名称, 数据版本, 规范化后的参数)，返回缓存结果的副本（调用方可以修改）
+    
+    未指定数据源的调用（数据源取自当前配置）不走缓存
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+        
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.result_cache is None:
+                return method(self, *args, **kwargs)
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            params = list(bound.arguments.items())[1:]
+            if bound.arguments.get('data_source') is None:
+                return method(self, *args, **kwargs)
+            key = (name, self.data_version()) + tuple(
+                (param, value.strip() if isinstance(value, str) else value) for param, value in params
+            )
+            results = self.result_cache.get_or_compute(key, lambda: method(self, *args, **kwargs))
+            return [dict(result) for result in results]
+        return wrapper
+    return decorator
 
 
 class Statistics:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, options: Dict = None, result_cache: Optional[ResultCache] = None):
         self.db = db
+        self.result_cache = result_cache
+        self.options = dict(DEFAULT_STATISTICS_OPTIONS, **(options or {}))
+        self.workers = max(int(self.options['workers']), 1)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        snapshot = None
+        if self.options['kline_snapshot']:
+            snapshot = KlineSnapshot(self.options['snapshot_directory'] or
+                                     os.path.join(os.getenv('DATA_DIR', '.'), 'kline_snapshot'))
+        self.kline_store = KlineStore(db, snapshot) if self.options['kline_store'] or snapshot else None
+    
+    def data_version(self) -> Tuple:
+        """
+        当前数据版本（结果缓存键的一部分）：数据库中的数据版本，启用快照时加上快照版本
+        
+        数据版本保存在数据库中，多进程部署时其他进程写入数据后本进程的缓存同样失效
+        """
+        generation = None
+        if self.kline_store is not None and self.kline_store.snapshot is not None:
+            current = self.kline_store.snapshot.current()
+            generation = current['generation'] if current else None
+        return self.db.data_version, generation
+    
+    @property
+    def use_process_pool(self) -> bool:
+        return self.options['mode'] == 'process' and self.workers > 1
+    
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """首次使用时创建进程池（spawn方式启动，不继承Web服务进程中的线程和数据库连接）"""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+    
+    def close(self):
+        """关闭进程池"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+    
+    def _shard_ranges(self, ts_codes) -> List[Tuple[Optional[str], Optional[str]]]:
+        """按股票代码把全市场切成 workers 个左闭右开区间（首尾区间不设边界，覆盖所有代码）"""
+        codes = sorted(set(ts_codes))
+        bounds = sorted({codes[len(codes) * i // self.workers] for i in range(1, self.workers)}) if codes else []
+        edges = [None] + bounds + [None]
+        return list(zip(edges[:-1], edges[1:]))
+    
+    def _month_summary(self, month: int, start_year: int, end_year: int, data_source: str,
+                       ts_code: str = None, industry_name: str = None, industry_type: str = 'sw') -> pd.DataFrame:
+        """指定月份的年度涨跌汇总（启用内存列存储时从内存计算，否则读取汇总表）"""
+        if self.kline_store is None:
+            return self.db.get_month_summary(month, start_year, end_year, data_source=data_source, ts_code=ts_code,
+                                             industry_name=industry_name, industry_type=industry_type)
+        ts_codes = None
+        if ts_code:
+            ts_codes = [ts_code]
+        elif industry_name:
+            ts_codes = self.db.get_industry_stocks(industry_name, industry_type)
+        return self.kline_store.month_summary(month, start_year, end_year, data_source, ts_codes)
+    
+    def _load_market_summary(self, month: int, start_year: int, end_year: int, data_source: str,
+                             ts_codes=None) -> pd.DataFrame:
+        """
+        全市场月度汇总按股票累加（_aggregate_month_summary 的结果）
+        
+        进程池模式下每个工作进程处理一个股票代码区间，区间互不重叠且按代码排列，
+        各分片结果直接拼接即与单进程计算的结果相同
+        """
+        if self.kline_store is not None or not self.use_process_pool:
+            return self._aggregate_month_summary(self._month_summary(month, start_year, end_year, data_source))
+        
+        if ts_codes is None:
+            ts_codes = self.db.get_stocks()['ts_code']
+        pool = self._get_pool()
+        db_uri = read_only_uri(self.db.db_path)
+        futures = [
+            pool.submit(_month_summary_shard, db_uri, month, start_year, end_year, data_source, ts_code_range)
+            for ts_code_range in self._shard_ranges(ts_codes)
+        ]
+        parts = [part for part in (future.result() for future in futures) if not part.empty]
+        if not parts:
+            return self._aggregate_month_summary(pd.DataFrame())
+        return pd.concat(parts)
     
     def calculate_stock_month_statistics(self, ts_code: str, month: int, 
                                         start_year: int = None, end_year: int = None,
@@ -32,33 +170,12 @@ class Statistics:
             config = Config()
             data_source = config.get('data_source', 'akshare')
         
-        # 使用指定的数据源查询
-        df = self.db.get_monthly_kline(ts_code=ts_code, month=month, 
-                                      start_year=start_year, end_year=end_year,
-                                      data_source=data_source)
-        
-        # 如果指定数据源没有数据，且没有指定数据源，则尝试所有数据源
-        if df.empty and data_source is None:
-            df = self.db.get_monthly_kline(ts_code=ts_code, month=month, 
-                                          start_year=start_year, end_year=end_year)
-        
-        if df.empty:
-            return {
-                'ts_code': ts_code,
-                'month': month,
-                'total_count': 0,
-                'up_count': 0,
-                'down_count': 0,
-                'avg_up_pct': 0,
-                'avg_down_pct': 0,
-                'up_probability': 0,
-                'down_probability': 0
-            }
-        
-        # 过滤有效数据（有涨跌幅的）
-        df = df[df['pct_chg'].notna()]
+        # 从月度汇总表读取该股票每年的汇总行并累加
+        summary = self._aggregate_month_summary(
+            self._month_summary(month, start_year, end_year, data_source, ts_code=ts_code)
+        )
         
-        if df.empty:
+        if summary.empty or summary['total_count'].iloc[0] == 0:
             return {
                 'ts_code': ts_code,
                 'month': month,
@@ -71,32 +188,11 @@ class Statistics:
                 'down_probability': 0
             }
         
-        # 计算统计
-        up_df = df[df['pct_chg'] > 0]
-        down_df = df[df['pct_chg'] < 0]
-        
-        total_count = len(df)
-        up_count = len(up_df)
-        down_count = len(down_df)
-        
-        avg_up_pct = up_df['pct_chg'].mean() if up_count > 0 else 0
-        avg_down_pct = down_df['pct_chg'].mean() if down_count > 0 else 0
-        
-        up_probability = (up_count / total_count * 100) if total_count > 0 else 0
-        down_probability = (down_count / total_count * 100) if total_count > 0 else 0
-        
-        return {
-            'ts_code': ts_code,
-            'month': month,
-            'total_count': total_count,
-            'up_count': up_count,
-            'down_count': down_count,
-            'avg_up_pct': round(avg_up_pct, 2),
-            'avg_down_pct': round(avg_down_pct, 2),
-            'up_probability': round(up_probability, 2),
-            'down_probability': round(down_probability, 2)
-        }
+        row = summary.iloc[0]
+        return _build_month_stat(ts_code, month, row['total_count'], row['up_count'], row['down_count'],
+                                 row['sum_up_pct'], row['sum_down_pct'])
     
+    @_cached_result('month_filter')
     def calculate_month_filter_statistics(self, month: int, start_year: int, 
                                          end_year: int, top_n: int = 20,
                                          data_source: str = None, min_count: int = 0) -> List[Dict]:
@@ -116,28 +212,44 @@ class Statistics:
         """
         # 获取所有股票
         stocks_df = self.db.get_stocks(exclude_delisted=True)
+        if stocks_df.empty:
+            return []
         
-        results = []
-        for idx, row in stocks_df.iterrows():
-            ts_code = row['ts_code']
-            stat = self.calculate_stock_month_statistics(ts_code, month, start_year, end_year, data_source=data_source)
-            
-            # 添加股票信息
-            stat['symbol'] = row['symbol']
-            stat['name'] = row['name']
-            
-            # 只包含有数据的股票
-            if stat['total_count'] > 0:
-                # 检查最小涨跌次数筛选（上涨次数 + 下跌次数 >= min_count）
-                total_count = stat['up_count'] + stat['down_count']
-                if min_count == 0 or total_count >= min_count:
-                    results.append(stat)
+        if data_source is None:
+            from app.config import Config
+            config = Config()
+            data_source = config.get('data_source', 'akshare')
         
-        # 按上涨概率排序
-        results.sort(key=lambda x: x['up_probability'], reverse=True)
+        # 一次查询取出全市场该月份的年度汇总行，再一次分组累加完成所有股票的统计
+        summary = self._load_market_summary(month, start_year, end_year, data_source,
+                                            ts_codes=stocks_df['ts_code'])
+        summary = summary[summary['total_count'] > 0]
+        
+        # 按股票列表顺序对齐汇总结果（保持与逐只计算相同的先后顺序）
+        merged = stocks_df[['ts_code', 'symbol', 'name']].merge(
+            summary, left_on='ts_code', right_index=True, how='inner', sort=False
+        )
         
-        return results[:top_n]
+        # 检查最小涨跌次数筛选（上涨次数 + 下跌次数 >= min_count）
+        if min_count > 0:
+            merged = merged[(merged['up_count'] + merged['down_count']) >= min_count]
+        
+        results = [
+            _build_month_stat(ts_code, month, total_count, up_count, down_count, sum_up_pct, sum_down_pct)
+            for ts_code, total_count, up_count, down_count, sum_up_pct, sum_down_pct in zip(
+                merged['ts_code'], merged['total_count'], merged['up_count'], merged['down_count'],
+                merged['sum_up_pct'], merged['sum_down_pct']
+            )
+        ]
+        for stat, symbol, name in zip(results, merged['symbol'], merged['name']):
+            stat['symbol'] = symbol
+            stat['name'] = name
+        
+        # 按上涨概率取前N支
+        probabilities = np.array([stat['up_probability'] for stat in results], dtype=float)
+        return [results[i] for i in _top_n_indices(probabilities, top_n)]
     
+    @_cached_result('industry_statistics')
     def calculate_industry_statistics(self, month: int, start_year: int, end_year: int,
                                      industry_type: str = 'sw', data_source: str = None) -> List[Dict]:
         """
@@ -153,55 +265,66 @@ class Statistics:
         Returns:
             行业统计列表（按上涨概率降序）
         """
-        # 获取所有行业
-        industries = self.db.get_all_industries(industry_type)
+        if data_source is None:
+            from app.config import Config
+            config = Config()
+            data_source = config.get('data_source', 'akshare')
+        
+        # 一次查询取出所有行业的成分股，一次查询取出全市场该月份的汇总，在内存中合并后按行业汇总
+        members = self.db.get_industry_members(industry_type)
+        if members.empty:
+            return []
+        
+        summary = self._load_market_summary(month, start_year, end_year, data_source,
+                                            ts_codes=members['ts_code'])
+        summary = summary[summary['total_count'] > 0]
+        
+        # 单只股票的平均涨跌幅先取整再乘以次数（与逐只累加的口径一致）
+        up_count = summary['up_count'].to_numpy(dtype=np.int64)
+        down_count = summary['down_count'].to_numpy(dtype=np.int64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_up = np.where(up_count > 0, np.round(summary['sum_up_pct'].to_numpy(dtype=float) / up_count, 2), 0.0)
+            avg_down = np.where(down_count > 0, np.round(summary['sum_down_pct'].to_numpy(dtype=float) / down_count, 2), 0.0)
+        summary = summary.assign(up_pct_sum=avg_up * up_count, down_pct_sum=avg_down * down_count)
+        
+        merged = members.merge(summary, left_on='ts_code', right_index=True, how='left', sort=False)
         
         results = []
-        for industry_name in industries:
-            # 获取行业下的股票
-            stock_codes = self.db.get_industry_stocks(industry_name, industry_type)
-            
-            if not stock_codes:
+        for industry_name, group in merged.groupby('industry_name', sort=False):
+            # 行业内没有任何有数据的股票则跳过
+            stocks = group[group['total_count'].notna()]
+            if stocks.empty:
                 continue
             
-            # 统计行业整体表现
-            total_up_count = 0
-            total_down_count = 0
-            total_count = 0
-            total_up_pct_sum = 0
-            total_down_pct_sum = 0
+            total_count = int(stocks['total_count'].sum())
+            total_up_count = int(stocks['up_count'].sum())
+            total_down_count = int(stocks['down_count'].sum())
+            # 按成分股顺序依次累加（cumsum为顺序求和）
+            total_up_pct_sum = np.cumsum(stocks['up_pct_sum'].to_numpy(dtype=float))[-1]
+            total_down_pct_sum = np.cumsum(stocks['down_pct_sum'].to_numpy(dtype=float))[-1]
             
-            for ts_code in stock_codes:
-                stat = self.calculate_stock_month_statistics(ts_code, month, start_year, end_year, data_source=data_source)
-                if stat['total_count'] > 0:
-                    total_count += stat['total_count']
-                    total_up_count += stat['up_count']
-                    total_down_count += stat['down_count']
-                    total_up_pct_sum += stat['avg_up_pct'] * stat['up_count']
-                    total_down_pct_sum += stat['avg_down_pct'] * stat['down_count']
+            avg_up_pct = total_up_pct_sum / total_up_count if total_up_count > 0 else 0
+            avg_down_pct = total_down_pct_sum / total_down_count if total_down_count > 0 else 0
+            up_probability = (total_up_count / total_count * 100)
             
-            if total_count > 0:
-                avg_up_pct = total_up_pct_sum / total_up_count if total_up_count > 0 else 0
-                avg_down_pct = total_down_pct_sum / total_down_count if total_down_count > 0 else 0
-                up_probability = (total_up_count / total_count * 100)
-                
-                results.append({
-                    'industry_name': industry_name,
-                    'stock_count': len(stock_codes),
-                    'total_count': total_count,
-                    'up_count': total_up_count,
-                    'down_count': total_down_count,
-                    'avg_up_pct': round(avg_up_pct, 2),
-                    'avg_down_pct': round(avg_down_pct, 2),
-                    'up_probability': round(up_probability, 2),
-                    'down_probability': round((total_down_count / total_count * 100), 2)
-                })
+            results.append({
+                'industry_name': industry_name,
+                'stock_count': len(group),
+                'total_count': total_count,
+                'up_count': total_up_count,
+                'down_count': total_down_count,
+                'avg_up_pct': round(avg_up_pct, 2),
+                'avg_down_pct': round(avg_down_pct, 2),
+                'up_probability': round(up_probability, 2),
+                'down_probability': round((total_down_count / total_count * 100), 2)
+            })
         
         # 按上涨概率排序
         results.sort(key=lambda x: x['up_probability'], reverse=True)
         
         return results
     
+    @_cached_result('industry_top_stocks')
     def calculate_industry_top_stocks(self, industry_name: str, month: int,
                                      start_year: int, end_year: int,
                                      industry_type: str = 'sw', top_n: int = 20,
@@ -221,29 +344,146 @@ class Statistics:
         Returns:
             股票统计列表（按上涨概率降序）
         """
-        # 获取行业下的股票
-        stock_codes = self.db.get_industry_stocks(industry_name, industry_type)
+        if data_source is None:
+            from app.config import Config
+            config = Config()
+            data_source = config.get('data_source', 'akshare')
         
-        if not stock_codes:
+        # 一次查询取出该行业全部成分股的汇总
+        summary = self._aggregate_month_summary(
+            self._month_summary(month, start_year, end_year, data_source,
+                                industry_name=industry_name, industry_type=industry_type)
+        )
+        summary = summary[summary['total_count'] > 0]
+        if summary.empty:
             return []
         
-        # 获取股票信息
+        # 获取股票信息（只保留未退市股票）
         stocks_df = self.db.get_stocks(exclude_delisted=True)
+        stocks_df = stocks_df[['ts_code', 'symbol', 'name']].drop_duplicates('ts_code')
+        merged = summary.merge(stocks_df, left_index=True, right_on='ts_code', how='inner', sort=False)
         
         results = []
-        for ts_code in stock_codes:
-            stat = self.calculate_stock_month_statistics(ts_code, month, start_year, end_year, data_source=data_source)
-            
-            if stat['total_count'] > 0:
-                # 添加股票信息
-                stock_info = stocks_df[stocks_df['ts_code'] == ts_code]
-                if not stock_info.empty:
-                    stat['symbol'] = stock_info.iloc[0]['symbol']
-                    stat['name'] = stock_info.iloc[0]['name']
-                    results.append(stat)
+        for ts_code, symbol, name, total_count, up_count, down_count, sum_up_pct, sum_down_pct in zip(
+            merged['ts_code'], merged['symbol'], merged['name'], merged['total_count'],
+            merged['up_count'], merged['down_count'], merged['sum_up_pct'], merged['sum_down_pct']
+        ):
+            stat = _build_month_stat(ts_code, month, total_count, up_count, down_count, sum_up_pct, sum_down_pct)
+            stat['symbol'] = symbol
+            stat['name'] = name
+            results.append(stat)
         
-        # 按上涨概率排序
-        results.sort(key=lambda x: x['up_probability'], reverse=True)
+        # 按上涨概率取前N支
+        probabilities = np.array([stat['up_probability'] for stat in results], dtype=float)
+        return [results[i] for i in _top_n_indices(probabilities, top_n)]
+    
+    @staticmethod
+    def _aggregate_month_summary(summary_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        把年度汇总行按股票累加（总次数、上涨/下跌次数、涨幅/跌幅合计）
+        
+        Args:
+            summary_df: Database.get_month_summary 返回的汇总行，同一股票的行按年份排列
+        
+        Returns:
+            以 ts_code 为索引的累加结果
+        """
+        columns = ['total_count', 'up_count', 'down_count', 'sum_up_pct', 'sum_down_pct']
+        if summary_df.empty:
+            return pd.DataFrame(columns=columns, index=pd.Index([], name='ts_code'))
+        
+        codes = summary_df['ts_code'].to_numpy()
+        order = None
+        # 同一股票的行需要连续存放（稳定排序，不打乱年份顺序）
+        if not pd.Index(codes).is_monotonic_increasing:
+            order = np.argsort(codes, kind='stable')
+            codes = codes[order]
+        
+        def column(name, dtype):
+            values = summary_df[name].to_numpy(dtype=dtype)
+            return values[order] if order is not None else values
+        
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        group_ids = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(codes)]))
+        
+        summary = pd.DataFrame(index=pd.Index(codes[starts], name='ts_code'))
+        summary['total_count'] = np.add.reduceat(column('total_count', np.int64), starts)
+        for prefix in ('up', 'down'):
+            counts = column(f'{prefix}_count', np.int64)
+            sums = column(f'sum_{prefix}_pct', float)
+            summary[f'{prefix}_count'] = np.add.reduceat(counts, starts)
+            
+            # 只累加有涨（跌）的年份，逐段求和与 Series.mean 使用相同的求和顺序，保证取整后的结果一致
+            mask = counts > 0
+            values = sums[mask]
+            bounds = np.r_[0, np.cumsum(np.bincount(group_ids[mask], minlength=len(starts)))]
+            summary[f'sum_{prefix}_pct'] = [
+                values[bounds[i]:bounds[i + 1]].sum() if bounds[i + 1] > bounds[i] else 0.0
+                for i in range(len(starts))
+            ]
         
-        return results[:top_n]
+        return summary[columns]
 
+
+def _month_summary_shard(db_uri: str, month: int, start_year: int, end_year: int,
+                         data_source: str, ts_code_range: Tuple[Optional[str], Optional[str]]) -> pd.DataFrame:
+    """进程池工作函数：以只读方式打开数据库，读取一个股票代码区间的月度汇总并按股票累加"""
+    conn = sqlite3.connect(db_uri, uri=True)
+    try:
+        conn.execute("PRAGMA query_only = 1")
+        query, params = month_summary_query(month, start_year, end_year, data_source,
+                                            ts_code_range=ts_code_range)
+        summary_df = pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+    return Statistics._aggregate_month_summary(summary_df)
+
+
+def _build_month_stat(ts_code: str, month: int, total_count: int, up_count: int,
+                      down_count: int, sum_up_pct: float, sum_down_pct: float) -> Dict:
+    """由汇总值构造单只股票的月份统计结果（与逐只计算的字段和取整方式一致）"""
+    total_count = int(total_count)
+    up_count = int(up_count)
+    down_count = int(down_count)
+    
+    # 与 Series.mean() 一样使用 numpy 浮点数，取整行为保持一致
+    avg_up_pct = np.float64(sum_up_pct) / up_count if up_count > 0 else 0
+    avg_down_pct = np.float64(sum_down_pct) / down_count if down_count > 0 else 0
+    
+    up_probability = (up_count / total_count * 100) if total_count > 0 else 0
+    down_probability = (down_count / total_count * 100) if total_count > 0 else 0
+    
+    return {
+        'ts_code': ts_code,
+        'month': month,
+        'total_count': total_count,
+        'up_count': up_count,
+        'down_count': down_count,
+        'avg_up_pct': round(avg_up_pct, 2),
+        'avg_down_pct': round(avg_down_pct, 2),
+        'up_probability': round(up_probability, 2),
+        'down_probability': round(down_probability, 2)
+    }
+
+
+def _top_n_indices(values: np.ndarray, top_n: int) -> List[int]:
+    """
+    返回按值降序排列的前N个下标（值相同时保持原有先后顺序）
+    
+    使用argpartition先选出候选集合，只对候选集合做稳定排序，
+    避免对全市场结果做完整排序。
+    """
+    count = len(values)
+    if count == 0 or top_n <= 0:
+        return []
+    
+    if top_n < count:
+        # 第N大的值作为阈值，把与阈值相等的元素全部纳入候选，保证并列时顺序稳定
+        kth = np.argpartition(-values, top_n - 1)[:top_n]
+        threshold = values[kth].min()
+        candidates = np.flatnonzero(values >= threshold)
+    else:
+        candidates = np.arange(count)
+    
+    order = candidates[np.argsort(-values[candidates], kind='stable')]
+    return order[:top_n].tolist()
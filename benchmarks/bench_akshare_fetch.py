@@ -0,0 +1,88 @@
+"""
+akshare 月K线获取基准测试（使用模拟的 akshare，不访问网络）
+
+统计每只股票的请求次数和耗时，并检查超时是否按时返回。
+
+用法:
+    python benchmarks/bench_akshare_fetch.py --stocks 50 --latency 0.2
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.data_fetcher as data_fetcher
+from app.config import Config
+from app.data_fetcher import DataFetcher
+
+
+class StubAkshare:
+    """模拟 akshare.stock_zh_a_hist：按固定延迟返回合成日线数据，并统计请求次数"""
+
+    def __init__(self, latency: float, hang_symbols=()):
+        self.latency = latency
+        self.hang_symbols = set(hang_symbols)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def stock_zh_a_hist(self, symbol, period, start_date, end_date, adjust):
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency * (100 if symbol in self.hang_symbols else 1))
+        dates = pd.bdate_range(pd.to_datetime(start_date), pd.to_datetime(end_date))
+        rng = np.random.default_rng(int(symbol))
+        close = np.round(10 * np.cumprod(1 + rng.normal(0, 0.02, len(dates))), 2)
+        return pd.DataFrame({
+            '日期': dates.strftime('%Y-%m-%d'),
+            '开盘': close, '收盘': close, '最高': close * 1.01, '最低': close * 0.99,
+            '成交量': 1000.0, '成交额': close * 1000,
+        })
+
+
+def make_fetcher(stub: StubAkshare, timeout: float) -> DataFetcher:
+    data_fetcher.ak = stub
+    data_fetcher.AKSHARE_AVAILABLE = True
+    config = Config(os.path.join(tempfile.gettempdir(), 'bench_akshare_missing_config.json'))
+    config.config['data_source'] = 'akshare'
+    config.config['akshare'] = {'timeout': timeout}
+    config.config['fetch_cache'] = {'enabled': False}
+    return DataFetcher(config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="akshare 月K线获取基准测试")
+    parser.add_argument('--stocks', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.2, help="模拟每次请求的网络延迟（秒）")
+    parser.add_argument('--start', default='20150101')
+    parser.add_argument('--end', default='20241231')
+    args = parser.parse_args()
+
+    stub = StubAkshare(args.latency)
+    fetcher = make_fetcher(stub, timeout=30)
+    codes = [f"{i:06d}.SZ" for i in range(1, args.stocks + 1)]
+
+    started = time.perf_counter()
+    rows = sum(len(fetcher.get_monthly_kline(code, args.start, args.end)) for code in codes)
+    elapsed = time.perf_counter() - started
+    print(f"{args.stocks} 只股票，{rows} 条月K线")
+    print(f"请求次数: {stub.requests}（{stub.requests / args.stocks:.2f} 次/只）")
+    print(f"耗时: {elapsed:.2f}s（{elapsed / args.stocks * 1000:.0f} ms/只，其中模拟网络延迟 {args.latency * 1000:.0f} ms/次）")
+
+    # 超时检查：请求卡住时应在 timeout 秒后返回，而不是等请求结束
+    hang_stub = StubAkshare(args.latency, hang_symbols={'000001'})
+    fetcher = make_fetcher(hang_stub, timeout=args.latency * 5)
+    started = time.perf_counter()
+    result = fetcher.get_monthly_kline('000001.SZ', args.start, args.end)
+    elapsed = time.perf_counter() - started
+    print(f"超时检查: 设置 {args.latency * 5:.1f}s，实际 {elapsed:.1f}s 返回（返回 {len(result)} 条）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+BaoStock 月K线获取基准测试（使用模拟的 baostock，不访问网络）：每只股票登录一次 vs 复用登录会话
+
+用法:
+    python benchmarks/bench_baostock_session.py --stocks 200 --login-latency 0.1 --query-latency 0.02
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.data_fetcher as data_fetcher
+from app.config import Config
+from app.data_fetcher import BaoStockSession, DataFetcher
+
+
+class StubResult:
+    def __init__(self, error_code='0', error_msg='success', data=None):
+        self.error_code = error_code
+        self.error_msg = error_msg
+        self._data = data
+
+    def get_data(self):
+        return self._data
+
+
+class StubBaoStock:
+    """模拟 baostock：登录有握手延迟，会话每 expire_every 次查询后失效（返回用户未登录）"""
+
+    def __init__(self, login_latency: float, query_latency: float, expire_every: int = 0):
+        self.login_latency = login_latency
+        self.query_latency = query_latency
+        self.expire_every = expire_every
+        self.logins = 0
+        self.queries = 0
+        self.logged_in = False
+        self._session_queries = 0
+
+    def login(self):
+        time.sleep(self.login_latency)
+        self.logins += 1
+        self.logged_in = True
+        self._session_queries = 0
+        return StubResult()
+
+    def logout(self):
+        self.logged_in = False
+        return StubResult()
+
+    def query_history_k_data_plus(self, code, fields, start_date, end_date, frequency, adjustflag):
+        time.sleep(self.query_latency)
+        self.queries += 1
+        if self.expire_every and self._session_queries >= self.expire_every:
+            self.logged_in = False
+        if not self.logged_in:
+            return StubResult('10001001', '用户未登录')
+        self._session_queries += 1
+        dates = pd.date_range(start_date, end_date, freq='M')
+        rng = np.random.default_rng(int(code[3:]))
+        close = np.round(10 * np.cumprod(1 + rng.normal(0, 0.08, len(dates))), 2)
+        return StubResult(data=pd.DataFrame({
+            'date': dates.strftime('%Y-%m-%d'), 'open': close.astype(str), 'high': close.astype(str),
+            'low': close.astype(str), 'close': close.astype(str), 'volume': '1000', 'amount': '10000',
+        }))
+
+
+def legacy_fetch(stub: StubBaoStock, fetcher: DataFetcher, ts_code: str, start_date: str, end_date: str):
+    """原实现：每只股票先登录一次再查询"""
+    lg = stub.login()
+    if lg.error_code != '0':
+        return pd.DataFrame()
+    return fetcher._get_monthly_kline_baostock(ts_code, start_date, end_date)
+
+
+def make_fetcher(stub: StubBaoStock) -> DataFetcher:
+    data_fetcher.bs = stub
+    data_fetcher.baostock_session = BaoStockSession()
+    config = Config(os.path.join(tempfile.gettempdir(), 'bench_baostock_missing_config.json'))
+    config.config['data_source'] = 'baostock'
+    config.config['fetch_cache'] = {'enabled': False}
+    return DataFetcher(config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BaoStock 会话复用基准测试")
+    parser.add_argument('--stocks', type=int, default=200)
+    parser.add_argument('--login-latency', type=float, default=0.1, help="模拟登录握手耗时（秒）")
+    parser.add_argument('--query-latency', type=float, default=0.02, help="模拟每次查询耗时（秒）")
+    parser.add_argument('--expire-every', type=int, default=50, help="会话每N次查询后失效（0表示不失效）")
+    parser.add_argument('--start', default='20000101')
+    parser.add_argument('--end', default='20241231')
+    args = parser.parse_args()
+    codes = [f"{i:06d}.SZ" for i in range(1, args.stocks + 1)]
+
+    results = {}
+    for label in ('每只股票登录一次（原实现）', '复用登录会话'):
+        stub = StubBaoStock(args.login_latency, args.query_latency, args.expire_every)
+        fetcher = make_fetcher(stub)
+        started = time.perf_counter()
+        if label.startswith('每只'):
+            frames = [legacy_fetch(stub, fetcher, code, args.start, args.end) for code in codes]
+        else:
+            frames = [fetcher.get_monthly_kline(code, args.start, args.end) for code in codes]
+        fetcher.close()
+        elapsed = time.perf_counter() - started
+        empty = sum(1 for df in frames if df.empty)
+        results[label] = (elapsed, frames)
+        print(f"{label}: {elapsed:.2f}s（{elapsed / args.stocks * 1000:.1f} ms/只），"
+              f"登录 {stub.logins} 次，查询 {stub.queries} 次，空结果 {empty} 只")
+
+    (legacy_seconds, legacy_frames), (session_seconds, session_frames) = results.values()
+    for expected, actual in zip(legacy_frames, session_frames):
+        pd.testing.assert_frame_equal(expected, actual)
+    print(f"结果一致；加速比 {legacy_seconds / session_seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
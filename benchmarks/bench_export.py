@@ -0,0 +1,66 @@
+"""
+导出基准测试：全市场月K线导出为 xlsx 时，原先的 DataFrame + BytesIO 方式 vs 流式导出（xlsx / CSV）
+的总耗时、第一块数据的生成时间和 Python 内存峰值
+
+用法:
+    python benchmarks/bench_export.py --stocks 500 --years 10
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from app.exporter import iter_csv, iter_xlsx
+from benchmarks.synthetic_db import build_synthetic_database
+
+COLUMNS = ['TS代码', '股票代码', '股票名称', '交易日期', '年份', '月份', '开盘价', '收盘价',
+           '最高价', '最低价', '成交量', '成交额', '涨跌幅(%)', '数据源']
+
+
+def legacy_xlsx(db):
+    """原先的导出方式：整表读成 DataFrame，写入 BytesIO 后再复制一份"""
+    df = pd.DataFrame(list(db.iter_monthly_kline_rows('akshare')), columns=COLUMNS)
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='月K线', index=False)
+    output.seek(0)
+    yield io.BytesIO(output.read()).getvalue()
+
+
+def measure(name, chunks):
+    tracemalloc.start()
+    started = time.perf_counter()
+    first = None
+    size = 0
+    for chunk in chunks:
+        if first is None:
+            first = time.perf_counter() - started
+        size += len(chunk)
+    total = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{name}: {size / 1e6:.1f} MB，第一块 {first:.2f}s，总耗时 {total:.2f}s，内存峰值 {peak / 1e6:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出基准测试")
+    parser.add_argument('--db', default='bench_stock_data.db', help="合成数据库路径（不存在则自动生成）")
+    parser.add_argument('--stocks', type=int, default=500)
+    parser.add_argument('--years', type=int, default=10)
+    args = parser.parse_args()
+
+    db = build_synthetic_database(args.db, stock_count=args.stocks, years=args.years)
+    print(f"{args.stocks} 只股票 × {args.years} 年全部月K线（内存峰值由 tracemalloc 统计，耗时会偏高）")
+    measure("DataFrame + BytesIO（xlsx）", legacy_xlsx(db))
+    measure("流式 xlsx", iter_xlsx(COLUMNS, db.iter_monthly_kline_rows('akshare'), '月K线'))
+    measure("流式 CSV", iter_csv(COLUMNS, db.iter_monthly_kline_rows('akshare')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+耗时接口执行方式基准测试：月份筛选统计在事件循环中直接执行 vs 在有界执行器中执行时，轻量接口（当前用户）的响应时间
+
+不需要 uvicorn，直接以 ASGI 方式调用应用。
+
+用法:
+    python benchmarks/bench_heavy_routes.py --stocks 2000 --years 20 --heavy 16 --light 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_db import build_synthetic_database
+
+
+async def asgi_request(app, method: str, path: str, session_id: str, body=None) -> int:
+    """以 ASGI 方式发送一个请求，返回状态码"""
+    payload = json.dumps(body).encode('utf-8') if body is not None else b''
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'bench'), (b'cookie', f"session_id={session_id}".encode()),
+                    (b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())],
+        'client': ('127.0.0.1', 0), 'server': ('bench', 80),
+    }
+    received = False
+    status = 0
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+        await asyncio.sleep(3600)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+def percentile(samples, q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * q), len(samples) - 1)] * 1000
+
+
+async def run_round(api, session_id: str, heavy: int, light: int, light_interval: float, args):
+    """并发发出 heavy 个月份筛选请求，同时按固定间隔发出 light 个当前用户请求"""
+    body = {'month': 1, 'start_year': args.start_year, 'end_year': args.start_year + args.years - 1,
+            'top_n': 20, 'data_source': 'akshare'}
+    heavy_statuses = []
+
+    async def heavy_request(month: int):
+        heavy_statuses.append(await asgi_request(api.app, 'POST', '/api/month/filter', session_id,
+                                                 dict(body, month=month)))
+
+    started = time.perf_counter()
+    heavy_tasks = [asyncio.ensure_future(heavy_request(i % 12 + 1)) for i in range(heavy)]
+    light_times = []
+    for _ in range(light):
+        sent = time.perf_counter()
+        await asgi_request(api.app, 'GET', '/api/auth/current-user', session_id)
+        light_times.append(time.perf_counter() - sent)
+        await asyncio.sleep(light_interval)
+    await asyncio.gather(*heavy_tasks)
+    elapsed = time.perf_counter() - started
+    return light_times, heavy_statuses, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="耗时接口执行方式基准测试")
+    parser.add_argument('--stocks', type=int, default=2000)
+    parser.add_argument('--years', type=int, default=20)
+    parser.add_argument('--start-year', type=int, default=2000)
+    parser.add_argument('--heavy', type=int, default=16, help="并发的月份筛选请求数")
+    parser.add_argument('--light', type=int, default=200, help="期间发出的轻量请求数")
+    parser.add_argument('--light-interval', type=float, default=0.01, help="轻量请求间隔（秒）")
+    parser.add_argument('--max-concurrency', type=int, default=4)
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'bench_heavy_routes.db'))
+    args = parser.parse_args()
+
+    build_synthetic_database(args.db, stock_count=args.stocks, start_year=args.start_year, years=args.years)
+    config_path = os.path.join(tempfile.gettempdir(), 'bench_heavy_routes_config.json')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump({'data_source': 'tushare', 'fetch_cache': {'enabled': False},
+                   'executor': {'max_concurrency': args.max_concurrency, 'max_queue': args.heavy}}, f)
+    os.environ['DB_PATH'] = args.db
+    os.environ['CONFIG_PATH'] = config_path
+
+    import app.api as api
+    session_id = api.auth.login('admin', 'admin123')['session_id']
+    executor_run = api.heavy_tasks.run
+
+    async def run_inline(name, func, *func_args, **func_kwargs):
+        """原实现：同步计算直接在事件循环中执行"""
+        return func(*func_args, **func_kwargs)
+
+    print(f"{args.stocks} 只股票 × {args.years} 年，{args.heavy} 个月份筛选请求并发，期间 {args.light} 个轻量请求")
+    for label, run in (('事件循环中直接执行（原实现）', run_inline), (f"有界执行器（并发 {args.max_concurrency}）", executor_run)):
+        api.heavy_tasks.run = run
+        light_times, statuses, elapsed = asyncio.run(
+            run_round(api, session_id, args.heavy, args.light, args.light_interval, args))
+        print(f"{label}: 总耗时 {elapsed:.2f}s，耗时请求状态 {sorted(set(statuses))}；"
+              f"轻量接口 p50 {percentile(light_times, 0.5):.1f} ms，p95 {percentile(light_times, 0.95):.1f} ms，"
+              f"最大 {max(light_times) * 1000:.1f} ms")
+
+    status = api.heavy_tasks.status()
+    print(f"执行器：完成 {status['completed']}，拒绝 {status['rejected']}，"
+          f"排队耗时 {status['wait_time'].get('month_filter')}")
+
+
+if __name__ == '__main__':
+    main()
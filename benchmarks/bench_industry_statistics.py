@@ -0,0 +1,88 @@
+"""
+行业统计基准测试：逐行业×逐股票循环 vs 单次合并汇总
+
+用法:
+    python benchmarks/bench_industry_statistics.py --stocks 5000 --years 25
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.statistics import Statistics
+from benchmarks.synthetic_db import build_synthetic_database
+
+
+def legacy_industry_statistics(statistics: Statistics, month: int, start_year: int, end_year: int,
+                               industry_type: str, data_source: str):
+    """原实现：每个行业查询一次成分股，每只成分股查询一次统计"""
+    db = statistics.db
+    results = []
+    for industry_name in db.get_all_industries(industry_type):
+        stock_codes = db.get_industry_stocks(industry_name, industry_type)
+        if not stock_codes:
+            continue
+
+        total_up_count = total_down_count = total_count = 0
+        total_up_pct_sum = total_down_pct_sum = 0
+        for ts_code in stock_codes:
+            stat = statistics.calculate_stock_month_statistics(ts_code, month, start_year, end_year,
+                                                               data_source=data_source)
+            if stat['total_count'] > 0:
+                total_count += stat['total_count']
+                total_up_count += stat['up_count']
+                total_down_count += stat['down_count']
+                total_up_pct_sum += stat['avg_up_pct'] * stat['up_count']
+                total_down_pct_sum += stat['avg_down_pct'] * stat['down_count']
+
+        if total_count > 0:
+            avg_up_pct = total_up_pct_sum / total_up_count if total_up_count > 0 else 0
+            avg_down_pct = total_down_pct_sum / total_down_count if total_down_count > 0 else 0
+            results.append({
+                'industry_name': industry_name,
+                'stock_count': len(stock_codes),
+                'total_count': total_count,
+                'up_count': total_up_count,
+                'down_count': total_down_count,
+                'avg_up_pct': round(avg_up_pct, 2),
+                'avg_down_pct': round(avg_down_pct, 2),
+                'up_probability': round(total_up_count / total_count * 100, 2),
+                'down_probability': round(total_down_count / total_count * 100, 2)
+            })
+    results.sort(key=lambda x: x['up_probability'], reverse=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="行业统计基准测试")
+    parser.add_argument('--db', default='bench_stock_data.db', help="合成数据库路径（不存在则自动生成）")
+    parser.add_argument('--stocks', type=int, default=5000)
+    parser.add_argument('--years', type=int, default=25)
+    parser.add_argument('--month', type=int, default=1)
+    parser.add_argument('--industry-type', default='sw')
+    parser.add_argument('--skip-legacy', action='store_true', help="跳过原实现（数据量大时较慢）")
+    args = parser.parse_args()
+
+    db = build_synthetic_database(args.db, stock_count=args.stocks, years=args.years)
+    statistics = Statistics(db)
+    start_year, end_year = 2000, 2000 + args.years - 1
+
+    started = time.perf_counter()
+    results = statistics.calculate_industry_statistics(args.month, start_year, end_year,
+                                                       args.industry_type, data_source='akshare')
+    batched_seconds = time.perf_counter() - started
+    print(f"单次合并汇总: {batched_seconds:.3f}s（{len(results)} 个行业）")
+
+    if not args.skip_legacy:
+        started = time.perf_counter()
+        legacy = legacy_industry_statistics(statistics, args.month, start_year, end_year,
+                                            args.industry_type, 'akshare')
+        legacy_seconds = time.perf_counter() - started
+        print(f"逐行业逐股票循环: {legacy_seconds:.3f}s（{len(legacy)} 个行业）")
+        print(f"加速比: {legacy_seconds / batched_seconds:.1f}x，结果一致: {legacy == results}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+月K线内存列存储基准测试：统计查询读取 SQLite 汇总表 vs 在内存列数据上计算
+
+用法:
+    python benchmarks/bench_kline_store.py --stocks 5000 --years 25
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.statistics import Statistics
+from benchmarks.bench_statistics_process_pool import run_queries
+from benchmarks.synthetic_db import build_synthetic_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="月K线内存列存储基准测试")
+    parser.add_argument('--db', default='bench_stock_data.db', help="合成数据库路径（不存在则自动生成）")
+    parser.add_argument('--stocks', type=int, default=5000)
+    parser.add_argument('--years', type=int, default=25)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    db = build_synthetic_database(args.db, stock_count=args.stocks, years=args.years)
+    start_year, end_year = 2000, 2000 + args.years - 1
+    print(f"{args.stocks} 只股票 × {args.years} 年，每轮 12 个月的月份筛选 + 行业统计")
+
+    sqlite_seconds, expected = run_queries(Statistics(db), start_year, end_year, args.rounds)
+    print(f"读取汇总表: {sqlite_seconds:.3f}s/轮")
+
+    statistics = Statistics(db, options={'kline_store': True})
+    started = time.perf_counter()
+    statistics.kline_store.partition('akshare')
+    load_seconds = time.perf_counter() - started
+    status = statistics.kline_store.status()['partitions']['akshare']
+    print(f"载入列存储: {load_seconds:.2f}s，{status['rows']:,} 行 / {status['stocks']} 只股票，"
+          f"占用内存 {status['memory_mb']} MB")
+
+    store_seconds, results = run_queries(statistics, start_year, end_year, args.rounds)
+    print(f"内存列存储: {store_seconds:.3f}s/轮，加速比 {sqlite_seconds / store_seconds:.2f}x，"
+          f"结果一致: {results == expected}")
+
+    # 写入一只股票后下一次查询只重新读取该股票
+    kline = db.get_monthly_kline(statistics.kline_store.partition('akshare').codes[0], data_source='akshare')
+    db.save_monthly_kline(kline.drop(columns=['id', 'data_source']), data_source='akshare')
+    started = time.perf_counter()
+    statistics.kline_store.partition('akshare')
+    print(f"写入 1 只股票后增量刷新: {time.perf_counter() - started:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
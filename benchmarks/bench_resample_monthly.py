@@ -0,0 +1,118 @@
+"""
+日线聚合月线基准测试：groupby + iterrows 逐月计算涨跌幅 vs pandas groupby.agg vs NumPy reduceat 向量化聚合
+
+用法:
+    python benchmarks/bench_resample_monthly.py --series 5000 --years 5
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.data_fetcher import resample_daily_to_monthly
+
+
+def legacy_resample(daily: pd.DataFrame, ts_code: str, prev_close=None) -> pd.DataFrame:
+    """原实现：groupby first/last 聚合，iterrows 逐月计算涨跌幅"""
+    df = daily.copy()
+    df['year'] = df['trade_date'].dt.year
+    df['month'] = df['trade_date'].dt.month
+    df['trade_date'] = df['trade_date'].dt.strftime('%Y%m%d')
+    monthly_first = df.groupby(['year', 'month']).first().reset_index()
+    monthly_last = df.groupby(['year', 'month']).last().reset_index()
+    monthly_df = monthly_last[['year', 'month', 'trade_date']].copy()
+    monthly_df['ts_code'] = ts_code
+    monthly_df['open'] = monthly_first['open'].values
+    monthly_df['close'] = monthly_last['close'].values
+    monthly_df['high'] = df.groupby(['year', 'month'])['high'].max().values
+    monthly_df['low'] = df.groupby(['year', 'month'])['low'].min().values
+    monthly_df['vol'] = df.groupby(['year', 'month'])['vol'].sum().values
+    monthly_df['amount'] = df.groupby(['year', 'month'])['amount'].sum().values
+    monthly_df = monthly_df.sort_values('trade_date')
+    prev_month_close = prev_close
+    for idx, row in monthly_df.iterrows():
+        if prev_month_close is not None and pd.notna(prev_month_close) and prev_month_close > 0:
+            if pd.notna(row['close']):
+                monthly_df.loc[idx, 'pct_chg'] = (row['close'] - prev_month_close) / prev_month_close * 100
+        elif pd.notna(row['open']) and row['open'] > 0:
+            if pd.notna(row['close']):
+                monthly_df.loc[idx, 'pct_chg'] = (row['close'] - row['open']) / row['open'] * 100
+        prev_month_close = row['close']
+    return monthly_df
+
+
+def groupby_resample(daily: pd.DataFrame, ts_code: str, prev_close=None) -> pd.DataFrame:
+    """pandas groupby.agg 聚合 + 整列移位计算涨跌幅"""
+    df = daily.assign(year=daily['trade_date'].dt.year, month=daily['trade_date'].dt.month)
+    monthly_df = df.groupby(['year', 'month']).agg(
+        trade_date=('trade_date', 'last'), open=('open', 'first'), close=('close', 'last'),
+        high=('high', 'max'), low=('low', 'min'), vol=('vol', 'sum'), amount=('amount', 'sum')
+    ).reset_index()
+    monthly_df['trade_date'] = monthly_df['trade_date'].dt.strftime('%Y%m%d')
+    monthly_df['ts_code'] = ts_code
+    base_close = monthly_df['close'].shift(1)
+    base_close.iloc[0] = prev_close
+    monthly_df['pct_chg'] = ((monthly_df['close'] - base_close) / base_close * 100).where(base_close > 0)
+    return monthly_df
+
+
+def make_series(index: int, years: int) -> pd.DataFrame:
+    """生成一只股票的合成日线（约每三只股票一只在区间中途上市）"""
+    rng = np.random.default_rng(index)
+    start = pd.Timestamp('2015-01-01')
+    if index % 3 == 0:
+        start += pd.DateOffset(days=int(rng.integers(30, 365 * years // 2)))
+    dates = pd.bdate_range(start, pd.Timestamp('2015-01-01') + pd.DateOffset(years=years) - pd.Timedelta(days=1))
+    close = np.round(10 * np.cumprod(1 + rng.normal(0, 0.02, len(dates))), 2)
+    return pd.DataFrame({
+        'trade_date': dates,
+        'open': np.round(close * (1 + rng.normal(0, 0.005, len(dates))), 2),
+        'close': close, 'high': close * 1.01, 'low': close * 0.99,
+        'vol': rng.integers(1000, 100000, len(dates)).astype(float), 'amount': close * 1000,
+    })
+
+
+def run(label: str, resample, series, total: int):
+    started = time.perf_counter()
+    months = 0
+    for index, daily in enumerate(series):
+        months += len(resample(daily, f"{index:06d}.SZ", prev_close=None if index % 3 == 0 else 10.0))
+    elapsed = time.perf_counter() - started
+    per_series = elapsed / len(series)
+    print(f"{label}: {len(series)} 只 {elapsed:.2f}s（{per_series * 1000:.2f} ms/只，"
+          f"{total} 只预计 {per_series * total:.1f}s，共 {months:,} 个月）")
+    return per_series
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日线聚合月线基准测试")
+    parser.add_argument('--series', type=int, default=5000, help="合成日线序列数（股票数）")
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--legacy-series', type=int, default=200,
+                        help="原实现较慢，只取前 N 只计时并按比例估算全部耗时")
+    args = parser.parse_args()
+
+    series = [make_series(i, args.years) for i in range(args.series)]
+    print(f"{args.series} 只股票，共 {sum(len(df) for df in series):,} 条日线")
+
+    # 结果一致性检查（原实现的涨跌幅逐月计算，作为基准）
+    for index, daily in enumerate(series[:50]):
+        prev_close = None if index % 3 == 0 else 10.0
+        expected = legacy_resample(daily, 'X', prev_close).reset_index(drop=True)
+        actual = resample_daily_to_monthly(daily, 'X', prev_close, open_as_base=True)
+        pd.testing.assert_frame_equal(expected[actual.columns], actual, check_dtype=False)
+    print("结果一致性检查通过")
+
+    legacy = run("groupby + iterrows（原实现）", legacy_resample, series[:args.legacy_series], args.series)
+    grouped = run("groupby.agg + shift", groupby_resample, series, args.series)
+    vectorized = run("NumPy reduceat", resample_daily_to_monthly, series, args.series)
+    print(f"加速比: 相对原实现 {legacy / vectorized:.1f}x，相对 groupby.agg {grouped / vectorized:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
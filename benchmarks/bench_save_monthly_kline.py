@@ -0,0 +1,112 @@
+"""
+月K线写入基准测试：逐行 INSERT OR REPLACE vs 按列 executemany 批量 upsert
+
+用法:
+    python benchmarks/bench_save_monthly_kline.py --stocks 500 --years 25 --batch 50
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import Database, MONTHLY_SUMMARY_REFRESH_SQL
+
+
+def legacy_save_monthly_kline(db: Database, kline_df: pd.DataFrame, data_source: str):
+    """原实现：iterrows 逐行 INSERT OR REPLACE，每只股票提交一次"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    for idx, row in kline_df.iterrows():
+        cursor.execute("""
+            INSERT OR REPLACE INTO monthly_kline
+            (ts_code, trade_date, year, month, open, close, high, low, vol, amount, pct_chg, data_source)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            row.get('ts_code'), row.get('trade_date'), row.get('year'), row.get('month'),
+            row.get('open'), row.get('close'), row.get('high'), row.get('low'),
+            row.get('vol'), row.get('amount'), row.get('pct_chg'), data_source
+        ))
+    keys = kline_df[['ts_code', 'year', 'month']].drop_duplicates()
+    cursor.executemany(
+        MONTHLY_SUMMARY_REFRESH_SQL.format(conditions="AND ts_code = ? AND data_source = ? AND year = ? AND month = ?"),
+        [(ts_code, data_source, int(year), int(month)) for ts_code, year, month in keys.itertuples(index=False)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def make_frames(stock_count: int, years: int, seed: int = 0):
+    """生成每只股票一个的月K线 DataFrame（与数据获取器返回的格式一致）"""
+    rng = np.random.default_rng(seed)
+    year_values = np.repeat(np.arange(2000, 2000 + years), 12)
+    month_values = np.tile(np.arange(1, 13), years)
+    trade_dates = [f"{y}{m:02d}28" for y, m in zip(year_values, month_values)]
+    frames = []
+    for i in range(stock_count):
+        pct_chg = np.round(rng.normal(0.5, 9.0, len(trade_dates)), 4)
+        close = np.round(10 * np.cumprod(1 + pct_chg / 100), 4)
+        frames.append(pd.DataFrame({
+            'ts_code': f"{i:06d}.SZ",
+            'trade_date': trade_dates,
+            'year': year_values,
+            'month': month_values,
+            'open': close, 'close': close, 'high': close, 'low': close,
+            'vol': 1.0, 'amount': 1.0,
+            'pct_chg': pct_chg,
+        }))
+    return frames
+
+
+def run(label: str, frames, write, db_path: str):
+    db = Database(db_path)
+    rows = sum(len(df) for df in frames)
+    started = time.perf_counter()
+    write(db, frames)
+    first = time.perf_counter() - started
+    # 第二轮写入相同数据：全部命中唯一约束（模拟覆盖模式重新下载）
+    started = time.perf_counter()
+    write(db, frames)
+    second = time.perf_counter() - started
+    db.close()
+    print(f"{label}: 新增 {rows / first:,.0f} 行/秒（{first:.2f}s），覆盖 {rows / second:,.0f} 行/秒（{second:.2f}s）")
+    return first + second
+
+
+def main():
+    parser = argparse.ArgumentParser(description="月K线写入基准测试")
+    parser.add_argument('--stocks', type=int, default=500)
+    parser.add_argument('--years', type=int, default=25)
+    parser.add_argument('--batch', type=int, default=50, help="批量模式下每次提交包含的股票数")
+    args = parser.parse_args()
+
+    frames = make_frames(args.stocks, args.years)
+    print(f"{args.stocks} 只股票 × {args.years * 12} 条月K线 = {sum(len(df) for df in frames):,} 行")
+
+    def legacy(db, frames):
+        for df in frames:
+            legacy_save_monthly_kline(db, df, 'akshare')
+
+    def per_stock(db, frames):
+        for df in frames:
+            db.save_monthly_kline(df, data_source='akshare')
+
+    def batched(db, frames):
+        for i in range(0, len(frames), args.batch):
+            db.save_monthly_kline_batch(frames[i:i + args.batch], data_source='akshare')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_seconds = run("逐行 INSERT OR REPLACE", frames, legacy, os.path.join(tmp, 'legacy.db'))
+        per_stock_seconds = run("executemany upsert（每只股票提交）", frames, per_stock, os.path.join(tmp, 'per_stock.db'))
+        batched_seconds = run(f"executemany upsert（每 {args.batch} 只股票提交）", frames, batched,
+                              os.path.join(tmp, 'batched.db'))
+    print(f"加速比: 每只股票提交 {legacy_seconds / per_stock_seconds:.1f}x，批量提交 {legacy_seconds / batched_seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+统计进程池基准测试：全市场月份筛选和行业统计在单进程 vs 1/2/4/8 个工作进程分片计算时的耗时
+
+用法:
+    python benchmarks/bench_statistics_process_pool.py --stocks 5000 --years 25 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.statistics import Statistics
+from benchmarks.synthetic_db import build_synthetic_database
+
+
+def run_queries(statistics: Statistics, start_year: int, end_year: int, rounds: int):
+    """依次计算 1-12 月的月份筛选（全部股票）和行业统计，返回每轮平均耗时和最后一轮结果"""
+    results = None
+    started = time.perf_counter()
+    for _ in range(rounds):
+        results = [
+            (statistics.calculate_month_filter_statistics(month, start_year, end_year, top_n=100000,
+                                                          data_source='akshare'),
+             statistics.calculate_industry_statistics(month, start_year, end_year, 'sw', data_source='akshare'))
+            for month in range(1, 13)
+        ]
+    return (time.perf_counter() - started) / rounds, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计进程池基准测试")
+    parser.add_argument('--db', default='bench_stock_data.db', help="合成数据库路径（不存在则自动生成）")
+    parser.add_argument('--stocks', type=int, default=5000)
+    parser.add_argument('--years', type=int, default=25)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    db = build_synthetic_database(args.db, stock_count=args.stocks, years=args.years)
+    start_year, end_year = 2000, 2000 + args.years - 1
+    print(f"{args.stocks} 只股票 × {args.years} 年，每轮 12 个月的月份筛选 + 行业统计，CPU {os.cpu_count()} 核")
+
+    baseline_seconds, expected = run_queries(Statistics(db), start_year, end_year, args.rounds)
+    print(f"单进程: {baseline_seconds:.3f}s/轮")
+
+    for workers in args.workers:
+        statistics = Statistics(db, options={'mode': 'process', 'workers': workers})
+        # 第一次调用启动进程池，不计入耗时
+        statistics.calculate_month_filter_statistics(1, start_year, end_year, data_source='akshare')
+        seconds, results = run_queries(statistics, start_year, end_year, args.rounds)
+        statistics.close()
+        mode = '进程池' if statistics.use_process_pool else '单进程（workers=1 不启用进程池）'
+        print(f"{workers} 个工作进程（{mode}）: {seconds:.3f}s/轮，"
+              f"加速比 {baseline_seconds / seconds:.2f}x，结果一致: {results == expected}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+基准测试用的合成数据库（股票列表、行业分类、月K线）
+"""
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import Database
+
+
+def build_synthetic_database(db_path: str, stock_count: int = 5000, start_year: int = 2000,
+                             years: int = 25, industry_count: int = 100,
+                             data_source: str = 'akshare', seed: int = 0) -> Database:
+    """
+    生成合成数据库（已存在则直接复用）
+
+    Args:
+        db_path: 数据库文件路径
+        stock_count: 股票数量
+        start_year: 起始年份
+        years: 年数（每只股票每年12条月K线）
+        industry_count: 行业数量
+        data_source: 月K线的数据源标记
+        seed: 随机种子
+    """
+    if os.path.exists(db_path):
+        return Database(db_path)
+
+    started = time.time()
+    db = Database(db_path)
+    rng = np.random.default_rng(seed)
+
+    ts_codes = [f"{i:06d}.SZ" if i % 2 == 0 else f"{600000 + i:06d}.SH" for i in range(stock_count)]
+    industries = [f"行业{i % industry_count:03d}" for i in range(stock_count)]
+    db.save_stocks(pd.DataFrame({
+        'ts_code': ts_codes,
+        'symbol': [code[:6] for code in ts_codes],
+        'name': [f"股票{i}" for i in range(stock_count)],
+        'area': '',
+        'industry': industries,
+        'list_date': '',
+        'delist_date': '',
+        'is_hs': '',
+        'exchange': [code[-2:] for code in ts_codes],
+    }))
+
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT OR REPLACE INTO industry_sw VALUES (?, ?, 'L1', '')", zip(ts_codes, industries))
+    conn.executemany("INSERT OR REPLACE INTO industry_citics VALUES (?, ?, 'L1', '')",
+                     zip(ts_codes, [f"行业{i % (industry_count // 2 or 1):03d}" for i in range(stock_count)]))
+
+    months = years * 12
+    year_values = np.repeat(np.arange(start_year, start_year + years), 12)
+    month_values = np.tile(np.arange(1, 13), years)
+    trade_dates = [f"{y}{m:02d}28" for y, m in zip(year_values, month_values)]
+    for ts_code in ts_codes:
+        pct_chg = np.round(rng.normal(0.5, 9.0, months), 4)
+        close = np.round(10 * np.cumprod(1 + pct_chg / 100), 4)
+        conn.executemany("""
+            INSERT INTO monthly_kline
+            (ts_code, trade_date, year, month, open, close, high, low, vol, amount, pct_chg, data_source)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (ts_code, trade_dates[i], int(year_values[i]), int(month_values[i]), float(close[i]), float(close[i]),
+             float(close[i]), float(close[i]), 1.0, 1.0, float(pct_chg[i]), data_source)
+            for i in range(months)
+        ])
+    conn.commit()
+    conn.close()
+
+    db.rebuild_monthly_kline_summary()
+    print(f"合成数据库已生成: {db_path}（{stock_count} 只股票 × {years} 年，用时 {time.time() - started:.1f}s）")
+    return db
@@ -1,14 +1,17 @@
 """
 生产环境启动脚本（不使用自动重载）
 """
+import os
+
 import uvicorn
 
 if __name__ == "__main__":
+    # 多进程部署需要启用月K线快照（statistics.kline_snapshot），见 DEPLOYMENT.md
     uvicorn.run(
         "app.api:app",
         host="0.0.0.0",
         port=8588,
         reload=False,
-        workers=1
+        workers=int(os.getenv("WORKERS", "1"))
     )
 
@@ -1,5 +1,6 @@
 ﻿// 全局变量
 let updateProgressInterval = null;
+let updateProgressSource = null;
 let currentUser = null;
 
 // 页面加载时初始化
@@ -60,6 +61,18 @@ async function loadDataStatus() {
                 html += '</tbody></table></div>';
             }
             
+            // 未完成的更新任务（服务重启或更新出错后可继续）
+            const resumeBtn = document.getElementById('resume-update-btn');
+            const job = data.resumable_job;
+            if (job) {
+                const jobText = job.job_type === 'full' ? '全量更新' : '增量更新';
+                html += `<div class="alert alert-warning mt-3 mb-0">上次${jobText}任务 #${job.id}（${job.data_source}）未完成：
+                    已完成 ${job.done_count}/${job.total_count}，失败 ${job.failed_count}，剩余 ${job.pending_count}</div>`;
+            }
+            if (resumeBtn) {
+                resumeBtn.style.display = job ? 'inline-block' : 'none';
+            }
+            
             document.getElementById('data-status').innerHTML = html;
         } else {
             // 如果没有权限，显示提示
@@ -107,18 +120,9 @@ async function updateData(type) {
         const result = await response.json();
         
         if (result.success) {
-            // 显示进度条
+            // 显示进度条，开始接收进度推送
             document.getElementById('update-progress-container').style.display = 'block';
-            // 开始轮询进度
-            if (updateProgressInterval) {
-                clearInterval(updateProgressInterval);
-            }
-            updateProgressInterval = setInterval(checkUpdateProgress, 1000);
-            
-            // 如果更新已在进行中，立即检查一次进度
-            if (result.already_running) {
-                checkUpdateProgress();
-            }
+            watchUpdateProgress();
         } else {
             alert(result.message || '更新失败');
         }
@@ -128,7 +132,71 @@ async function updateData(type) {
     }
 }
 
-// 检查更新进度
+// 显示更新进度
+function renderUpdateProgress(data) {
+    const progress = (data.current / data.total) * 100;
+    document.getElementById('update-progress-bar').style.width = progress + '%';
+    document.getElementById('update-progress-bar').setAttribute('aria-valuenow', progress);
+    document.getElementById('update-progress-message').textContent = data.message;
+    document.getElementById('update-progress-telemetry').textContent = formatTelemetry(data.telemetry);
+}
+
+// 抓取阶段的结构化进度（已完成、失败、吞吐量、预计剩余时间）
+function formatTelemetry(telemetry) {
+    if (!telemetry) {
+        return '';
+    }
+    let text = `已完成 ${telemetry.done}/${telemetry.total} 只，失败 ${telemetry.failed} 只，` +
+        `${telemetry.stocks_per_second} 只/秒，${telemetry.rows_per_second} 行/秒`;
+    if (telemetry.eta_seconds !== null && telemetry.eta_seconds !== undefined) {
+        const minutes = Math.floor(telemetry.eta_seconds / 60);
+        const seconds = telemetry.eta_seconds % 60;
+        text += `，预计剩余 ${minutes}分${seconds}秒`;
+    }
+    return text;
+}
+
+// 更新结束：隐藏进度条并刷新数据状态
+function finishUpdateProgress() {
+    stopWatchingUpdateProgress();
+    setTimeout(() => {
+        document.getElementById('update-progress-container').style.display = 'none';
+        loadDataStatus();
+    }, 2000);
+}
+
+function stopWatchingUpdateProgress() {
+    if (updateProgressSource) {
+        updateProgressSource.close();
+        updateProgressSource = null;
+    }
+    if (updateProgressInterval) {
+        clearInterval(updateProgressInterval);
+        updateProgressInterval = null;
+    }
+}
+
+// 接收进度推送（Server-Sent Events），浏览器不支持或连接失败时改为轮询
+function watchUpdateProgress() {
+    stopWatchingUpdateProgress();
+    if (!window.EventSource) {
+        updateProgressInterval = setInterval(checkUpdateProgress, 1000);
+        return;
+    }
+    updateProgressSource = new EventSource('/api/data/progress/stream');
+    updateProgressSource.addEventListener('progress', (event) => {
+        renderUpdateProgress(JSON.parse(event.data));
+    });
+    updateProgressSource.addEventListener('done', finishUpdateProgress);
+    updateProgressSource.onerror = () => {
+        if (updateProgressSource) {
+            stopWatchingUpdateProgress();
+            updateProgressInterval = setInterval(checkUpdateProgress, 1000);
+        }
+    };
+}
+
+// 检查更新进度（轮询方式）
 async function checkUpdateProgress() {
     try {
         const response = await fetch('/api/data/progress', {
@@ -137,18 +205,10 @@ async function checkUpdateProgress() {
         const result = await response.json();
         if (result.success) {
             const data = result.data;
-            const progress = (data.current / data.total) * 100;
-            document.getElementById('update-progress-bar').style.width = progress + '%';
-            document.getElementById('update-progress-bar').setAttribute('aria-valuenow', progress);
-            document.getElementById('update-progress-message').textContent = data.message;
+            renderUpdateProgress(data);
             
             if (!data.is_running) {
-                clearInterval(updateProgressInterval);
-                updateProgressInterval = null;
-                setTimeout(() => {
-                    document.getElementById('update-progress-container').style.display = 'none';
-                    loadDataStatus();
-                }, 2000);
+                finishUpdateProgress();
             }
         }
     } catch (error) {
@@ -163,19 +223,11 @@ async function checkAndShowProgress() {
         const result = await response.json();
         if (result.success) {
             const data = result.data;
-            // 如果有正在进行的更新，显示进度条并开始轮询
+            // 如果有正在进行的更新，显示进度条并接收进度推送
             if (data.is_running) {
                 document.getElementById('update-progress-container').style.display = 'block';
-                const progress = (data.current / data.total) * 100;
-                document.getElementById('update-progress-bar').style.width = progress + '%';
-                document.getElementById('update-progress-bar').setAttribute('aria-valuenow', progress);
-                document.getElementById('update-progress-message').textContent = data.message;
-                
-                // 开始轮询进度
-                if (updateProgressInterval) {
-                    clearInterval(updateProgressInterval);
-                }
-                updateProgressInterval = setInterval(checkUpdateProgress, 1000);
+                renderUpdateProgress(data);
+                watchUpdateProgress();
             }
         }
     } catch (error) {
@@ -508,6 +560,11 @@ async function exportMonthFilter() {
     }
 }
 
+// 导出全市场月K线（文件较大，由浏览器直接下载，不经过 fetch 缓存到内存）
+function exportMonthlyKline(format) {
+    window.location.href = '/api/export/monthly-kline?format=' + encodeURIComponent(format);
+}
+
 // 行业分析
 async function analyzeIndustry() {
     const industryType = document.getElementById('industry-type').value;